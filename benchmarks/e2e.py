@@ -0,0 +1,383 @@
+"""
+End-to-end load test of the MCP client and MCP server on local stand-ins
+(fake Azure OpenAI, in-memory Cosmos container, in-process Dapr actor runtime).
+
+Both apps run under uvicorn in this process on free localhost ports, and the
+client talks to the server over real streamable HTTP, exactly as in production.
+
+    python -m benchmarks.e2e                                # all scenarios
+    python -m benchmarks.e2e --scenario conversation --concurrency 50 --requests 500
+    python -m benchmarks.e2e --thresholds benchmarks/thresholds.json --json bench.json
+
+Scenarios:
+    conversation  POST /conversation/{user_id} (create + query turns)
+    rpc           POST /mcp JSON-RPC tools/list and tools/call query_backup_tasks
+    sse           fan-out of client bus notifications to /events subscribers
+
+Exit status is 1 when a --thresholds limit is exceeded (CI regression gate).
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import socket
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+import httpx
+import uvicorn
+
+from .fakes import FakeActorRuntime, FakeAzureOpenAI, InMemoryContainer
+
+
+# ───────────────── stats ─────────────────────────────────────────────────────
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * q
+    lo, hi = int(k), min(int(k) + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+class Stats:
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.latencies: List[float] = []
+        self.lags: List[float] = []
+        self.errors = 0
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+
+    def summary(self) -> Dict[str, Any]:
+        elapsed = (self.finished or time.perf_counter()) - self.started
+        lat = sorted(self.latencies)
+        total = len(lat) + self.errors
+        out: Dict[str, Any] = {
+            "requests": total,
+            "errors": self.errors,
+            "error_rate": round(self.errors / total, 4) if total else 0.0,
+            "elapsed_s": round(elapsed, 3),
+            "rps": round(len(lat) / elapsed, 2) if elapsed else 0.0,
+            "p50_ms": round(percentile(lat, 0.50) * 1000, 2),
+            "p95_ms": round(percentile(lat, 0.95) * 1000, 2),
+            "p99_ms": round(percentile(lat, 0.99) * 1000, 2),
+        }
+        if self.lags:
+            lags = sorted(self.lags)
+            out.update({
+                "deliveries": len(lags),
+                "lag_p50_ms": round(percentile(lags, 0.50) * 1000, 2),
+                "lag_p95_ms": round(percentile(lags, 0.95) * 1000, 2),
+                "lag_p99_ms": round(percentile(lags, 0.99) * 1000, 2),
+            })
+        return out
+
+
+async def _run_workers(concurrency: int, requests: int, op) -> None:
+    counter = iter(range(requests))
+
+    async def worker(w: int) -> None:
+        for i in counter:
+            await op(w, i)
+
+    await asyncio.gather(*(worker(w) for w in range(concurrency)))
+
+
+# ───────────────── local stack ───────────────────────────────────────────────
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def _serve(app, port: int) -> uvicorn.Server:
+    config = uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning",
+                            lifespan="on", timeout_graceful_shutdown=1)
+    server = uvicorn.Server(config)
+    server.install_signal_handlers = lambda: None
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        if task.done():
+            task.result()
+        await asyncio.sleep(0.01)
+    server._bench_task = task
+    return server
+
+
+async def _wait_ready(url: str, timeout: float = 10.0) -> None:
+    # lazy startup: the apps serve before their background steps finish
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=url) as http:
+        while True:
+            r = await http.get("/readyz")
+            if r.status_code == 200:
+                return
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"{url} not ready: {r.text}")
+            await asyncio.sleep(0.02)
+
+
+async def _stop(server: uvicorn.Server) -> None:
+    server.should_exit = True
+    with contextlib.suppress(Exception):
+        await asyncio.wait_for(server._bench_task, timeout=5)
+
+
+class LocalStack:
+    """Patches the fakes into both apps and serves them on localhost."""
+    def __init__(self, llm_latency: float, cosmos_latency: float,
+                 fire_reminders: bool, time_scale: float) -> None:
+        self.llm = FakeAzureOpenAI(latency=llm_latency)
+        self.container = InMemoryContainer(latency=cosmos_latency)
+        self.actors = FakeActorRuntime(fire_reminders=fire_reminders, time_scale=time_scale)
+        self.server_url = ""
+        self.client_url = ""
+        self._servers: List[uvicorn.Server] = []
+        self._workdir: Optional[tempfile.TemporaryDirectory] = None
+        self._cwd = os.getcwd()
+
+    async def __aenter__(self) -> "LocalStack":
+        # BackupActor copies test_folder/<file> into backup_test_folder/ under the cwd
+        self._workdir = tempfile.TemporaryDirectory(prefix="mcp-bench-")
+        os.makedirs(os.path.join(self._workdir.name, "test_folder"))
+        os.makedirs(os.path.join(self._workdir.name, "backup_test_folder"))
+        for name in ("testfile.txt", "testfile2.txt"):
+            with open(os.path.join(self._workdir.name, "test_folder", name), "w") as f:
+                f.write("benchmark payload\n" * 256)
+        os.chdir(self._workdir.name)
+
+        from dapr_cosmos_mcp_server import mcp_fastapi_server as srv, cosmosdb_helper, task_manager_actor
+        from dapr_mcp_client import dapr_mcp_client_fastapi as cli
+
+        async def ensure_container_exists():
+            cosmosdb_helper.container = self.container
+
+        async def warm_llm():
+            pass
+
+        async def register_actor(actor_class, **kwargs):
+            # the real DaprActor registration waits for a sidecar health check
+            self.actors.register(actor_class)
+
+        srv.ensure_container_exists = ensure_container_exists
+        srv.connect_container = ensure_container_exists
+        srv.actor.register_actor = register_actor
+        cosmosdb_helper.container = self.container
+        proxy = SimpleNamespace(create=self.actors.create_proxy)
+        srv.ActorProxy = proxy
+        task_manager_actor.ActorProxy = proxy
+
+        server_port, client_port = _free_port(), _free_port()
+        self._servers.append(await _serve(srv.app, server_port))
+        self.server_url = f"http://127.0.0.1:{server_port}"
+        await _wait_ready(self.server_url)
+
+        cli.aoai_client = self.llm
+        cli.warm_llm = warm_llm
+        cli.MCP_ENDPOINT = f"{self.server_url}/mcp"
+        self._servers.append(await _serve(cli.app, client_port))
+        self.client_url = f"http://127.0.0.1:{client_port}"
+        await _wait_ready(self.client_url)
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.actors.shutdown()
+        for server in reversed(self._servers):
+            await _stop(server)
+        os.chdir(self._cwd)
+        if self._workdir is not None:
+            self._workdir.cleanup()
+
+
+# ───────────────── scenarios ─────────────────────────────────────────────────
+
+QUERIES = [
+    "backup testfile.txt, testfile2.txt on server 1, server 2 every 30 seconds",
+    "how many backup tasks do I have",
+    "show the status of my backups",
+]
+
+
+async def scenario_conversation(stack: LocalStack, args) -> Dict[str, Any]:
+    stats = Stats("conversation")
+    limits = httpx.Limits(max_connections=args.concurrency * 2)
+    async with httpx.AsyncClient(base_url=stack.client_url, timeout=args.timeout, limits=limits) as http:
+        async def op(w: int, i: int) -> None:
+            user = f"bench-user-{i % args.users}"
+            started = time.perf_counter()
+            try:
+                r = await http.post(f"/conversation/{user}", json={"user_query": QUERIES[i % len(QUERIES)]})
+                r.raise_for_status()
+                stats.latencies.append(time.perf_counter() - started)
+            except Exception:
+                stats.errors += 1
+
+        await _run_workers(args.concurrency, args.requests, op)
+    stats.finished = time.perf_counter()
+    out = stats.summary()
+    out["llm_calls"] = stack.llm.calls
+    out["actor_calls"] = next(stack.actors.calls)
+    return out
+
+
+async def scenario_rpc(stack: LocalStack, args) -> Dict[str, Any]:
+    stats = Stats("rpc")
+    limits = httpx.Limits(max_connections=args.concurrency * 2)
+    async with httpx.AsyncClient(base_url=stack.server_url, timeout=args.timeout, limits=limits) as http:
+        async def op(w: int, i: int) -> None:
+            user = f"bench-user-{i % args.users}"
+            if i % 2:
+                body = {"jsonrpc": "2.0", "id": i, "method": "tools/list"}
+            else:
+                body = {"jsonrpc": "2.0", "id": i, "method": "tools/call", "params": {
+                    "name": "query_backup_tasks",
+                    "arguments": {"cosmosDbQuery": f"SELECT * FROM c WHERE c.user_id = '{user}'"},
+                }}
+            started = time.perf_counter()
+            try:
+                r = await http.post("/mcp", json=body, headers={"Mcp-Session-Id": user})
+                r.raise_for_status()
+                if "error" in r.json():
+                    raise RuntimeError(r.json()["error"])
+                stats.latencies.append(time.perf_counter() - started)
+            except Exception:
+                stats.errors += 1
+
+        await _run_workers(args.concurrency, args.requests, op)
+    stats.finished = time.perf_counter()
+    return stats.summary()
+
+
+async def scenario_sse(stack: LocalStack, args) -> Dict[str, Any]:
+    """
+    `--concurrency` subscribers follow one /events session while `--requests`
+    notifications are published on the client bus; lag is publish → line read.
+    """
+    from dapr_mcp_client.sse_bus import publish_message
+
+    stats = Stats("sse")
+    sid = "bench-sse"
+    expected = args.requests
+    ready = asyncio.Event()
+    connected = 0
+
+    async def subscriber(http: httpx.AsyncClient) -> None:
+        nonlocal connected
+        received = 0
+        try:
+            async with http.stream("GET", "/events", params={"sid": sid}) as r:
+                async for line in r.aiter_lines():
+                    if line.startswith("event: open"):
+                        connected += 1
+                        if connected == args.concurrency:
+                            ready.set()
+                    if not line.startswith("data: ") or "sent_at" not in line:
+                        continue
+                    sent_at = json.loads(line[6:])["params"]["sent_at"]
+                    stats.lags.append(time.perf_counter() - sent_at)
+                    received += 1
+                    if received >= expected:
+                        return
+        except Exception:
+            stats.errors += 1
+
+    limits = httpx.Limits(max_connections=args.concurrency + 4)
+    async with httpx.AsyncClient(base_url=stack.client_url, timeout=args.timeout, limits=limits) as http:
+        subs = [asyncio.create_task(subscriber(http)) for _ in range(args.concurrency)]
+        await asyncio.wait_for(ready.wait(), timeout=args.timeout)
+        stats.started = time.perf_counter()
+        for i in range(expected):
+            started = time.perf_counter()
+            await publish_message(sid, f"bench {i}", extra={"sent_at": time.perf_counter()})
+            stats.latencies.append(time.perf_counter() - started)
+            if args.sse_interval:
+                await asyncio.sleep(args.sse_interval)
+        done, pending = await asyncio.wait(subs, timeout=args.timeout)
+        for t in pending:
+            t.cancel()
+            stats.errors += 1
+    stats.finished = time.perf_counter()
+    return stats.summary()
+
+
+SCENARIOS = {
+    "rpc": scenario_rpc,
+    "conversation": scenario_conversation,
+    "sse": scenario_sse,
+}
+
+
+# ───────────────── thresholds ────────────────────────────────────────────────
+
+def check_thresholds(results: Dict[str, Dict[str, Any]], thresholds: Dict[str, Dict[str, float]]) -> List[str]:
+    """`max_*`/`*_ms` keys are upper bounds, `min_*` keys lower bounds on the matching result field."""
+    failures: List[str] = []
+    for scenario, limits in thresholds.items():
+        result = results.get(scenario)
+        if result is None:
+            continue
+        for key, limit in limits.items():
+            if key.startswith("min_"):
+                field, ok = key[4:], lambda v, l: v >= l
+            elif key.startswith("max_"):
+                field, ok = key[4:], lambda v, l: v <= l
+            else:
+                field, ok = key, lambda v, l: v <= l
+            value = result.get(field)
+            if value is not None and not ok(value, limit):
+                failures.append(f"{scenario}.{field} = {value} (limit {key} {limit})")
+    return failures
+
+
+def _print_table(results: Dict[str, Dict[str, Any]]) -> None:
+    cols = ["requests", "errors", "rps", "p50_ms", "p95_ms", "p99_ms", "lag_p50_ms", "lag_p95_ms", "lag_p99_ms"]
+    print(f"{'scenario':<14}" + "".join(f"{c:>12}" for c in cols))
+    for name, r in results.items():
+        print(f"{name:<14}" + "".join(f"{r.get(c, ''):>12}" for c in cols))
+
+
+async def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", choices=[*SCENARIOS, "all"], default="all")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--users", type=int, default=10, help="distinct user ids to spread load over")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="fake Azure OpenAI latency per call (s)")
+    parser.add_argument("--cosmos-latency", type=float, default=0.005, help="fake Cosmos latency per write (s)")
+    parser.add_argument("--fire-reminders", action="store_true", help="let actor reminders run backups")
+    parser.add_argument("--time-scale", type=float, default=0.01, help="reminder time multiplier")
+    parser.add_argument("--sse-interval", type=float, default=0.0, help="pause between SSE publishes (s)")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--thresholds", help="JSON file of per-scenario limits")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args(argv)
+
+    names = list(SCENARIOS) if args.scenario == "all" else [args.scenario]
+    results: Dict[str, Dict[str, Any]] = {}
+    async with LocalStack(args.llm_latency, args.cosmos_latency, args.fire_reminders, args.time_scale) as stack:
+        for name in names:
+            results[name] = await SCENARIOS[name](stack, args)
+
+    _print_table(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+    if args.thresholds:
+        with open(args.thresholds) as f:
+            failures = check_thresholds(results, json.load(f))
+        for failure in failures:
+            print(f"THRESHOLD EXCEEDED: {failure}", file=sys.stderr)
+        return 1 if failures else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
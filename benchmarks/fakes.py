@@ -0,0 +1,437 @@
+"""
+Local stand-ins for the Azure/Dapr services the apps talk to, so the
+benchmarks exercise our own request path without any cloud dependency.
+
+- FakeAzureOpenAI: scripted tool-calling chat completions with configurable latency
+- InMemoryContainer: the subset of the Cosmos container API the server uses
+- FakeActorRuntime: in-process Dapr actor runtime (state store, reminders, timers)
+"""
+from __future__ import annotations
+import asyncio
+import base64
+import hashlib
+import itertools
+import json
+import re
+import time
+import uuid
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type
+
+from azure.cosmos import exceptions as cosmos_exceptions
+from dapr.actor import ActorId
+from dapr.actor.runtime._method_context import ActorMethodContext
+from dapr.actor.runtime._type_information import ActorTypeInformation
+from dapr.actor.runtime.context import ActorRuntimeContext
+from dapr.clients.base import DaprActorClientBase
+from dapr.serializers import DefaultJSONSerializer
+from dapr.serializers.util import convert_from_dapr_duration
+
+
+# ───────────────── Azure OpenAI ──────────────────────────────────────────────
+
+_USER_ID_RE = re.compile(r"user id\s*:\s*(\S+)", re.IGNORECASE)
+_FILES_RE = re.compile(r"backup (?:files? )?(.+?) on (.+?) every (.+)$", re.IGNORECASE)
+
+
+def _tool_call(name: str, args: dict) -> SimpleNamespace:
+    return SimpleNamespace(
+        id=f"call_{uuid.uuid4().hex[:12]}",
+        type="function",
+        function=SimpleNamespace(name=name, arguments=json.dumps(args)),
+    )
+
+
+def _completion(content: Optional[str] = None, tool_calls: Optional[list] = None,
+                prompt_tokens: int = 0) -> SimpleNamespace:
+    message = SimpleNamespace(role="assistant", content=content, tool_calls=tool_calls)
+    usage = SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=20 if content else 40,
+                            total_tokens=prompt_tokens + (20 if content else 40))
+    return SimpleNamespace(choices=[SimpleNamespace(message=message, finish_reason="stop")], usage=usage)
+
+
+class _FakeCompletions:
+    def __init__(self, owner: "FakeAzureOpenAI") -> None:
+        self._owner = owner
+
+    async def create(self, **kwargs) -> SimpleNamespace:
+        return await self._owner.respond(kwargs.get("messages", []))
+
+
+class FakeAzureOpenAI:
+    """
+    Scripted replacement for AsyncAzureOpenAI.
+
+    "backup <files> on <servers> every <freq>" → create_backup_task, then
+    setup_backup_task_agent, then a final answer; questions ("how many",
+    "status", "list", "show") → query_backup_tasks then an answer; anything
+    else → a direct answer. Each call sleeps `latency` seconds.
+
+    Like the real service's prompt cache, usage reports the leading messages
+    already seen in an earlier request as `prompt_tokens_details.cached_tokens`.
+    """
+    def __init__(self, latency: float = 0.05) -> None:
+        self.latency = latency
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=_FakeCompletions(self))
+        self._seen_prefixes: set = set()
+
+    def _cached_tokens(self, messages: List[Dict[str, Any]]) -> int:
+        digest = hashlib.sha256()
+        cached = tokens = 0
+        hit = True
+        for m in messages:
+            digest.update(json.dumps(m, sort_keys=True, default=str).encode())
+            tokens += len(str(m.get("content") or "")) // 4 if isinstance(m, dict) else 0
+            key = digest.copy().hexdigest()
+            hit = hit and key in self._seen_prefixes
+            if hit:
+                cached = tokens
+            self._seen_prefixes.add(key)
+        return cached
+
+    @staticmethod
+    def _user_id(messages: List[Dict[str, Any]]) -> str:
+        for m in messages:
+            content = m.get("content") if isinstance(m, dict) else None
+            if isinstance(content, str):
+                found = _USER_ID_RE.search(content)
+                if found:
+                    return found.group(1)
+        return "bench-user"
+
+    async def respond(self, messages: List[Dict[str, Any]]) -> SimpleNamespace:
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        response = self._script(messages)
+        response.usage.prompt_tokens_details = SimpleNamespace(cached_tokens=self._cached_tokens(messages))
+        return response
+
+    def _script(self, messages: List[Dict[str, Any]]) -> SimpleNamespace:
+        prompt_tokens = sum(len(str(m.get("content") or "")) for m in messages if isinstance(m, dict)) // 4
+        last = messages[-1] if messages else {}
+        user_id = self._user_id(messages)
+
+        if last.get("role") == "tool":
+            # follow-up after a tool result: chain create → setup, otherwise answer
+            prev = messages[-2].get("tool_calls", [{}])[0].get("function", {}).get("name")
+            if prev == "create_backup_task":
+                return _completion(tool_calls=[_tool_call("setup_backup_task_agent", {"user_id": user_id})],
+                                   prompt_tokens=prompt_tokens)
+            return _completion(content="<p>Done.</p>", prompt_tokens=prompt_tokens)
+
+        query = str(last.get("content") or "").strip()
+        match = _FILES_RE.search(query)
+        if match:
+            files = [f.strip() for f in re.split(r",|\band\b", match.group(1)) if f.strip()]
+            servers = [s.strip() for s in re.split(r",|\band\b", match.group(2)) if s.strip()]
+            task = {
+                "user_id": user_id,
+                "id": str(uuid.uuid4()),
+                "task": "Backup files",
+                "files": files,
+                "servers": servers,
+                "backup_frequency_pth": "PT30S",
+            }
+            return _completion(tool_calls=[_tool_call("create_backup_task", {"backup_task_details": json.dumps([task])})],
+                               prompt_tokens=prompt_tokens)
+        if re.search(r"how many|status|list|show", query, re.IGNORECASE):
+            sql = f"SELECT * FROM c WHERE c.user_id = '{user_id}'"
+            return _completion(tool_calls=[_tool_call("query_backup_tasks", {"cosmosDbQuery": sql})],
+                               prompt_tokens=prompt_tokens)
+        return _completion(content="<p>Hello from the fake model.</p>", prompt_tokens=prompt_tokens)
+
+
+# ───────────────── Cosmos DB ─────────────────────────────────────────────────
+
+_WHERE_EQ_RE = re.compile(r"c\.(\w+)\s*=\s*'([^']*)'")
+
+
+class _Page:
+    def __init__(self, items: List[dict]) -> None:
+        self._items = items
+
+    def __aiter__(self):
+        return self._gen()
+
+    async def _gen(self):
+        for it in self._items:
+            yield it
+
+
+class _QueryIterable:
+    def __init__(self, items: List[dict], page_size: int, charged: Callable[[Optional[Callable], Any], None],
+                 response_hook: Optional[Callable]) -> None:
+        self._items = items
+        self._page_size = page_size
+        self._charged = charged
+        self._response_hook = response_hook
+
+    def by_page(self):
+        return self._pages()
+
+    async def _pages(self):
+        for i in range(0, max(len(self._items), 1), self._page_size):
+            page = self._items[i:i + self._page_size]
+            self._charged(self._response_hook, page)  # one request (and charge) per page
+            yield _Page(page)
+
+    def __aiter__(self):
+        return _Page(self._items).__aiter__()
+
+
+class InMemoryContainer:
+    """
+    Cosmos container stand-in. Queries support `SELECT * ... WHERE c.x = '...'
+    [AND ...]` and `SELECT VALUE COUNT(1) ...`; anything else returns all items.
+    Patches support set/incr/add/remove (nested paths too) and ignore filter predicates.
+    """
+    def __init__(self, latency: float = 0.0, page_size: int = 100, request_charge: float = 2.5) -> None:
+        self.items: Dict[Tuple[str, str], dict] = {}
+        self.latency = latency
+        self.page_size = page_size
+        self.request_charge = request_charge
+
+    def _charged(self, response_hook: Optional[Callable], result: Any) -> Any:
+        # the SDK calls `response_hook` with each response's own headers
+        if response_hook is not None:
+            response_hook({"x-ms-request-charge": str(self.request_charge)}, result)
+        return result
+
+    async def create_item(self, body: dict, **kwargs) -> dict:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        doc = dict(body)
+        doc.setdefault("id", str(uuid.uuid4()))
+        if (str(doc.get("user_id")), doc["id"]) in self.items and not kwargs.get("_upsert"):
+            raise cosmos_exceptions.CosmosResourceExistsError(status_code=409, message="Entity with the specified id already exists")
+        # system properties the service adds to every document
+        doc.update(_rid=uuid.uuid4().hex[:16], _self=f"dbs/x/colls/y/docs/{doc['id']}/", _etag=f'"{uuid.uuid4()}"',
+                   _attachments="attachments/", _ts=int(time.time()))
+        self.items[(str(doc.get("user_id")), doc["id"])] = doc
+        return self._charged(kwargs.get("response_hook"), doc)
+
+    async def upsert_item(self, body: dict, **kwargs) -> dict:
+        return await self.create_item(body, _upsert=True, **kwargs)
+
+    async def patch_item(self, item: str, partition_key: Any, patch_operations: List[dict], **kwargs) -> dict:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        doc = self.items.get((str(partition_key), item))
+        if doc is None:
+            raise cosmos_exceptions.CosmosResourceNotFoundError(status_code=404, message="Entity with the specified id does not exist")
+        for op in patch_operations:
+            *parents, key = op["path"].strip("/").split("/")
+            target = doc
+            for name in parents:
+                target = target[name]
+            if op["op"] == "incr":
+                target[key] = target.get(key, 0) + op["value"]
+            elif op["op"] == "remove":
+                target.pop(key, None)
+            else:
+                target[key] = op["value"]
+        doc["_ts"] = int(time.time())
+        return self._charged(kwargs.get("response_hook"), doc)
+
+    async def read_item(self, item: str, partition_key: Any, **kwargs) -> dict:
+        return self._charged(kwargs.get("response_hook"), self.items[(str(partition_key), item)])
+
+    async def delete_item(self, item: str, partition_key: Any, **kwargs) -> None:
+        if self.items.pop((str(partition_key), item), None) is None:
+            raise cosmos_exceptions.CosmosResourceNotFoundError(status_code=404, message="Entity with the specified id does not exist")
+        self._charged(kwargs.get("response_hook"), None)
+
+    def query_items(self, query: str, parameters: Optional[list] = None, **kwargs) -> _QueryIterable:
+        for p in parameters or []:
+            query = query.replace(p["name"], f"'{p['value']}'")
+        conditions = _WHERE_EQ_RE.findall(query)
+        rows = [doc for doc in self.items.values() if all(str(doc.get(k)) == v for k, v in conditions)]
+        if re.search(r"SELECT\s+VALUE\s+COUNT\(1\)", query, re.IGNORECASE):
+            rows = [len(rows)]
+        return _QueryIterable(rows, self.page_size, self._charged, kwargs.get("response_hook"))
+
+
+# ───────────────── Dapr actors ───────────────────────────────────────────────
+
+class _FakeActorClient(DaprActorClientBase):
+    """In-memory state store and reminder scheduler behind the real Dapr actor classes."""
+    def __init__(self, runtime: "FakeActorRuntime") -> None:
+        self._runtime = runtime
+        self.state: Dict[Tuple[str, str, str], bytes] = {}
+        self.state_writes = 0
+        self.state_reads = 0
+        self.reminders: Dict[Tuple[str, str, str], asyncio.Task] = {}
+        self.timers: Dict[Tuple[str, str, str], asyncio.Task] = {}
+
+    async def invoke_method(self, actor_type: str, actor_id: str, method: str, data: Optional[bytes] = None) -> bytes:
+        return await self._runtime.invoke(actor_type, actor_id, method, data)
+
+    async def save_state_transactionally(self, actor_type: str, actor_id: str, data: bytes) -> None:
+        self.state_writes += 1
+        for op in json.loads(data):
+            key = (actor_type, actor_id, op["request"]["key"])
+            if op["operation"] == "upsert":
+                self.state[key] = json.dumps(op["request"].get("value")).encode()
+            else:
+                self.state.pop(key, None)
+
+    async def get_state(self, actor_type: str, actor_id: str, name: str) -> bytes:
+        self.state_reads += 1
+        return self.state.get((actor_type, actor_id, name), b"")
+
+    async def register_reminder(self, actor_type: str, actor_id: str, name: str, data: bytes) -> None:
+        body = json.loads(data)
+        key = (actor_type, actor_id, name)
+        old = self.reminders.pop(key, None)
+        if old is not None:
+            old.cancel()
+        if not self._runtime.fire_reminders:
+            return
+        due = convert_from_dapr_duration(body["dueTime"])
+        period = convert_from_dapr_duration(body["period"]) if body.get("period") else None
+        state = base64.b64decode(body.get("data") or b"")
+        self.reminders[key] = asyncio.create_task(
+            self._runtime._reminder_loop(actor_type, actor_id, name, state, due, period)
+        )
+
+    async def unregister_reminder(self, actor_type: str, actor_id: str, name: str) -> None:
+        task = self.reminders.pop((actor_type, actor_id, name), None)
+        if task is not None and task is not asyncio.current_task():
+            task.cancel()
+
+    async def register_timer(self, actor_type: str, actor_id: str, name: str, data: bytes) -> None:
+        body = json.loads(data)
+        key = (actor_type, actor_id, name)
+        old = self.timers.pop(key, None)
+        if old is not None:
+            old.cancel()
+        due = convert_from_dapr_duration(body["dueTime"])
+        period = convert_from_dapr_duration(body["period"]) if body.get("period") else None
+        self.timers[key] = asyncio.create_task(
+            self._runtime._timer_loop(actor_type, actor_id, name, body["callback"], body.get("data"), due, period)
+        )
+
+    async def unregister_timer(self, actor_type: str, actor_id: str, name: str) -> None:
+        task = self.timers.pop((actor_type, actor_id, name), None)
+        if task is not None and task is not asyncio.current_task():
+            task.cancel()
+
+
+class _FakeActorProxy:
+    """Stands in for ActorProxy: `proxy.InitBackup(data)` → actor.init_backup(data), JSON round-tripped."""
+    def __init__(self, runtime: "FakeActorRuntime", actor_type: str, actor_id: str, interface: type) -> None:
+        self._runtime = runtime
+        self._actor_type = actor_type
+        self._actor_id = actor_id
+        self._methods = {
+            getattr(fn, "__actormethod__", None): fn.__name__
+            for fn in vars(interface).values() if callable(fn) and getattr(fn, "__actormethod__", None)
+        }
+
+    def __getattr__(self, name: str) -> Callable:
+        if name not in self._methods:
+            raise AttributeError(name)
+
+        async def call(*args):
+            payload = DefaultJSONSerializer().serialize(args[0]) if args else None
+            raw = await self._runtime.invoke(self._actor_type, self._actor_id, name, payload)
+            return json.loads(raw) if raw else None
+        return call
+
+
+class FakeActorRuntime:
+    """
+    In-process Dapr actor runtime. Actor instances are real `Actor` subclasses on
+    a real ActorRuntimeContext, backed by an in-memory state store. Reminders fire
+    only when `fire_reminders` is set; `time_scale` shrinks their due time/period.
+    """
+    def __init__(self, fire_reminders: bool = False, time_scale: float = 1.0) -> None:
+        self.fire_reminders = fire_reminders
+        self.time_scale = time_scale
+        self.client = _FakeActorClient(self)
+        self._contexts: Dict[str, ActorRuntimeContext] = {}
+        self._interfaces: Dict[str, Dict[str, str]] = {}
+        self._actors: Dict[Tuple[str, str], Any] = {}
+        self._locks: Dict[Tuple[str, str], asyncio.Lock] = {}
+        self.calls = itertools.count()
+
+    def register(self, actor_class: Type) -> None:
+        info = ActorTypeInformation.create(actor_class)
+        serializer = DefaultJSONSerializer()
+        self._contexts[info.type_name] = ActorRuntimeContext(info, serializer, serializer, self.client)
+        methods: Dict[str, str] = {}
+        for iface in info.actor_interfaces:
+            for fn in vars(iface).values():
+                if callable(fn) and getattr(fn, "__actormethod__", None):
+                    methods[fn.__actormethod__] = fn.__name__
+        self._interfaces[info.type_name] = methods
+
+    def create_proxy(self, actor_type: str, actor_id: ActorId, interface: type, *args, **kwargs) -> _FakeActorProxy:
+        return _FakeActorProxy(self, actor_type, str(actor_id), interface)
+
+    @property
+    def active_actors(self) -> int:
+        return len(self._actors)
+
+    async def _activate(self, actor_type: str, actor_id: str):
+        key = (actor_type, actor_id)
+        actor = self._actors.get(key)
+        if actor is None:
+            ctx = self._contexts[actor_type]
+            actor = ctx.create_actor(ActorId(actor_id))
+            await actor._on_activate_internal()
+            self._actors[key] = actor
+        return actor
+
+    async def invoke(self, actor_type: str, actor_id: str, method: str, data: Optional[bytes]) -> bytes:
+        next(self.calls)
+        key = (actor_type, actor_id)
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:  # actors are single-threaded, like the real runtime
+            actor = await self._activate(actor_type, actor_id)
+            ctx = ActorMethodContext.create_for_actor(method)
+            await actor._on_pre_actor_method_internal(ctx)
+            fn = getattr(actor, self._interfaces[actor_type][method])
+            try:
+                result = await (fn(json.loads(data)) if data else fn())
+            except Exception as ex:
+                await actor._on_invoke_failed_internal(ex)
+                raise
+            await actor._on_post_actor_method_internal(ctx)
+        return DefaultJSONSerializer().serialize(result) if result is not None else b""
+
+    async def _reminder_loop(self, actor_type: str, actor_id: str, name: str, state: bytes, due, period) -> None:
+        await asyncio.sleep(due.total_seconds() * self.time_scale)
+        while True:
+            key = (actor_type, actor_id)
+            async with self._locks.setdefault(key, asyncio.Lock()):
+                actor = await self._activate(actor_type, actor_id)
+                ctx = ActorMethodContext.create_for_reminder(name)
+                await actor._on_pre_actor_method_internal(ctx)
+                await actor.receive_reminder(name, state, due, period)
+                await actor._on_post_actor_method_internal(ctx)
+            # stop when unregistered (or re-registered) from inside the callback
+            if not period or self.client.reminders.get((actor_type, actor_id, name)) is not asyncio.current_task():
+                return
+            await asyncio.sleep(period.total_seconds() * self.time_scale)
+
+    async def _timer_loop(self, actor_type: str, actor_id: str, name: str, callback: str, data: Any, due, period) -> None:
+        await asyncio.sleep(due.total_seconds() * self.time_scale)
+        while True:
+            key = (actor_type, actor_id)
+            async with self._locks.setdefault(key, asyncio.Lock()):
+                actor = await self._activate(actor_type, actor_id)
+                ctx = ActorMethodContext.create_for_timer(callback)
+                await actor._on_pre_actor_method_internal(ctx)
+                await actor._fire_timer_internal(callback, data)
+                await actor._on_post_actor_method_internal(ctx)
+            if not period or self.client.timers.get((actor_type, actor_id, name)) is not asyncio.current_task():
+                return
+            await asyncio.sleep(period.total_seconds() * self.time_scale)
+
+    async def shutdown(self) -> None:
+        for task in [*self.client.reminders.values(), *self.client.timers.values()]:
+            task.cancel()
+        self.client.reminders.clear()
+        self.client.timers.clear()
@@ -0,0 +1,294 @@
+"""
+Micro-benchmarks for per-message hot paths, with baselines kept in the repo.
+
+    python -m benchmarks.micro                                   # run and print
+    python -m benchmarks.micro --compare benchmarks/baselines/micro.json
+    python -m benchmarks.micro --save benchmarks/baselines/micro.json
+    python -m benchmarks.micro -k sse                            # only names containing "sse"
+
+Each benchmark is calibrated to run for about --min-time seconds per round;
+the reported figure is the median per-operation time over --rounds rounds
+(min and max are kept alongside). With --compare, a benchmark that is more
+than --tolerance slower than its baseline fails the run (exit status 1).
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import inspect
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+# the dispatch path logs every tool call at INFO; keep stdout quiet unless asked otherwise
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from fastapi import BackgroundTasks  # noqa: E402
+
+from shared.models import parse_notification_json  # noqa: E402
+from shared.sse import SessionManager  # noqa: E402
+from dapr_cosmos_mcp_server import sse_bus, tools  # noqa: E402
+from dapr_cosmos_mcp_server import mcp_fastapi_server as srv  # noqa: E402
+
+
+# ───────────────── runner ────────────────────────────────────────────────────
+
+Bench = Tuple[str, str, Callable[[int], Awaitable[float]]]
+BENCHMARKS: List[Bench] = []
+
+
+def bench(name: str, unit: str = "op"):
+    """
+    Register `fn(loops) -> elapsed seconds`. The function does its own timing so
+    setup (sessions, registries, event loop) stays outside the measured region.
+    """
+    def register(fn):
+        async def run(loops: int) -> float:
+            result = fn(loops)
+            return await result if inspect.isawaitable(result) else result
+        BENCHMARKS.append((name, unit, run))
+        return fn
+    return register
+
+
+async def _measure(run: Callable[[int], Awaitable[float]], min_time: float, rounds: int) -> Dict[str, Any]:
+    loops = 1
+    while True:
+        elapsed = await run(loops)
+        if elapsed >= min_time / 5 or loops >= 1 << 24:
+            break
+        loops *= 4 if elapsed < min_time / 50 else 2
+    loops = max(1, int(loops * (min_time / max(elapsed, 1e-9))))
+    per_op = [(await run(loops)) / loops for _ in range(rounds)]
+    return {
+        "median_us": round(statistics.median(per_op) * 1e6, 3),
+        "min_us": round(min(per_op) * 1e6, 3),
+        "max_us": round(max(per_op) * 1e6, 3),
+        "loops": loops,
+        "rounds": rounds,
+    }
+
+
+# ───────────────── sse_bus ───────────────────────────────────────────────────
+
+_PROGRESS = {
+    "jsonrpc": "2.0",
+    "method": "notifications/progress",
+    "params": {"progressToken": "tok-1", "progress": 0.5},
+}
+_MESSAGE = {
+    "jsonrpc": "2.0",
+    "method": "notifications/message",
+    "params": {"level": "info", "data": [{"type": "text", "text": "backup of testfile.txt on server 1 done"}]},
+}
+
+
+@bench("sse_event.progress")
+def bench_sse_event(loops: int) -> float:
+    encode = sse_bus.sse_event
+    started = time.perf_counter()
+    for _ in range(loops):
+        encode(_PROGRESS)
+    return time.perf_counter() - started
+
+
+@bench("sse.get_or_create.existing")
+async def bench_get_or_create(loops: int) -> float:
+    manager = SessionManager()
+    await manager.get_or_create("s-0")
+    started = time.perf_counter()
+    for _ in range(loops):
+        await manager.get_or_create("s-0")
+    return time.perf_counter() - started
+
+
+async def _contended_publish(loops: int, publishers: int, sessions: int) -> float:
+    """`publishers` tasks publish `loops` frames in total, spread over `sessions` sessions."""
+    manager = SessionManager()
+    frame = sse_bus.sse_event(_PROGRESS)
+    for s in range(sessions):
+        await manager.get_or_create(f"s-{s}")
+    per_task = max(1, loops // publishers)
+
+    async def publisher(p: int) -> None:
+        for i in range(per_task):
+            await manager.publish(f"s-{(p + i) % sessions}", frame)
+            if i % 16 == 0:
+                await asyncio.sleep(0)  # interleave like independent actors/tools would
+
+    started = time.perf_counter()
+    await asyncio.gather(*(publisher(p) for p in range(publishers)))
+    return (time.perf_counter() - started) * loops / (per_task * publishers)
+
+
+@bench("sse.publish.1x1")
+async def bench_publish_single(loops: int) -> float:
+    return await _contended_publish(loops, publishers=1, sessions=1)
+
+
+@bench("sse.publish.contended.64x1000")
+async def bench_publish_contended(loops: int) -> float:
+    return await _contended_publish(loops, publishers=64, sessions=1000)
+
+
+# ───────────────── notifications ─────────────────────────────────────────────
+
+_PROGRESS_JSON = json.dumps(_PROGRESS)
+_MESSAGE_JSON = json.dumps(_MESSAGE)
+
+
+@bench("parse_notification_json.progress")
+def bench_parse_progress(loops: int) -> float:
+    started = time.perf_counter()
+    for _ in range(loops):
+        parse_notification_json(_PROGRESS_JSON)
+    return time.perf_counter() - started
+
+
+@bench("parse_notification_json.message")
+def bench_parse_message(loops: int) -> float:
+    started = time.perf_counter()
+    for _ in range(loops):
+        parse_notification_json(_MESSAGE_JSON)
+    return time.perf_counter() - started
+
+
+# ───────────────── tools ─────────────────────────────────────────────────────
+
+async def _noop_tool(a: str, b: int = 0) -> str:
+    """Benchmark no-op."""
+    return a
+
+
+@bench("call_tool.dispatch")
+async def bench_call_tool(loops: int) -> float:
+    tools.TOOL_FUNCS["_bench_noop"] = _noop_tool
+    background = BackgroundTasks()
+    args = {"a": "x", "b": 1}
+    try:
+        started = time.perf_counter()
+        for _ in range(loops):
+            await srv.call_tool("_bench_noop", args, background, "bench-session")
+        return time.perf_counter() - started
+    finally:
+        tools.TOOL_FUNCS.pop("_bench_noop", None)
+
+
+def _synthetic_tools(n: int) -> List[Callable]:
+    """`n` distinct async functions with 1-6 annotated parameters, like real tools."""
+    kinds = [str, int, float, bool, list, dict]
+    made = []
+    for i in range(n):
+        params = [
+            inspect.Parameter(f"p{j}", inspect.Parameter.KEYWORD_ONLY, annotation=kinds[(i + j) % len(kinds)],
+                              default=inspect.Parameter.empty if j % 2 == 0 else None)
+            for j in range(1 + i % 6)
+        ]
+
+        async def fn(**kwargs):
+            """Synthetic benchmark tool."""
+            return kwargs
+        fn.__name__ = f"bench_tool_{i}"
+        fn.__signature__ = inspect.Signature(params)
+        made.append(fn)
+    return made
+
+
+_TOOLS_500 = _synthetic_tools(500)
+
+
+@bench("tools.schema_from_signature.500", unit="500 tools")
+def bench_schema_500(loops: int) -> float:
+    sigs = [inspect.signature(fn) for fn in _TOOLS_500]
+    started = time.perf_counter()
+    for _ in range(loops):
+        for sig in sigs:
+            tools._schema_from_signature(sig)
+    return time.perf_counter() - started
+
+
+@bench("tools.register.500", unit="500 tools")
+def bench_register_500(loops: int) -> float:
+    saved = list(tools.REGISTERED_TOOLS), dict(tools.TOOL_FUNCS)
+    elapsed = 0.0
+    try:
+        for _ in range(loops):
+            started = time.perf_counter()
+            for fn in _TOOLS_500:
+                tools.tool(fn)
+            elapsed += time.perf_counter() - started
+            tools.REGISTERED_TOOLS[:] = saved[0]
+            tools.TOOL_FUNCS.clear()
+            tools.TOOL_FUNCS.update(saved[1])
+    finally:
+        tools.REGISTERED_TOOLS[:] = saved[0]
+        tools.TOOL_FUNCS.clear()
+        tools.TOOL_FUNCS.update(saved[1])
+    return elapsed
+
+
+# ───────────────── baselines ─────────────────────────────────────────────────
+
+def compare(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]],
+            tolerance: float) -> List[str]:
+    failures: List[str] = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        ratio = result["median_us"] / base["median_us"] if base["median_us"] else 1.0
+        result["vs_baseline"] = round(ratio, 3)
+        if ratio > 1.0 + tolerance:
+            failures.append(f"{name}: {result['median_us']}us vs baseline {base['median_us']}us (x{ratio:.2f})")
+    return failures
+
+
+def _print_table(results: Dict[str, Dict[str, Any]]) -> None:
+    print(f"{'benchmark':<36}{'unit':>10}{'median_us':>12}{'min_us':>12}{'max_us':>12}{'vs_base':>10}")
+    for name, r in results.items():
+        print(f"{name:<36}{r['unit']:>10}{r['median_us']:>12}{r['min_us']:>12}{r['max_us']:>12}"
+              f"{r.get('vs_baseline', ''):>10}")
+
+
+async def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-k", dest="select", help="only run benchmarks whose name contains this")
+    parser.add_argument("--min-time", type=float, default=0.2, help="target seconds per round")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--save", help="write results as the new baseline file")
+    parser.add_argument("--compare", help="baseline file to compare against")
+    parser.add_argument("--tolerance", type=float, default=1.0, help="allowed slowdown vs baseline (1.0 = 2x)")
+    args = parser.parse_args(argv)
+
+    results: Dict[str, Dict[str, Any]] = {}
+    for name, unit, run in BENCHMARKS:
+        if args.select and args.select not in name:
+            continue
+        results[name] = {"unit": unit, **await _measure(run, args.min_time, args.rounds)}
+
+    failures: List[str] = []
+    if args.compare:
+        with open(args.compare) as f:
+            failures = compare(results, json.load(f).get("benchmarks", {}), args.tolerance)
+    _print_table(results)
+
+    if args.save:
+        doc = {
+            "machine": {"python": platform.python_version(), "platform": platform.platform(),
+                        "processor": platform.processor() or platform.machine()},
+            "benchmarks": {k: {f: v for f, v in r.items() if f != "vs_baseline"} for k, r in results.items()},
+        }
+        with open(args.save, "w") as f:
+            json.dump(doc, f, indent=2)
+            f.write("\n")
+
+    for failure in failures:
+        print(f"REGRESSION: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
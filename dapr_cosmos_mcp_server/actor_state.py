@@ -0,0 +1,51 @@
+from __future__ import annotations
+from dataclasses import asdict
+from typing import Any, Callable, Generic, Optional, TypeVar
+
+from dapr.actor.runtime.state_manager import ActorStateManager
+
+T = TypeVar("T")
+
+
+class CachedState(Generic[T]):
+    """
+    Actor-local, hydrated view of one state key.
+
+    `load()` reads through the Dapr state manager once per activation and keeps
+    the hydrated object; after that `value` is a plain attribute read. `set()`
+    only marks the value dirty; `flush()` (call it from `_on_post_actor_method`)
+    hands it to the state manager, whose end-of-turn save writes every changed
+    key in one transactional request.
+    """
+    def __init__(self, state_manager: ActorStateManager, key: str,
+                 hydrate: Callable[[dict], T], dehydrate: Callable[[T], Any] = asdict) -> None:
+        self._state_manager = state_manager
+        self.key = key
+        self._hydrate = hydrate
+        self._dehydrate = dehydrate
+        self.value: Optional[T] = None
+        self._loaded = False
+        self._dirty = False
+
+    async def load(self) -> Optional[T]:
+        if not self._loaded:
+            has_value, data = await self._state_manager.try_get_state(self.key)
+            self.value = self._hydrate(data) if has_value else None
+            self._loaded = True
+        return self.value
+
+    def set(self, value: T) -> None:
+        self.value = value
+        self._loaded = True
+        self._dirty = True
+
+    async def flush(self) -> None:
+        if self._dirty:
+            await self._state_manager.set_state(self.key, self._dehydrate(self.value))
+            self._dirty = False
+
+    def reset(self) -> None:
+        """Forget the cached value (the turn failed, so the store may disagree)."""
+        self.value = None
+        self._loaded = False
+        self._dirty = False
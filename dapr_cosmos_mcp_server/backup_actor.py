@@ -1,14 +1,39 @@
 import datetime
 from dapr.actor import Actor, Remindable
 from .backup_actor_interface import BackupActorInterface
+from .actor_state import CachedState
+from .backup_codecs import Codec, backup_file, resolve_codec
+from .backup_manifest import MANIFEST, BackupVersion
+from .backup_status_view import init_views, record_run
+from .backup_scheduling import (
+    SCHEDULER, BACKUP_DEFERRALS, ON_DEMAND, PRIORITY_NAMES, SCHEDULED, BackupJob, defer_delay, first_due,
+)
 from .cosmosdb_helper import cosmosdb_query_items, cosmosdb_create_item
 import asyncio
 from .common_types import BackupConfig, BackupStatus, BackupTaskStatus
 from dataclasses import asdict
 import uuid
-import shutil
 import os
+import time
 from .sse_bus import publish_message, publish_progress, session_for_user
+from shared import metrics, tracing
+from shared.logs import get_logger
+
+log = get_logger("actor")
+
+REMINDER_LAG = metrics.histogram("actor_reminder_lag_seconds", "Delay between a reminder's due time and its delivery")
+BACKUP_RUNS = metrics.counter("backup_runs_total", "Backup runs by outcome")
+BACKUP_DURATION = metrics.histogram("backup_run_duration_seconds", "Backup run latency")
+
+
+# files copied at once by one per-server backup run
+FILE_PARALLELISM = int(os.getenv("BACKUP_FILE_PARALLELISM", "8"))
+
+
+def _backup_paths(file_path: str) -> tuple[str, str]:
+    src_path = os.path.join(os.getcwd(), 'test_folder', file_path)
+    dest_path = os.path.join(os.getcwd(), 'backup_test_folder', f"{file_path} - {str(uuid.uuid4())}")
+    return src_path, dest_path
 
 
 class BackupActor(Actor, BackupActorInterface, Remindable):
@@ -16,25 +41,54 @@ class BackupActor(Actor, BackupActorInterface, Remindable):
 
     def __init__(self, ctx, actor_id):
         super(BackupActor, self).__init__(ctx, actor_id)
-        self.backup_config : BackupConfig = None
+        # hydrated once per activation; writes are flushed at the end of each turn
+        self._config: CachedState[BackupConfig] = CachedState(
+            self._state_manager, 'backup_config', lambda data: BackupConfig(**data)
+        )
+        # wall-clock time the next reminder is due (in-memory only, for lag metrics)
+        self._reminder_due: float | None = None
 
     async def _on_activate(self) -> None:
-        print(f'Activate {self.__class__.__name__} actor! Backup Config: {self.backup_config}', flush=True)
-        has_value, data = await self._state_manager.try_get_state('backup_config')
-        if has_value:
-            self.backup_config = BackupConfig(**data)
+        log.debug("activate", actor=self.__class__.__name__, actor_id=str(self.id))
+        await self._config.load()
 
+    async def _on_deactivate(self) -> None:
+        log.debug("deactivate", actor=self.__class__.__name__, actor_id=str(self.id))
 
+    async def _on_pre_actor_method(self, method_context) -> None:
+        # no-op once hydrated; reloads after a failed turn dropped the cache
+        await self._config.load()
 
-    async def _on_deactivate(self) -> None:
-        print(f'Deactivate {self.__class__.__name__} actor!', flush=True)
+    async def _on_post_actor_method(self, method_context) -> None:
+        # the base class saves all pending state changes in one transaction right after this
+        await self._config.flush()
+
+    async def _on_invoke_failed_internal(self, exception=None):
+        self._config.reset()
+        await super()._on_invoke_failed_internal(exception)
+
+    @property
+    def backup_config(self) -> BackupConfig | None:
+        return self._config.value
 
     async def init_backup(self, data: dict) -> None:
         # Implementation for starting a backup
-        print(f'Starting backup for {data}', flush=True)
-        backup_config = BackupConfig(**data)
-        
-        await self._state_manager.set_state('backup_config', asdict(backup_config))
+        # callers pass their trace context inside the payload (actor proxies carry no headers)
+        parent = data.pop(tracing.TRACEPARENT, None)
+        log.info("init_backup", actor_id=str(self.id), config=data)
+        with tracing.start_span("BackupActor.init_backup", kind="server", parent=parent, actor_id=str(self.id)):
+            await self._init_backup(BackupConfig(**data))
+
+    async def schedule_backup(self, data: dict) -> None:
+        """Init and arm the reminder in one actor turn (one call, one state write)."""
+        parent = data.pop(tracing.TRACEPARENT, None)
+        log.info("schedule_backup", actor_id=str(self.id), config=data)
+        with tracing.start_span("BackupActor.schedule_backup", kind="server", parent=parent, actor_id=str(self.id)):
+            await self._init_backup(BackupConfig(**data))
+            await self._arm_reminder()
+
+    async def _init_backup(self, backup_config: BackupConfig) -> None:
+        self._config.set(backup_config)
         backup_status = BackupTaskStatus(
             user_id=backup_config.user_id,
             backup_task_id=backup_config.id,
@@ -45,6 +99,8 @@ class BackupActor(Actor, BackupActorInterface, Remindable):
             status=BackupStatus.SCHEDULED.value
         )
         await cosmosdb_create_item(asdict(backup_status))
+        await init_views(backup_config.user_id, backup_config.id, backup_config.server_name,
+                         backup_config.file_list, BackupStatus.SCHEDULED.value)
         session_id =  backup_config.user_id
         token = f"Initializing Backup Task Job/{session_id}"
         await publish_progress(session_id, token, 3 / 5)
@@ -53,34 +109,43 @@ class BackupActor(Actor, BackupActorInterface, Remindable):
         if sess:
             await publish_message(sess, f"Backup scheduled for {backup_config.file_path} on {backup_config.server_name}")
 
-        print(f'Backup initialized with config: {asdict(backup_config)}', flush=True)
+        log.debug("backup initialized", actor_id=str(self.id))
         
 
     async def set_reminder(self, enabled: bool) -> None:
-        has_value, data = await self._state_manager.try_get_state('backup_config')
-        if has_value:
-            self.backup_config = BackupConfig(**data)
-
-        print(f'set reminder to {enabled}', flush=True)
-        print(f'Backup Config in set_reminder: {self.backup_config}', flush=True)
+        log.info("set_reminder", actor_id=str(self.id), enabled=enabled)
         if enabled:
-            # register (persisted) reminder
-            await self.register_reminder(
-                f'RetrieveTasksReminder_{self.id}',
-                b'reminder_state',
-                datetime.timedelta(seconds=self.backup_config.backup_frequency),  # first fire after 5s
-                datetime.timedelta(seconds=self.backup_config.backup_frequency),  # then every 5s
-            )
-            sess = session_for_user(self.backup_config.user_id)
-            if sess:
-                await publish_message(sess, f"Reminder set: every {self.backup_config.backup_frequency}s")
+            await self._arm_reminder()
         else:
             # idempotent unregister
             try:
                 await self.unregister_reminder(f'RetrieveTasksReminder_{self.id}')
             except Exception as e:
-                print(f'unregister_reminder ignored: {e}', flush=True)
-        print('set_reminder is done', flush=True)
+                log.debug("unregister_reminder ignored", actor_id=str(self.id), error=str(e))
+
+    async def _arm_reminder(self) -> None:
+        if not self.backup_config:
+            log.warning("set_reminder: no backup_config; skipping", actor_id=str(self.id))
+            return
+        period = float(self.backup_config.backup_frequency)
+        # first fire at this actor's phase within the period, so one fan-out doesn't fire in lockstep
+        due = first_due(str(self.id), period)
+        # register (persisted) reminder
+        await self.register_reminder(
+            f'RetrieveTasksReminder_{self.id}',
+            b'reminder_state',
+            datetime.timedelta(seconds=due),
+            datetime.timedelta(seconds=period),  # then every period
+        )
+        self._reminder_due = time.time() + due
+        sess = session_for_user(self.backup_config.user_id)
+        if sess:
+            await publish_message(sess, f"Reminder set: every {self.backup_config.backup_frequency}s")
+
+    async def run_backup_now(self) -> None:
+        """Queue an immediate run ahead of scheduled ones; the reminder keeps its schedule."""
+        log.info("run_backup_now", actor_id=str(self.id))
+        await self._submit(ON_DEMAND, attempt=0)
 
     async def update_backup_status(self, status: str) -> None:
         # Implementation for updating the backup status
@@ -95,51 +160,192 @@ class BackupActor(Actor, BackupActorInterface, Remindable):
         period: datetime.timedelta,
         *args
     ) -> None:
-        print(f"Received reminder: {name}, state: {state}, due_time: {due_time}, period: {period}", flush=True)
-        await self.run_backup()
+        log.debug("reminder", actor_id=str(self.id), name=name, period=str(period))
+        now = time.time()
+        if self._reminder_due is not None:
+            REMINDER_LAG.observe(max(0.0, now - self._reminder_due), actor="BackupActor")
+        self._reminder_due = now + period.total_seconds() if period else None
+        with tracing.start_span("BackupActor.reminder", kind="consumer", actor_id=str(self.id), reminder=name):
+            await self._submit(SCHEDULED, attempt=0)
 
+    async def deferred_backup(self, data: dict) -> None:
+        """Timer callback for a run the scheduler could not queue earlier."""
+        try:
+            await self.unregister_timer(f'DeferredBackup_{self.id}')
+        except Exception as e:
+            log.debug("unregister_timer ignored", actor_id=str(self.id), error=str(e))
+        await self._submit(int(data.get("priority", SCHEDULED)), attempt=int(data.get("attempt", 1)))
 
-    async def run_backup(self):
-        print(f"Running backup for {self.id} Backup Config: {self.backup_config}", flush=True)
-       
-        if not self.backup_config:
-            print("No backup_config; skipping", flush=True)
+    async def _submit(self, priority: int, attempt: int) -> None:
+        """
+        Hand the run to the node's fair scheduler and return, so the actor turn
+        ends right away; the job only needs the config captured here.
+        """
+        config = self.backup_config
+        if not config:
+            log.warning("run_backup: no backup_config; skipping", actor_id=str(self.id))
+            return
+        actor_id = str(self.id)
+        parent = tracing.current_traceparent()
+
+        async def job() -> None:
+            with tracing.start_span("BackupActor.run_backup", parent=parent, actor_id=actor_id,
+                                    priority=PRIORITY_NAMES[priority]):
+                await self.run_backup(config)
+
+        if SCHEDULER.submit(BackupJob(actor_id, config.user_id, priority, job)):
+            return
+        # user is over its queue quota: retry shortly unless the next reminder comes first
+        delay = defer_delay(attempt)
+        if priority == SCHEDULED and self._reminder_due is not None and time.time() + delay >= self._reminder_due:
+            BACKUP_RUNS.inc(outcome="skipped")
+            log.info("backup skipped; queue full until next reminder", actor_id=actor_id, attempt=attempt)
             return
-        print(f"BackupActor - Session for user {self.backup_config.user_id}", flush=True)
-        token = f"backup/{self.id}"
+        BACKUP_DEFERRALS.inc()
+        log.info("backup deferred", actor_id=actor_id, attempt=attempt, delay_s=round(delay, 2))
+        await self.register_timer(
+            f'DeferredBackup_{self.id}',
+            self.deferred_backup,
+            {"attempt": attempt + 1, "priority": priority},
+            datetime.timedelta(seconds=delay),
+            datetime.timedelta(0),  # one-shot; the callback also unregisters it
+        )
+
+    async def run_backup(self, backup_config: BackupConfig | None = None):
+        # runs from the scheduler outside the actor turn, so it only reads the config it was given
+        cfg = backup_config or self.backup_config
+        if not cfg:
+            log.warning("run_backup: no backup_config; skipping", actor_id=str(self.id))
+            return
+        log.info("run_backup", actor_id=str(self.id), user_id=cfg.user_id,
+                 server=cfg.server_name, file=cfg.file_path)
+        started = time.perf_counter()
+        outcome = "failed"
         try:
             
-            session_id =  self.backup_config.user_id
+            session_id =  cfg.user_id
             token = f"Running Backup Job/{session_id}"
             await publish_progress(session_id, token, 4 / 5)
             await publish_message(session_id, f"From MCP Server: Running backup task: step 4 of 5 (session {session_id})")
-            src_path = os.path.join(os.getcwd(), 'test_folder', self.backup_config.file_path)
-            dest_path = os.path.join(os.getcwd(), 'backup_test_folder', f"{self.backup_config.file_path} - {str(uuid.uuid4())}")
-
-
-            shutil.copy(src_path, dest_path)
+            codec = resolve_codec(cfg.compression)
+            if cfg.files:
+                outcome = await self._run_file_set(cfg, session_id, codec)
+                return
+            src_path, dest_path = _backup_paths(cfg.file_path)
+            run_started = time.time()
+            try:
+                dest_path, original_bytes, stored_bytes = await backup_file(src_path, dest_path, codec)
+            except Exception as e:
+                duration_s = time.time() - run_started
+                # failed runs go into the history too, so backup_stats can find failure hotspots
+                await cosmosdb_create_item(asdict(BackupTaskStatus(
+                    user_id=cfg.user_id,
+                    backup_task_id=cfg.id,
+                    id=str(uuid.uuid4()),
+                    server_name=cfg.server_name,
+                    file_path=src_path,
+                    backup_path="",
+                    status=BackupStatus.FAILED.value,
+                    codec=codec.name if codec else "none",
+                    duration_s=round(duration_s, 3),
+                )))
+                await record_run(cfg.user_id, cfg.id, cfg.server_name, cfg.file_path, BackupStatus.FAILED.value,
+                                 run_started, duration_s, error=str(e))
+                raise
+            taken_at = time.time()
 
             # sleep
             await asyncio.sleep(4)
             backup_status = BackupTaskStatus(
-                user_id=self.backup_config.user_id,
-                backup_task_id=self.backup_config.id,
+                user_id=cfg.user_id,
+                backup_task_id=cfg.id,
                 id=str(uuid.uuid4()),
-                server_name=self.backup_config.server_name,
+                server_name=cfg.server_name,
                 file_path=src_path,
                 backup_path=dest_path,
-                status=BackupStatus.COMPLETED.value
+                status=BackupStatus.COMPLETED.value,
+                codec=codec.name if codec else "none",
+                original_bytes=original_bytes,
+                stored_bytes=stored_bytes,
+                duration_s=round(taken_at - run_started, 3),
             )
             await cosmosdb_create_item(asdict(backup_status))
+            await MANIFEST.record(BackupVersion(
+                user_id=cfg.user_id, server_name=cfg.server_name, file_path=cfg.file_path, taken_at=taken_at,
+                artifact=dest_path, codec=backup_status.codec, original_bytes=original_bytes,
+                stored_bytes=stored_bytes, backup_task_id=cfg.id,
+            ))
+            await record_run(cfg.user_id, cfg.id, cfg.server_name, cfg.file_path, BackupStatus.COMPLETED.value,
+                             run_started, taken_at - run_started, backup_path=dest_path, codec=backup_status.codec,
+                             original_bytes=original_bytes, stored_bytes=stored_bytes)
 
 
             token = f"Completed Backup Job/{session_id}"
             await publish_progress(session_id, token, 5 / 5)
             await publish_message(session_id, f"From MCP Server: Backup completed: src: {os.path.basename(src_path)}  dest: {os.path.basename(dest_path)}: step 5 of 5 (session {session_id})")
+            outcome = "completed"
         finally:
-            # For a one-shot job, unregister; for recurring, you may want to keep it.
-            try:
-                await self.unregister_reminder(f'RetrieveTasksReminder_{self.id}')
-            except Exception:
-                pass
+            BACKUP_RUNS.inc(outcome=outcome)
+            BACKUP_DURATION.observe(time.perf_counter() - started)
+
+    async def _run_file_set(self, cfg: BackupConfig, session_id: str, codec: Codec | None) -> str:
+        """Per-server mode: copy every file with bounded parallelism, write one summary record."""
+        gate = asyncio.Semaphore(FILE_PARALLELISM)
+
+        async def copy_one(file_path: str) -> dict:
+            src_path, dest_path = _backup_paths(file_path)
+            async with gate:
+                try:
+                    dest_path, original_bytes, stored_bytes = await backup_file(src_path, dest_path, codec)
+                except OSError as e:
+                    log.warning("backup file failed", actor_id=str(self.id), file=file_path, error=str(e))
+                    return {"file_path": src_path, "backup_path": "", "status": BackupStatus.FAILED.value, "error": str(e)}
+            return {"file_path": src_path, "backup_path": dest_path, "status": BackupStatus.COMPLETED.value,
+                    "original_bytes": original_bytes, "stored_bytes": stored_bytes}
+
+        run_started = time.time()
+        results = await asyncio.gather(*(copy_one(f) for f in cfg.file_list))
+        taken_at = time.time()
+        # sleep
+        await asyncio.sleep(4)
+        copied = sum(1 for r in results if r["status"] == BackupStatus.COMPLETED.value)
+        if copied == len(results):
+            status = BackupStatus.COMPLETED
+        elif copied == 0:
+            status = BackupStatus.FAILED
+        else:
+            status = BackupStatus.PARTIAL
+        backup_status = BackupTaskStatus(
+            user_id=cfg.user_id,
+            backup_task_id=cfg.id,
+            id=str(uuid.uuid4()),
+            server_name=cfg.server_name,
+            file_path=cfg.file_path,
+            backup_path=os.path.join(os.getcwd(), 'backup_test_folder'),
+            status=status.value,
+            files=list(results),
+            codec=codec.name if codec else "none",
+            original_bytes=sum(r.get("original_bytes", 0) for r in results),
+            stored_bytes=sum(r.get("stored_bytes", 0) for r in results),
+            duration_s=round(taken_at - run_started, 3),
+        )
+        await cosmosdb_create_item(asdict(backup_status))
+        for file_path, r in zip(cfg.file_list, results):
+            if r["status"] == BackupStatus.COMPLETED.value:
+                await MANIFEST.record(BackupVersion(
+                    user_id=cfg.user_id, server_name=cfg.server_name, file_path=file_path, taken_at=taken_at,
+                    artifact=r["backup_path"], codec=backup_status.codec, original_bytes=r["original_bytes"],
+                    stored_bytes=r["stored_bytes"], backup_task_id=cfg.id,
+                ))
+        await asyncio.gather(*(
+            record_run(cfg.user_id, cfg.id, cfg.server_name, file_path, r["status"], run_started,
+                       taken_at - run_started, backup_path=r["backup_path"], codec=backup_status.codec,
+                       original_bytes=r.get("original_bytes", 0), stored_bytes=r.get("stored_bytes", 0),
+                       error=r.get("error"))
+            for file_path, r in zip(cfg.file_list, results)
+        ))
 
+        token = f"Completed Backup Job/{session_id}"
+        await publish_progress(session_id, token, 5 / 5)
+        await publish_message(session_id, f"From MCP Server: Backup {status.value}: {copied}/{len(results)} files from {cfg.server_name}: step 5 of 5 (session {session_id})")
+        return status.value
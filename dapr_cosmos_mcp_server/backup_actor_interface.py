@@ -8,10 +8,24 @@ class BackupActorInterface(ActorInterface):
     async def init_backup(self, data: dict) -> None:
         ...
 
+    @actormethod(name="ScheduleBackup")
+    async def schedule_backup(self, data: dict) -> None:
+        """
+        InitBackup followed by SetReminder(True), in a single actor call.
+        """
+        ...
+
     @actormethod(name="SetReminder")
     async def set_reminder(self, enabled: bool) -> None:
         ...
 
+    @actormethod(name="RunBackupNow")
+    async def run_backup_now(self) -> None:
+        """
+        Queue an on-demand run, served before scheduled runs.
+        """
+        ...
+
     @actormethod(name="UpdateBackupStatus")
     async def update_backup_status(self, status: str) -> None:
         """
@@ -0,0 +1,182 @@
+from __future__ import annotations
+import asyncio
+import os
+import shutil
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple, TypeVar
+
+from shared.logs import get_logger
+
+# Streaming compression of backup artifacts.
+#
+# Codecs are registered by name; zlib and gzip are always there, zstd and lz4
+# only when `zstandard` / `lz4` are installed. All file work runs on a small
+# dedicated thread pool so large copies never block the event loop and never
+# swamp the default executor.
+#
+#   BACKUP_COMPRESSION=none   codec for tasks that don't set "compression"
+#   BACKUP_IO_WORKERS=4       threads doing copy / compress / decompress
+#   BACKUP_CHUNK_BYTES=1MiB   streaming chunk size
+
+DEFAULT_CODEC = os.getenv("BACKUP_COMPRESSION", "none").lower()
+IO_WORKERS = int(os.getenv("BACKUP_IO_WORKERS", "4"))
+CHUNK_BYTES = int(os.getenv("BACKUP_CHUNK_BYTES", str(1 << 20)))
+
+log = get_logger("actor")
+
+T = TypeVar("T")
+
+_EXECUTOR = ThreadPoolExecutor(max_workers=max(1, IO_WORKERS), thread_name_prefix="backup-io")
+
+
+class Codec:
+    """
+    A named streaming codec. `compressor()` / `decompressor()` return objects
+    with `compress(chunk)` / `decompress(chunk)` and `flush()`, as zlib does.
+    """
+    def __init__(self, name: str, extension: str,
+                 compressor: Callable[[], Any], decompressor: Callable[[], Any]) -> None:
+        self.name = name
+        self.extension = extension
+        self.compressor = compressor
+        self.decompressor = decompressor
+
+
+_CODECS: Dict[str, Codec] = {}
+
+
+def register_codec(codec: Codec) -> Codec:
+    _CODECS[codec.name] = codec
+    return codec
+
+
+def available_codecs() -> list[str]:
+    return ["none", *_CODECS]
+
+
+def get_codec(name: Optional[str]) -> Optional[Codec]:
+    """The registered codec, None for "none"; KeyError for unknown or uninstalled codecs."""
+    name = (name or "none").lower()
+    if name == "none":
+        return None
+    return _CODECS[name]
+
+
+def resolve_codec(name: Optional[str]) -> Optional[Codec]:
+    """Like get_codec, but falls back to BACKUP_COMPRESSION (then no compression) with a warning."""
+    for candidate in (name or DEFAULT_CODEC, DEFAULT_CODEC):
+        try:
+            return get_codec(candidate)
+        except KeyError:
+            log.warning("codec unavailable; falling back", codec=candidate, available=available_codecs())
+    return None
+
+
+register_codec(Codec("zlib", ".zz", lambda: zlib.compressobj(6), zlib.decompressobj))
+# wbits=31: gzip container, so artifacts open with standard tools
+register_codec(Codec("gzip", ".gz", lambda: zlib.compressobj(6, zlib.DEFLATED, 31), lambda: zlib.decompressobj(31)))
+
+try:
+    import zstandard
+
+    class _ZstdDecompressor:
+        def __init__(self) -> None:
+            self._d = zstandard.ZstdDecompressor().decompressobj()
+
+        def decompress(self, chunk: bytes) -> bytes:
+            return self._d.decompress(chunk)
+
+        def flush(self) -> bytes:
+            return b""
+
+    register_codec(Codec("zstd", ".zst", lambda: zstandard.ZstdCompressor(level=3).compressobj(), _ZstdDecompressor))
+except ImportError:
+    pass
+
+try:
+    import lz4.frame
+
+    class _Lz4Compressor:
+        def __init__(self) -> None:
+            self._c = lz4.frame.LZ4FrameCompressor()
+            self._started = False
+
+        def compress(self, chunk: bytes) -> bytes:
+            head = b""
+            if not self._started:
+                head, self._started = self._c.begin(), True
+            return head + self._c.compress(chunk)
+
+        def flush(self) -> bytes:
+            head = b"" if self._started else self._c.begin()
+            return head + self._c.flush()
+
+    class _Lz4Decompressor:
+        def __init__(self) -> None:
+            self._d = lz4.frame.LZ4FrameDecompressor()
+
+        def decompress(self, chunk: bytes) -> bytes:
+            return self._d.decompress(chunk)
+
+        def flush(self) -> bytes:
+            return b""
+
+    register_codec(Codec("lz4", ".lz4", _Lz4Compressor, _Lz4Decompressor))
+except ImportError:
+    pass
+
+
+# ───────────────── streaming file operations (run on the backup-io pool) ─────
+
+def _transform(src: str, dest: str, make: Optional[Callable[[], Any]], method: str) -> Tuple[int, int]:
+    read = written = 0
+    with open(src, "rb") as fin, open(dest, "wb") as fout:
+        if make is None:
+            shutil.copyfileobj(fin, fout, CHUNK_BYTES)
+            read = written = fout.tell()
+            return read, written
+        stream = make()
+        step = getattr(stream, method)
+        while True:
+            chunk = fin.read(CHUNK_BYTES)
+            if not chunk:
+                break
+            read += len(chunk)
+            out = step(chunk)
+            if out:
+                fout.write(out)
+                written += len(out)
+        tail = stream.flush()
+        if tail:
+            fout.write(tail)
+            written += len(tail)
+    return read, written
+
+
+def compress_file(src: str, dest: str, codec: Optional[Codec]) -> Tuple[int, int]:
+    """Stream `src` into `dest` through `codec` (plain copy for None); returns (bytes read, bytes written)."""
+    return _transform(src, dest, codec.compressor if codec else None, "compress")
+
+
+def decompress_file(src: str, dest: str, codec: Optional[Codec]) -> Tuple[int, int]:
+    """Stream a backup artifact back to its original bytes; returns (bytes read, bytes written)."""
+    return _transform(src, dest, codec.decompressor if codec else None, "decompress")
+
+
+async def run_io(fn: Callable[..., T], *args: Any) -> T:
+    """Run blocking file work on the bounded backup-io pool."""
+    return await asyncio.get_running_loop().run_in_executor(_EXECUTOR, fn, *args)
+
+
+async def backup_file(src: str, dest: str, codec: Optional[Codec]) -> Tuple[str, int, int]:
+    """Write a (possibly compressed) backup of `src`; returns (artifact path, original bytes, stored bytes)."""
+    path = dest + (codec.extension if codec else "")
+    read, written = await run_io(compress_file, src, path, codec)
+    return path, read, written
+
+
+async def restore_file(artifact: str, dest: str, codec_name: Optional[str]) -> int:
+    """Decompress a backup artifact into `dest` while streaming; returns bytes restored."""
+    _, written = await run_io(decompress_file, artifact, dest, get_codec(codec_name))
+    return written
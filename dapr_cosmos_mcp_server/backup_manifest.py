@@ -0,0 +1,205 @@
+from __future__ import annotations
+import asyncio
+import json
+import os
+import threading
+from bisect import bisect_right
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional, Tuple
+
+from shared.logs import get_logger
+from .backup_codecs import run_io
+
+# Local index of backup versions per (user, server, file), so restores never
+# have to scan Cosmos. Every completed backup appends one JSON line to the
+# manifest log; the in-memory index is rebuilt from it on first use. Versions
+# are kept sorted by time, so "latest before T" is a bisect. Retention appends
+# a tombstone line per deleted version, and rewrites the log without them once
+# they outnumber the live entries.
+#
+#   BACKUP_MANIFEST_PATH=backup_manifest.jsonl   append-only manifest log
+#   BACKUP_RESTORE_ROOT=restore_test_folder      directory restores are written under
+
+MANIFEST_PATH = os.getenv("BACKUP_MANIFEST_PATH", "backup_manifest.jsonl")
+RESTORE_ROOT = os.getenv("BACKUP_RESTORE_ROOT", "restore_test_folder")
+
+log = get_logger("actor")
+
+Key = Tuple[str, str, str]
+
+
+@dataclass
+class BackupVersion:
+    user_id: str
+    server_name: str
+    file_path: str
+    taken_at: float
+    artifact: str
+    codec: str
+    original_bytes: int
+    stored_bytes: int
+    backup_task_id: str = ""
+
+    @property
+    def key(self) -> Key:
+        return self.user_id, self.server_name, self.file_path
+
+
+_APPEND_LOCK = threading.Lock()
+
+
+def _read_log(path: str) -> List[dict]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            lines = f.readlines()
+    except FileNotFoundError:
+        return []
+    entries = []
+    for line in lines:
+        try:
+            entries.append(json.loads(line))
+        except json.JSONDecodeError:
+            continue  # torn last line after a crash
+    return entries
+
+
+def _append_log(path: str, line: str) -> None:
+    with _APPEND_LOCK, open(path, "a", encoding="utf-8") as f:
+        f.write(line)
+
+
+def _rewrite_log(path: str, lines: List[str]) -> None:
+    tmp = f"{path}.tmp"
+    with _APPEND_LOCK:
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.writelines(lines)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+
+class BackupManifest:
+    """
+    (user, server, file) -> versions sorted by `taken_at`, with a parallel list
+    of timestamps for bisect. Recording is an append to the log plus an insert
+    that lands at the end of the list in the common (in-order) case.
+    """
+    def __init__(self, path: str = MANIFEST_PATH) -> None:
+        self.path = path
+        self._times: Dict[Key, List[float]] = {}
+        self._versions: Dict[Key, List[BackupVersion]] = {}
+        self._loaded = False
+        self._load_lock = asyncio.Lock()
+        # serializes log appends with the rewrite, so a rewrite never drops a fresh append
+        self._write_lock = asyncio.Lock()
+        self._tombstones = 0
+
+    def __len__(self) -> int:
+        return sum(len(v) for v in self._versions.values())
+
+    async def load(self) -> None:
+        if self._loaded:
+            return
+        async with self._load_lock:
+            if self._loaded:
+                return
+            for data in await run_io(_read_log, self.path):
+                if "deleted" in data:
+                    self._remove((data.get("user_id"), data.get("server_name"), data.get("file_path")), data["deleted"])
+                    self._tombstones += 1
+                    continue
+                try:
+                    self._insert(BackupVersion(**data))
+                except TypeError:
+                    log.warning("skipping malformed manifest entry", path=self.path)
+            self._loaded = True
+            log.info("backup manifest loaded", path=self.path, versions=len(self))
+
+    def _insert(self, version: BackupVersion) -> None:
+        times = self._times.setdefault(version.key, [])
+        versions = self._versions.setdefault(version.key, [])
+        i = bisect_right(times, version.taken_at)
+        times.insert(i, version.taken_at)
+        versions.insert(i, version)
+
+    def _remove(self, key: Key, artifact: str) -> bool:
+        versions = self._versions.get(key)
+        for i, v in enumerate(versions or ()):
+            if v.artifact == artifact:
+                del versions[i]
+                del self._times[key][i]
+                if not versions:
+                    del self._versions[key], self._times[key]
+                return True
+        return False
+
+    async def record(self, version: BackupVersion) -> None:
+        await self.load()
+        async with self._write_lock:
+            self._insert(version)
+            try:
+                await run_io(_append_log, self.path, json.dumps(asdict(version)) + "\n")
+            except OSError as e:
+                # the in-memory index still has it; only a restart would lose it
+                log.warning("manifest append failed", path=self.path, error=str(e))
+
+    async def latest_before(self, user_id: str, server_name: str, file_path: str,
+                            before: Optional[float] = None) -> Optional[BackupVersion]:
+        """Newest version taken at or before `before` (default: newest overall)."""
+        await self.load()
+        key = (user_id, server_name, file_path)
+        versions = self._versions.get(key)
+        if not versions:
+            return None
+        if before is None:
+            return versions[-1]
+        i = bisect_right(self._times[key], before)
+        return versions[i - 1] if i else None
+
+    async def versions(self, user_id: str, server_name: str, file_path: str) -> List[BackupVersion]:
+        await self.load()
+        return list(self._versions.get((user_id, server_name, file_path), ()))
+
+    async def task_versions(self, user_id: str, backup_task_id: str) -> Dict[Key, List[BackupVersion]]:
+        """Every (server, file) history of one task, oldest first."""
+        await self.load()
+        out: Dict[Key, List[BackupVersion]] = {}
+        for key, versions in self._versions.items():
+            if key[0] != user_id:
+                continue
+            mine = [v for v in versions if v.backup_task_id == backup_task_id]
+            if mine:
+                out[key] = mine
+        return out
+
+    async def forget(self, versions: List[BackupVersion]) -> None:
+        """Drop deleted versions from the index and log a tombstone for each; compacts the log when due."""
+        await self.load()
+        removed = [v for v in versions if self._remove(v.key, v.artifact)]
+        if not removed:
+            return
+        lines = "".join(json.dumps({"deleted": v.artifact, "user_id": v.user_id, "server_name": v.server_name,
+                                    "file_path": v.file_path}) + "\n" for v in removed)
+        try:
+            async with self._write_lock:
+                await run_io(_append_log, self.path, lines)
+                self._tombstones += len(removed)
+                if self._tombstones > max(100, len(self)):
+                    live = [json.dumps(asdict(v)) + "\n" for vs in self._versions.values() for v in vs]
+                    await run_io(_rewrite_log, self.path, live)
+                    log.info("backup manifest compacted", path=self.path, versions=len(live), tombstones=self._tombstones)
+                    self._tombstones = 0
+        except OSError as e:
+            log.warning("manifest tombstone write failed", path=self.path, error=str(e))
+
+
+MANIFEST = BackupManifest()
+
+
+def restore_target(file_path: str, target_path: Optional[str] = None) -> str:
+    """Absolute restore destination under RESTORE_ROOT; ValueError if `target_path` escapes it."""
+    root = os.path.realpath(RESTORE_ROOT)
+    dest = os.path.realpath(os.path.join(root, target_path or os.path.basename(file_path)))
+    if os.path.commonpath([root, dest]) != root or dest == root:
+        raise ValueError(f"target_path must name a file under {RESTORE_ROOT}")
+    return dest
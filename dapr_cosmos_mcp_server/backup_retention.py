@@ -0,0 +1,183 @@
+from __future__ import annotations
+import asyncio
+import os
+import time
+from collections import Counter
+from dataclasses import asdict, dataclass, fields
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Set
+
+from .backup_codecs import run_io
+from .backup_manifest import MANIFEST, BackupVersion
+from .backup_status_view import fold_history
+from .cosmosdb_helper import cosmosdb_delete_item, cosmosdb_query_items
+from shared import metrics
+from shared.logs import get_logger
+
+# Retention: which backup versions and status records a task keeps.
+#
+# Artifacts (per server and file) are kept when they are among the newest
+# `keep_last`, or the newest of one of the last `daily` days, `weekly` ISO
+# weeks or `monthly` months that have a backup (grandfather-father-son); the
+# rest are deleted from disk and tombstoned in the manifest. Status records
+# beyond the newest `status_keep` are deleted and folded into the task's
+# history summary. A task item can override any of these with a "retention"
+# object, e.g. {"keep_last": 3, "daily": 7, "weekly": 0, "monthly": 0}.
+#
+# Runs go through the backup scheduler's maintenance class, so they only take
+# slots no backup is waiting for, delete in paced batches, and stop between
+# batches as soon as a backup queues up (the next run picks up the rest).
+#
+#   BACKUP_RETENTION=on                        "off" never deletes anything
+#   BACKUP_RETENTION_INTERVAL_SECONDS=3600     how often each user's retention runs
+#   BACKUP_RETENTION_KEEP_LAST=10 / _DAILY=7 / _WEEKLY=4 / _MONTHLY=6   default artifact policy
+#   BACKUP_RETENTION_STATUS_KEEP=50            status records kept per task
+#   BACKUP_RETENTION_BATCH_SIZE=25             deletions per batch
+#   BACKUP_RETENTION_DELETES_PER_SECOND=20     pace of deletions (files and documents together)
+
+ENABLED = os.getenv("BACKUP_RETENTION", "on").lower() not in {"off", "0", "false", "no"}
+INTERVAL_SECONDS = float(os.getenv("BACKUP_RETENTION_INTERVAL_SECONDS", "3600"))
+BATCH_SIZE = max(1, int(os.getenv("BACKUP_RETENTION_BATCH_SIZE", "25")))
+DELETES_PER_SECOND = float(os.getenv("BACKUP_RETENTION_DELETES_PER_SECOND", "20"))
+
+RETENTION_RUNS = metrics.counter("backup_retention_runs_total", "Retention runs by outcome (completed, preempted, failed)")
+RETENTION_DELETED = metrics.counter("backup_retention_deleted_total", "Items deleted by retention by kind (artifact, status_record)")
+RETENTION_BYTES_FREED = metrics.counter("backup_retention_bytes_freed_total", "Artifact bytes deleted by retention")
+RETENTION_DURATION = metrics.histogram("backup_retention_run_duration_seconds", "Retention run latency")
+
+log = get_logger("actor")
+
+
+@dataclass
+class RetentionPolicy:
+    keep_last: int = int(os.getenv("BACKUP_RETENTION_KEEP_LAST", "10"))
+    daily: int = int(os.getenv("BACKUP_RETENTION_DAILY", "7"))
+    weekly: int = int(os.getenv("BACKUP_RETENTION_WEEKLY", "4"))
+    monthly: int = int(os.getenv("BACKUP_RETENTION_MONTHLY", "6"))
+    status_keep: int = int(os.getenv("BACKUP_RETENTION_STATUS_KEEP", "50"))
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict[str, Any]]) -> "RetentionPolicy":
+        """Defaults overridden by the known keys of a task's "retention" object; the newest version is always kept."""
+        known = {f.name for f in fields(cls)}
+        policy = cls(**{k: max(0, int(v)) for k, v in (data or {}).items() if k in known})
+        policy.keep_last = max(1, policy.keep_last)
+        return policy
+
+
+def versions_to_keep(taken_at: List[float], policy: RetentionPolicy) -> Set[int]:
+    """Indexes (into `taken_at`, any order) of the versions `policy` keeps."""
+    newest_first = sorted(range(len(taken_at)), key=lambda i: taken_at[i], reverse=True)
+    keep = set(newest_first[:policy.keep_last])
+    buckets: List[tuple[int, Callable[[datetime], Any]]] = [
+        (policy.daily, lambda d: d.date()),
+        (policy.weekly, lambda d: d.isocalendar()[:2]),
+        (policy.monthly, lambda d: (d.year, d.month)),
+    ]
+    for count, bucket_of in buckets:
+        seen = set()
+        for i in newest_first:
+            if len(seen) >= count:
+                break
+            bucket = bucket_of(datetime.fromtimestamp(taken_at[i], timezone.utc))
+            if bucket not in seen:
+                seen.add(bucket)
+                keep.add(i)  # the newest version of each bucket
+    return keep
+
+
+class Preempted(Exception):
+    pass
+
+
+class _Pacer:
+    """Spreads deletions at `per_second` and stops the run when live backups are waiting."""
+    def __init__(self, per_second: float, should_yield: Callable[[], bool]) -> None:
+        self.per_second = per_second
+        self.should_yield = should_yield
+
+    async def batches(self, items: List[Any]) -> AsyncIterator[List[Any]]:
+        for start in range(0, len(items), BATCH_SIZE):
+            if self.should_yield():
+                raise Preempted()
+            batch = items[start:start + BATCH_SIZE]
+            yield batch
+            if self.per_second > 0:
+                await asyncio.sleep(len(batch) / self.per_second)
+
+
+def _remove_file(path: str) -> bool:
+    try:
+        os.remove(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+async def _prune_artifacts(user_id: str, task_id: str, policy: RetentionPolicy, pacer: _Pacer) -> int:
+    expired: List[BackupVersion] = []
+    for versions in (await MANIFEST.task_versions(user_id, task_id)).values():
+        keep = versions_to_keep([v.taken_at for v in versions], policy)
+        expired.extend(v for i, v in enumerate(versions) if i not in keep)
+    deleted = 0
+    async for batch in pacer.batches(expired):
+        removed = await asyncio.gather(*(run_io(_remove_file, v.artifact) for v in batch), return_exceptions=True)
+        gone = [v for v, r in zip(batch, removed) if not isinstance(r, BaseException)]
+        for v, r in zip(batch, removed):
+            if isinstance(r, BaseException):
+                log.warning("retention: artifact delete failed", artifact=v.artifact, error=str(r))
+            elif r:
+                RETENTION_BYTES_FREED.inc(v.stored_bytes or 0)
+        await MANIFEST.forget(gone)
+        deleted += len(gone)
+        RETENTION_DELETED.inc(len(gone), kind="artifact")
+    return deleted
+
+
+async def _compact_status_history(user_id: str, task_id: str, policy: RetentionPolicy, pacer: _Pacer) -> int:
+    # BackupTaskStatus records: the only documents of a task with a backup_path and no doc_type
+    query = ("SELECT c.id, c.status, c._ts, c.backup_path, c.doc_type FROM c "
+             "WHERE c.user_id = @user_id AND c.backup_task_id = @task_id "
+             "AND IS_DEFINED(c.backup_path) AND NOT IS_DEFINED(c.doc_type)")
+    rows = await cosmosdb_query_items(query, parameters=[{"name": "@user_id", "value": user_id},
+                                                         {"name": "@task_id", "value": task_id}],
+                                      partition_key=user_id)
+    records = sorted((r for r in rows if "backup_path" in r and not r.get("doc_type")), key=lambda r: r.get("_ts", 0), reverse=True)
+    expired = records[policy.status_keep:]
+    deleted = 0
+    async for batch in pacer.batches(expired):
+        results = await asyncio.gather(*(cosmosdb_delete_item(r["id"], user_id) for r in batch), return_exceptions=True)
+        gone = [r for r, ok in zip(batch, results) if ok is True]
+        # only what this run actually deleted is counted into the summary
+        await fold_history(user_id, task_id, Counter(str(r.get("status")) for r in gone),
+                           max((r.get("_ts", 0) for r in gone), default=time.time()))
+        deleted += len(gone)
+        RETENTION_DELETED.inc(len(gone), kind="status_record")
+    return deleted
+
+
+async def run_retention(user_id: str, policies: Dict[str, Dict[str, Any]],
+                        should_yield: Callable[[], bool] = lambda: False) -> str:
+    """Apply each task's policy for one user; returns the outcome (completed, preempted, failed)."""
+    started = time.perf_counter()
+    pacer = _Pacer(DELETES_PER_SECOND, should_yield)
+    totals = Counter()
+    outcome = "failed"
+    try:
+        for task_id, data in policies.items():
+            policy = RetentionPolicy.from_dict(data)
+            totals["artifacts"] += await _prune_artifacts(user_id, task_id, policy, pacer)
+            totals["status_records"] += await _compact_status_history(user_id, task_id, policy, pacer)
+        outcome = "completed"
+    except Preempted:
+        outcome = "preempted"
+    finally:
+        RETENTION_RUNS.inc(outcome=outcome)
+        RETENTION_DURATION.observe(time.perf_counter() - started)
+        log.info("retention run", user_id=user_id, outcome=outcome, tasks=len(policies), **totals)
+    return outcome
+
+
+def policy_dict(data: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """A task item's "retention" object with the defaults filled in (what the retention actor stores)."""
+    return asdict(RetentionPolicy.from_dict(data))
@@ -0,0 +1,229 @@
+from __future__ import annotations
+import asyncio
+import os
+import random
+import time
+import zlib
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Set
+
+from shared import metrics
+from shared.logs import get_logger
+
+# Recurring backups: every BackupActor keeps its reminder, so the first fire is
+# spread over the period by a stable per-actor phase; actors created by one
+# fan-out then stay out of step on every later period too.
+#
+#   BACKUP_PHASE_SPREAD=1.0     fraction of the period the first fire is spread over
+#   BACKUP_MAX_CONCURRENT=4     backups copying at once on this node
+#   BACKUP_DEFER_SECONDS=5      first retry delay for a run the scheduler would not queue (doubles, jittered)
+#   BACKUP_JITTER=0.5           +/- fraction applied to retry delays
+#
+# Between reminder firing and the copy sits a FairScheduler: runs queue per
+# user and priority class, and free governor slots go round-robin across users.
+#
+#   BACKUP_USER_QUEUE_LIMIT=100 runs one user may have queued; beyond it runs are deferred
+#   BACKUP_USER_MAX_RUNNING=2   runs one user may have copying at once
+
+PHASE_SPREAD = float(os.getenv("BACKUP_PHASE_SPREAD", "1.0"))
+MAX_CONCURRENT = int(os.getenv("BACKUP_MAX_CONCURRENT", "4"))
+DEFER_SECONDS = float(os.getenv("BACKUP_DEFER_SECONDS", "5"))
+JITTER = float(os.getenv("BACKUP_JITTER", "0.5"))
+USER_QUEUE_LIMIT = int(os.getenv("BACKUP_USER_QUEUE_LIMIT", "100"))
+USER_MAX_RUNNING = int(os.getenv("BACKUP_USER_MAX_RUNNING", "2"))
+
+MIN_DUE_SECONDS = 1.0
+
+BACKUP_DEFERRALS = metrics.counter("backup_deferrals_total", "Backup runs deferred because the scheduler would not queue them")
+BACKUP_QUEUE_DEPTH = metrics.gauge("backup_queue_depth", "Backup runs waiting for a slot by priority")
+BACKUP_QUEUE_WAIT = metrics.histogram("backup_queue_wait_seconds", "Time a backup run waited in the scheduler by priority")
+BACKUP_QUEUE_REJECTED = metrics.counter("backup_queue_rejected_total", "Backup runs not queued by reason")
+
+log = get_logger("scheduler")
+
+# priority classes, highest first; maintenance (retention) only gets slots no backup is waiting for
+ON_DEMAND = 0
+SCHEDULED = 1
+MAINTENANCE = 2
+PRIORITY_NAMES = {ON_DEMAND: "on_demand", SCHEDULED: "scheduled", MAINTENANCE: "maintenance"}
+
+
+def phase_offset(actor_id: str, period: float, spread: float = PHASE_SPREAD) -> float:
+    """Stable offset in [0, period * spread) derived from the actor id."""
+    fraction = zlib.crc32(actor_id.encode("utf-8")) / 2**32
+    return period * max(0.0, min(spread, 1.0)) * fraction
+
+
+def first_due(actor_id: str, period: float) -> float:
+    """Seconds until an actor's first run: its phase within the period, never sooner than MIN_DUE_SECONDS."""
+    return max(MIN_DUE_SECONDS, phase_offset(actor_id, period))
+
+
+def jittered(seconds: float, jitter: float = JITTER) -> float:
+    return max(0.0, seconds * (1.0 + random.uniform(-jitter, jitter)))
+
+
+def defer_delay(attempt: int) -> float:
+    """Retry delay for the n-th deferral (0-based): exponential backoff with jitter."""
+    return jittered(DEFER_SECONDS * (2 ** attempt))
+
+
+class BackupGovernor:
+    """
+    Node-wide count of running backups and its cap. FairScheduler admits
+    against it: a queued run starts only when `try_acquire()` finds a free
+    slot, and releases it when the run ends.
+    """
+    def __init__(self, limit: int = MAX_CONCURRENT) -> None:
+        self.limit = max(1, limit)
+        self.active = 0
+
+    def try_acquire(self) -> bool:
+        if self.active >= self.limit:
+            return False
+        self.active += 1
+        return True
+
+    def release(self) -> None:
+        self.active = max(0, self.active - 1)
+
+
+GOVERNOR = BackupGovernor()
+
+metrics.gauge("backup_active", "Backups currently copying on this node", fn=lambda: GOVERNOR.active)
+
+
+class BackupJob:
+    __slots__ = ("key", "user_id", "priority", "run", "enqueued")
+
+    def __init__(self, key: str, user_id: str, priority: int, run: Callable[[], Awaitable[Any]]) -> None:
+        self.key = key
+        self.user_id = user_id
+        self.priority = priority
+        self.run = run
+        self.enqueued = time.monotonic()
+
+
+class FairScheduler:
+    """
+    Queue between reminder firing and the backup itself.
+
+    Runs wait in per-user FIFOs inside each priority class. When the governor
+    has a free slot, the highest non-empty class is served round-robin across
+    its users, skipping users already at their running quota, so one user with
+    thousands of file/server pairs cannot starve the others. On-demand runs
+    always go before scheduled ones. A job whose key is already queued is
+    coalesced into the queued one.
+    """
+    def __init__(self, governor: BackupGovernor, user_queue_limit: int = USER_QUEUE_LIMIT,
+                 user_max_running: int = USER_MAX_RUNNING) -> None:
+        self.governor = governor
+        self.user_queue_limit = user_queue_limit
+        self.user_max_running = max(1, user_max_running)
+        self._queues: Dict[int, Dict[str, Deque[BackupJob]]] = {p: {} for p in PRIORITY_NAMES}
+        self._rotation: Dict[int, Deque[str]] = {p: deque() for p in PRIORITY_NAMES}
+        self._queued_keys: Set[str] = set()
+        self._queued_per_user: Dict[str, int] = {}
+        self._running_per_user: Dict[str, int] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    def submit(self, job: BackupJob) -> bool:
+        """Queue a run; False when the user is over quota (the caller defers or skips it)."""
+        if job.key in self._queued_keys:
+            BACKUP_QUEUE_REJECTED.inc(reason="coalesced")
+            return True
+        if self._queued_per_user.get(job.user_id, 0) >= self.user_queue_limit:
+            BACKUP_QUEUE_REJECTED.inc(reason="user_quota")
+            return False
+        queues = self._queues[job.priority]
+        if job.user_id not in queues:
+            queues[job.user_id] = deque()
+            self._rotation[job.priority].append(job.user_id)
+        queues[job.user_id].append(job)
+        self._queued_keys.add(job.key)
+        self._queued_per_user[job.user_id] = self._queued_per_user.get(job.user_id, 0) + 1
+        BACKUP_QUEUE_DEPTH.inc(priority=PRIORITY_NAMES[job.priority])
+        self._pump()
+        return True
+
+    def _next(self) -> Optional[BackupJob]:
+        for priority in sorted(self._rotation):
+            rotation = self._rotation[priority]
+            for _ in range(len(rotation)):
+                user_id = rotation[0]
+                rotation.rotate(-1)  # this user moves to the back of its class
+                if self._running_per_user.get(user_id, 0) >= self.user_max_running:
+                    continue
+                queue = self._queues[priority][user_id]
+                job = queue.popleft()
+                if not queue:
+                    del self._queues[priority][user_id]
+                    rotation.pop()
+                return job
+        return None
+
+    def _pump(self) -> None:
+        while self.governor.active < self.governor.limit:
+            job = self._next()
+            if job is None:
+                return
+            self.governor.try_acquire()
+            self._queued_keys.discard(job.key)
+            self._queued_per_user[job.user_id] -= 1
+            if not self._queued_per_user[job.user_id]:
+                del self._queued_per_user[job.user_id]
+            self._running_per_user[job.user_id] = self._running_per_user.get(job.user_id, 0) + 1
+            name = PRIORITY_NAMES[job.priority]
+            BACKUP_QUEUE_DEPTH.dec(priority=name)
+            BACKUP_QUEUE_WAIT.observe(time.monotonic() - job.enqueued, priority=name)
+            task = asyncio.create_task(self._run(job))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, job: BackupJob) -> None:
+        try:
+            await job.run()
+        except Exception:
+            log.exception("backup job failed", key=job.key, user_id=job.user_id)
+        finally:
+            self.governor.release()
+            self._running_per_user[job.user_id] -= 1
+            if not self._running_per_user[job.user_id]:
+                del self._running_per_user[job.user_id]
+            self._pump()
+
+    def waiting_above(self, priority: int) -> int:
+        """Runs queued in classes with a higher priority than `priority` (long maintenance jobs yield to them)."""
+        return sum(len(q) for p, users in self._queues.items() if p < priority for q in users.values())
+
+    async def shutdown(self) -> None:
+        """Drop queued runs and cancel running ones (app shutdown); reminders re-fire them later."""
+        for priority in self._queues:
+            self._queues[priority].clear()
+            self._rotation[priority].clear()
+            BACKUP_QUEUE_DEPTH.set(0, priority=PRIORITY_NAMES[priority])
+        self._queued_keys.clear()
+        self._queued_per_user.clear()
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def snapshot(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        queued = {
+            PRIORITY_NAMES[p]: {
+                user: {"queued": len(q), "oldest_wait_s": round(now - q[0].enqueued, 3)}
+                for user, q in users.items()
+            }
+            for p, users in self._queues.items()
+        }
+        return {
+            "active": self.governor.active,
+            "limit": self.governor.limit,
+            "running_per_user": dict(self._running_per_user),
+            "queued": queued,
+        }
+
+
+SCHEDULER = FairScheduler(GOVERNOR)
@@ -0,0 +1,233 @@
+from __future__ import annotations
+import math
+import os
+import time
+from array import array
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from .common_types import BackupStatus
+from .cosmosdb_helper import cosmosdb_query_fold
+from shared import metrics
+
+# Aggregate statistics over a user's BackupTaskStatus history, for the
+# backup_stats tool: the LLM gets a summary of a few hundred tokens instead of
+# raw rows it would have to count and average itself.
+#
+# The query is single-partition and projects only the fields used. Each result
+# page is appended to typed columns (array.array) as it arrives, so no page is
+# kept; at the end the columns are viewed as NumPy arrays without a copy and
+# everything (status counts, duration percentiles, bytes per server and file,
+# failure hotspots per time bucket) is a handful of bincount/percentile calls.
+#
+# Runs and files are separate tables: a per-server run is one record covering
+# many files, so durations are per run while bytes and failures are per file.
+# Records folded away by retention are not in the history any more; their
+# count is reported from the tasks' history summaries.
+
+STATS_RECORDS = metrics.counter("backup_stats_records_total", "Status records aggregated by backup_stats")
+STATS_DURATION = metrics.histogram("backup_stats_compute_seconds", "backup_stats latency, query through summary text")
+
+# run outcomes, in column order; scheduled / in-progress records are not runs
+_OUTCOMES = (BackupStatus.COMPLETED.value, BackupStatus.FAILED.value, BackupStatus.PARTIAL.value)
+_OUTCOME_CODE = {s: i for i, s in enumerate(_OUTCOMES)}
+_OK = _OUTCOME_CODE[BackupStatus.COMPLETED.value]
+# more buckets than this and the bucket is widened
+MAX_BUCKETS = 60
+
+
+def _iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _file_name(path: str) -> str:
+    # BackupActor records source paths as <cwd>/test_folder/<file> (see _backup_paths)
+    root = os.path.join(os.getcwd(), "test_folder")
+    return os.path.relpath(path, root) if path.startswith(root + os.sep) else path
+
+
+class _Interner:
+    def __init__(self) -> None:
+        self.codes: Dict[str, int] = {}
+        self.names: List[str] = []
+
+    def __call__(self, name: str) -> int:
+        code = self.codes.get(name)
+        if code is None:
+            code = self.codes[name] = len(self.names)
+            self.names.append(name)
+        return code
+
+
+class StatusColumns:
+    """Status history as typed columns: one row per run, and one per file backed up by a run."""
+    def __init__(self) -> None:
+        self.servers = _Interner()
+        self.files = _Interner()
+        self.tasks = _Interner()
+        # runs
+        self.run_ts = array("d")
+        self.run_duration = array("d")  # NaN when the record has none
+        self.run_outcome = array("b")
+        self.run_server = array("i")
+        self.run_task = array("i")
+        # files, each pointing at its run
+        self.file_run = array("i")
+        self.file_name = array("i")
+        self.file_failed = array("b")
+        self.file_original = array("q")
+        self.file_stored = array("q")
+        # history summaries: task -> (records compacted, through)
+        self.compacted: Dict[str, tuple[int, Optional[str]]] = {}
+
+    def add_page(self, page: List[Dict[str, Any]]) -> None:
+        for doc in page:
+            if "compacted_records" in doc:
+                self.compacted[doc.get("backup_task_id", "")] = (doc.get("compacted_records") or 0, doc.get("compacted_through"))
+                continue
+            outcome = _OUTCOME_CODE.get(doc.get("status"))
+            if outcome is None or doc.get("doc_type"):
+                continue
+            run = len(self.run_ts)
+            self.run_ts.append(float(doc.get("_ts") or 0))
+            duration = doc.get("duration_s")
+            self.run_duration.append(float(duration) if duration is not None else math.nan)
+            self.run_outcome.append(outcome)
+            self.run_server.append(self.servers(str(doc.get("server_name"))))
+            self.run_task.append(self.tasks(str(doc.get("backup_task_id"))))
+            # per-server runs list their files; per-file runs are the file
+            for f in doc.get("files") or [doc]:
+                self.file_run.append(run)
+                self.file_name.append(self.files(_file_name(str(f.get("file_path")))))
+                self.file_failed.append(f.get("status") != BackupStatus.COMPLETED.value)
+                self.file_original.append(int(f.get("original_bytes") or 0))
+                self.file_stored.append(int(f.get("stored_bytes") or 0))
+        STATS_RECORDS.inc(len(page))
+
+    def numpy(self) -> Dict[str, np.ndarray]:
+        # zero-copy views over the array buffers
+        return {name: np.frombuffer(col, dtype=col.typecode) if len(col) else np.zeros(0, dtype=col.typecode)
+                for name, col in vars(self).items() if isinstance(col, array)}
+
+
+async def load_columns(user_id: str, since: float, backup_task_id: str = "", server_name: str = "") -> StatusColumns:
+    clauses = ["c.user_id = @user_id",
+               "((IS_DEFINED(c.backup_path) AND NOT IS_DEFINED(c.doc_type) AND c._ts >= @since)"
+               " OR IS_DEFINED(c.compacted_records))"]
+    parameters: List[Dict[str, Any]] = [{"name": "@user_id", "value": user_id}, {"name": "@since", "value": int(since)}]
+    for field, value in (("backup_task_id", backup_task_id), ("server_name", server_name)):
+        if value:
+            clauses.append(f"c.{field} = @{field}")
+            parameters.append({"name": f"@{field}", "value": value})
+    query = ("SELECT c.backup_task_id, c.server_name, c.file_path, c.status, c.doc_type, c._ts, c.duration_s, "
+             "c.original_bytes, c.stored_bytes, c.files, c.compacted_records, c.compacted_through "
+             f"FROM c WHERE {' AND '.join(clauses)}")
+    return await cosmosdb_query_fold(query, StatusColumns, StatusColumns.add_page,
+                                     parameters=parameters, partition_key=user_id)
+
+
+def _pct(part: float, whole: float) -> str:
+    return f"{100.0 * part / whole:.1f}%" if whole else "n/a"
+
+
+def summarize(cols: StatusColumns, since: float, now: float, bucket_s: float, top: int = 5) -> str:
+    """The compact text summary of `cols` for runs in [since, now]."""
+    c = cols.numpy()
+    run_in = (c["run_ts"] >= since) & (c["run_ts"] <= now)
+    file_in = run_in[c["file_run"]]
+    lines = [f"window: {_iso(since)} .. {_iso(now)}"]
+    for task, (n, through) in sorted(cols.compacted.items()):
+        if n:
+            lines.append(f"note: task {task} has {n} older status records compacted (through {through}), not included")
+    runs = int(run_in.sum())
+    if not runs:
+        lines.append("runs: 0")
+        return "\n".join(lines)
+
+    outcome = c["run_outcome"][run_in]
+    by_outcome = np.bincount(outcome, minlength=len(_OUTCOMES))
+    lines.append(f"runs: {runs}  " + "  ".join(f"{s}: {int(n)}" for s, n in zip(_OUTCOMES, by_outcome))
+                 + f"  success_rate: {_pct(by_outcome[_OK], runs)}")
+    duration = c["run_duration"][run_in]
+    duration = duration[~np.isnan(duration)]
+    if duration.size:
+        p50, p95, p99 = np.percentile(duration, [50, 95, 99])
+        lines.append(f"duration_s: p50 {p50:.2f}  p95 {p95:.2f}  p99 {p99:.2f}  max {duration.max():.2f}  (n={duration.size})")
+
+    # per file, restricted to the window
+    f_run = c["file_run"][file_in]
+    f_server = c["run_server"][f_run]
+    f_ts = c["run_ts"][f_run]
+    f_failed = c["file_failed"][file_in].astype(bool)
+    f_original = c["file_original"][file_in].astype(np.float64)
+    f_stored = c["file_stored"][file_in].astype(np.float64)
+    lines.append(f"files backed up: {f_run.size}  failed: {int(f_failed.sum())}  "
+                 f"original_bytes: {int(f_original.sum())}  stored_bytes: {int(f_stored.sum())}"
+                 f"  ({_pct(f_stored.sum(), f_original.sum())} of original)")
+
+    n_servers = len(cols.servers.names)
+    r_server = c["run_server"][run_in]
+    s_runs = np.bincount(r_server, minlength=n_servers)
+    s_ok = np.bincount(r_server, weights=outcome == _OK, minlength=n_servers)
+    s_original = np.bincount(f_server, weights=f_original, minlength=n_servers)
+    s_stored = np.bincount(f_server, weights=f_stored, minlength=n_servers)
+    lines.append("per server:")
+    lines.append("server | runs | success_rate | original_bytes | stored_bytes")
+    for s in np.argsort(-s_stored, kind="stable"):
+        if s_runs[s]:
+            lines.append(f"{cols.servers.names[s]} | {int(s_runs[s])} | {_pct(s_ok[s], s_runs[s])} | "
+                         f"{int(s_original[s])} | {int(s_stored[s])}")
+
+    # (server, file) pairs present in the window
+    pair, pair_of = np.unique(f_server.astype(np.int64) * len(cols.files.names) + c["file_name"][file_in],
+                              return_inverse=True)
+    pair_server, pair_file = np.divmod(pair, len(cols.files.names))
+    label = [f"{cols.servers.names[s]} | {cols.files.names[f]}" for s, f in zip(pair_server, pair_file)]
+    p_backups = np.bincount(pair_of, minlength=pair.size)
+    p_stored = np.bincount(pair_of, weights=f_stored, minlength=pair.size)
+    lines.append(f"largest files (top {min(top, pair.size)} of {pair.size} by stored bytes):")
+    lines.append("server | file | backups | stored_bytes")
+    for p in np.argsort(-p_stored, kind="stable")[:top]:
+        lines.append(f"{label[p]} | {int(p_backups[p])} | {int(p_stored[p])}")
+
+    # failures over time: per bucket overall, and the worst bucket of each hotspot
+    n_buckets = max(1, math.ceil((now - since) / bucket_s))
+    if n_buckets > MAX_BUCKETS:
+        bucket_s = (now - since) / MAX_BUCKETS
+        n_buckets = MAX_BUCKETS
+    bucket = np.minimum(((f_ts - since) // bucket_s).astype(np.int64), n_buckets - 1)
+    p_failures = np.bincount(pair_of, weights=f_failed, minlength=pair.size)
+    hot = np.flatnonzero(p_failures)
+    if hot.size:
+        last_failure = np.full(pair.size, -np.inf)
+        np.maximum.at(last_failure, pair_of[f_failed], f_ts[f_failed])
+        per_bucket = np.bincount(pair_of[f_failed] * n_buckets + bucket[f_failed],
+                                 minlength=pair.size * n_buckets).reshape(pair.size, n_buckets)
+        worst = per_bucket.argmax(axis=1)
+        hot = hot[np.lexsort((-last_failure[hot], -p_failures[hot]))][:top]
+        lines.append(f"failure hotspots (top {hot.size}):")
+        lines.append("server | file | failures | of | failure_rate | last_failure | worst_bucket_start | failures_in_it")
+        for p in hot:
+            lines.append(f"{label[p]} | {int(p_failures[p])} | {int(p_backups[p])} | "
+                         f"{_pct(p_failures[p], p_backups[p])} | {_iso(last_failure[p])} | "
+                         f"{_iso(since + worst[p] * bucket_s)} | {int(per_bucket[p, worst[p]])}")
+        timeline = np.bincount(bucket[f_failed], minlength=n_buckets)
+        lines.append(f"failed file backups per {bucket_s / 3600:g}h bucket, oldest first: "
+                     + " ".join(str(int(n)) for n in timeline))
+    else:
+        lines.append("failure hotspots: none")
+    return "\n".join(lines)
+
+
+async def backup_stats(user_id: str, backup_task_id: str = "", server_name: str = "",
+                       window_hours: float = 168, bucket_hours: float = 24, top: int = 5) -> str:
+    started = time.perf_counter()
+    now = time.time()
+    since = now - window_hours * 3600
+    try:
+        cols = await load_columns(user_id, since, backup_task_id, server_name)
+        return summarize(cols, since, now, max(bucket_hours, 1 / 60) * 3600, max(1, top))
+    finally:
+        STATS_DURATION.observe(time.perf_counter() - started)
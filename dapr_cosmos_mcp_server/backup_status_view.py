@@ -0,0 +1,183 @@
+from __future__ import annotations
+import asyncio
+import hashlib
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from azure.cosmos import exceptions
+
+from .cosmosdb_helper import cosmosdb_create_item_if_absent, cosmosdb_patch_item, cosmosdb_query_items
+from shared import metrics
+from shared.logs import get_logger
+
+# Latest-status view: one document per (backup task, server, file), kept up to
+# date by BackupActor next to the append-only BackupTaskStatus history.
+#
+#   {"id": "latest-<hash>", "doc_type": "latest_status", "user_id", "backup_task_id",
+#    "server_name", "file_path", "status", "updated_at",
+#    "runs", "failures", "original_bytes_total", "stored_bytes_total",
+#    "last": {"run_id", "status", "at", "duration_s", "backup_path", "codec",
+#             "original_bytes", "stored_bytes", "error"},
+#    "last_success": {... same, for the last completed run}}
+#
+# A run is one patch request with atomic increments, so concurrent runs never
+# lose counts. The patch is conditional on `last.run_id` differing from the
+# run's id, which makes a retried patch whose first response was lost a no-op
+# (412) instead of counting the run twice. "What's the status of my backups"
+# reads the user's view documents from their partition: O(tasks), not O(history).
+#
+# Retention deletes old BackupTaskStatus records and folds them into one
+# "history_summary" document per task: how many records by status, and up to
+# when.
+
+DOC_TYPE = "latest_status"
+SUMMARY_DOC_TYPE = "history_summary"
+
+STATUS_VIEW_UPDATES = metrics.counter("backup_status_view_updates_total", "Latest-status view writes by result")
+
+log = get_logger("actor")
+
+
+def view_id(backup_task_id: str, server_name: str, file_path: str) -> str:
+    # ids can't contain '/', '\\', '?' or '#', which file paths can
+    digest = hashlib.sha256(f"{backup_task_id}\x00{server_name}\x00{file_path}".encode()).hexdigest()[:32]
+    return f"latest-{digest}"
+
+
+def summary_id(backup_task_id: str) -> str:
+    return f"summary-{hashlib.sha256(backup_task_id.encode()).hexdigest()[:32]}"
+
+
+def _iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _new_doc(user_id: str, backup_task_id: str, server_name: str, file_path: str, status: str) -> Dict[str, Any]:
+    return {
+        "id": view_id(backup_task_id, server_name, file_path),
+        "doc_type": DOC_TYPE,
+        "user_id": user_id,
+        "backup_task_id": backup_task_id,
+        "server_name": server_name,
+        "file_path": file_path,
+        "status": status,
+        "updated_at": _iso(time.time()),
+        "runs": 0,
+        "failures": 0,
+        "original_bytes_total": 0,
+        "stored_bytes_total": 0,
+        "last": None,
+        "last_success": None,
+    }
+
+
+async def init_views(user_id: str, backup_task_id: str, server_name: str, file_paths: List[str], status: str) -> None:
+    """Create the view documents of a newly scheduled task; existing ones (and their counters) are kept."""
+    try:
+        created = await asyncio.gather(*(
+            cosmosdb_create_item_if_absent(_new_doc(user_id, backup_task_id, server_name, f, status))
+            for f in file_paths
+        ))
+        STATUS_VIEW_UPDATES.inc(sum(created), result="created")
+    except Exception as e:
+        # the view is derived data: never fail the caller's backup over it
+        STATUS_VIEW_UPDATES.inc(result="error")
+        log.warning("status view init failed", backup_task_id=backup_task_id, server=server_name, error=str(e))
+
+
+async def record_run(user_id: str, backup_task_id: str, server_name: str, file_path: str, status: str,
+                     started_at: float, duration_s: float, backup_path: str = "", codec: Optional[str] = None,
+                     original_bytes: int = 0, stored_bytes: int = 0, error: Optional[str] = None) -> None:
+    """Fold one finished run of one file into its view document."""
+    run_id = str(uuid.uuid4())
+    failed = status != "completed"
+    last = {
+        "run_id": run_id, "status": status, "at": _iso(started_at), "duration_s": round(duration_s, 3),
+        "backup_path": backup_path, "codec": codec, "original_bytes": original_bytes,
+        "stored_bytes": stored_bytes, "error": error,
+    }
+    operations = [
+        {"op": "incr", "path": "/runs", "value": 1},
+        {"op": "incr", "path": "/failures", "value": 1 if failed else 0},
+        {"op": "incr", "path": "/original_bytes_total", "value": original_bytes},
+        {"op": "incr", "path": "/stored_bytes_total", "value": stored_bytes},
+        {"op": "set", "path": "/status", "value": status},
+        {"op": "set", "path": "/updated_at", "value": _iso(time.time())},
+        {"op": "set", "path": "/last", "value": last},
+    ]
+    if not failed:
+        operations.append({"op": "set", "path": "/last_success", "value": last})
+    doc_id = view_id(backup_task_id, server_name, file_path)
+    predicate = f"FROM c WHERE NOT IS_DEFINED(c.last.run_id) OR c.last.run_id != '{run_id}'"
+    try:
+        for _ in range(2):
+            try:
+                await cosmosdb_patch_item(doc_id, user_id, operations, filter_predicate=predicate)
+                STATUS_VIEW_UPDATES.inc(result="patched")
+                return
+            except exceptions.CosmosResourceNotFoundError:
+                # task scheduled before the view existed: create it, then apply the run
+                await cosmosdb_create_item_if_absent(_new_doc(user_id, backup_task_id, server_name, file_path, status))
+    except exceptions.CosmosHttpResponseError as e:
+        if e.status_code == 412:
+            STATUS_VIEW_UPDATES.inc(result="duplicate")  # an earlier attempt of this patch was applied
+            return
+        STATUS_VIEW_UPDATES.inc(result="error")
+        log.warning("status view update failed", backup_task_id=backup_task_id, file=file_path, error=str(e))
+    except Exception as e:
+        STATUS_VIEW_UPDATES.inc(result="error")
+        log.warning("status view update failed", backup_task_id=backup_task_id, file=file_path, error=str(e))
+
+
+async def fold_history(user_id: str, backup_task_id: str, counts: Dict[str, int], through: float) -> None:
+    """Add deleted status records (`counts` by status, newest at `through`) to the task's history summary."""
+    if not counts:
+        return
+    operations = [{"op": "incr", "path": "/compacted_records", "value": sum(counts.values())}]
+    operations += [{"op": "incr", "path": f"/compacted_by_status/{status}", "value": n} for status, n in counts.items()]
+    operations.append({"op": "set", "path": "/compacted_through", "value": _iso(through)})
+    doc_id = summary_id(backup_task_id)
+    for _ in range(2):
+        try:
+            await cosmosdb_patch_item(doc_id, user_id, operations)  # at most 8 ops: one per BackupStatus + 2
+            return
+        except exceptions.CosmosResourceNotFoundError:
+            await cosmosdb_create_item_if_absent({
+                "id": doc_id, "doc_type": SUMMARY_DOC_TYPE, "user_id": user_id, "backup_task_id": backup_task_id,
+                "compacted_records": 0, "compacted_by_status": {}, "compacted_through": None,
+            })
+
+
+async def latest_statuses(user_id: str, backup_task_id: str = "", server_name: str = "",
+                          status: str = "") -> List[Dict[str, Any]]:
+    """The user's view documents, optionally filtered; a single-partition query."""
+    clauses = ["c.user_id = @user_id", "c.doc_type = @doc_type"]
+    parameters = [{"name": "@user_id", "value": user_id}, {"name": "@doc_type", "value": DOC_TYPE}]
+    for field, value in (("backup_task_id", backup_task_id), ("server_name", server_name), ("status", status)):
+        if value:
+            clauses.append(f"c.{field} = @{field}")
+            parameters.append({"name": f"@{field}", "value": value})
+    query = f"SELECT * FROM c WHERE {' AND '.join(clauses)}"
+    return await cosmosdb_query_items(query, parameters=parameters, partition_key=user_id)
+
+
+def as_row(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """One view document flattened for the LLM (see tool_results.shape_rows)."""
+    last = doc.get("last") or {}
+    success = doc.get("last_success") or {}
+    return {
+        "backup_task_id": doc.get("backup_task_id"),
+        "server_name": doc.get("server_name"),
+        "file_path": doc.get("file_path"),
+        "status": doc.get("status"),
+        "last_run_at": last.get("at"),
+        "last_duration_s": last.get("duration_s"),
+        "last_success_at": success.get("at"),
+        "last_error": last.get("error"),
+        "runs": doc.get("runs", 0),
+        "failures": doc.get("failures", 0),
+        "original_bytes_total": doc.get("original_bytes_total", 0),
+        "stored_bytes_total": doc.get("stored_bytes_total", 0),
+    }
@@ -1,5 +1,6 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from enum import Enum
+from typing import Optional
 
 @dataclass
 class BackupConfig:
@@ -8,6 +9,14 @@ class BackupConfig:
     server_name: str
     file_path: str
     backup_frequency: str
+    # per-server mode: every file of the task for this server, backed up in one run
+    files: list[str] = field(default_factory=list)
+    # backup_codecs name ("gzip", "zstd", ...); empty = BACKUP_COMPRESSION
+    compression: str = ""
+
+    @property
+    def file_list(self) -> list[str]:
+        return list(self.files) if self.files else [self.file_path]
 
 
 @dataclass
@@ -16,6 +25,7 @@ class BackupStatus(Enum):
     IN_PROGRESS = "in_progress"
     COMPLETED = "completed"
     FAILED = "failed"
+    PARTIAL = "partial"
     SCHEDULED = "scheduled"
 
 
@@ -27,4 +37,12 @@ class BackupTaskStatus:
     server_name: str
     file_path: str
     backup_path: str
-    status: BackupStatus
\ No newline at end of file
+    status: BackupStatus
+    # per-server mode: one summary record with a {file_path, backup_path, status, error/sizes} entry per file
+    files: Optional[list[dict]] = None
+    # codec the artifacts were written with (None/"none" = raw copy) and their sizes
+    codec: Optional[str] = None
+    original_bytes: Optional[int] = None
+    stored_bytes: Optional[int] = None
+    # wall-clock seconds of the run (copy through last artifact written); None on scheduled records
+    duration_s: Optional[float] = None
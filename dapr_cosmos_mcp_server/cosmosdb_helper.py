@@ -1,27 +1,172 @@
 import ast
 import os
 import asyncio
-from typing import Annotated
+import random
+import time
+from typing import Annotated, Any, Awaitable, Callable, Optional, TypeVar
 from dotenv import load_dotenv
+from azure.core.exceptions import ServiceRequestError, ServiceResponseError
 from azure.identity.aio import AzureCliCredential
 from azure.cosmos.aio import CosmosClient
 from azure.cosmos import PartitionKey, exceptions
 import json
+from shared import metrics, tracing
+from shared.concurrency import AdaptiveLimiter
+from shared.logs import get_logger
 load_dotenv()
 
+log = get_logger("cosmos")
+
+COSMOS_LATENCY = metrics.histogram("cosmos_request_duration_seconds", "Cosmos DB request latency")
+COSMOS_RU = metrics.counter("cosmos_request_units_total", "Cosmos DB request units charged")
+COSMOS_ERRORS = metrics.counter("cosmos_request_errors_total", "Failed Cosmos DB requests")
+COSMOS_RETRIES = metrics.counter("cosmos_request_retries_total", "Cosmos DB request retries by op and reason")
+COSMOS_THROTTLED = metrics.counter("cosmos_throttled_total", "Cosmos DB 429 responses by op")
+
+# Data access goes through one client per process (closed in the app lifespan)
+# and `_call`: an AIMD concurrency limit that halves on 429s and creeps back up
+# on successes, plus retries that honor the service's retry-after with jitter.
+# The SDK's own throttle retries are capped so 429s reach the limiter.
+#
+#   COSMOS_MAX_RETRIES=6             retries per request after the first attempt
+#   COSMOS_RETRY_BASE_SECONDS=0.1    first backoff when the service gives no retry-after (doubles)
+#   COSMOS_RETRY_MAX_SECONDS=5       cap on a single backoff
+#   COSMOS_RETRY_JITTER=0.2          extra random fraction added on top of each delay
+#   COSMOS_CONCURRENCY=16            initial in-flight request limit
+#   COSMOS_CONCURRENCY_MIN=2 / COSMOS_CONCURRENCY_MAX=64
+#   COSMOS_SDK_THROTTLE_RETRIES=1    429 retries done inside the SDK (0 means the SDK default of 9)
+
+MAX_RETRIES = int(os.getenv("COSMOS_MAX_RETRIES", "6"))
+RETRY_BASE_SECONDS = float(os.getenv("COSMOS_RETRY_BASE_SECONDS", "0.1"))
+RETRY_MAX_SECONDS = float(os.getenv("COSMOS_RETRY_MAX_SECONDS", "5"))
+RETRY_JITTER = float(os.getenv("COSMOS_RETRY_JITTER", "0.2"))
+SDK_THROTTLE_RETRIES = int(os.getenv("COSMOS_SDK_THROTTLE_RETRIES", "1"))
+
+# 408 timeout, 429 throttled, 449 retry-with, 5xx transient
+RETRYABLE_STATUS = {408, 429, 449, 500, 502, 503}
+
+LIMITER = AdaptiveLimiter(
+    initial=int(os.getenv("COSMOS_CONCURRENCY", "16")),
+    minimum=int(os.getenv("COSMOS_CONCURRENCY_MIN", "2")),
+    maximum=int(os.getenv("COSMOS_CONCURRENCY_MAX", "64")),
+)
+
+metrics.gauge("cosmos_concurrency_limit", "Current adaptive Cosmos DB concurrency limit", fn=lambda: LIMITER.limit)
+metrics.gauge("cosmos_in_flight", "Cosmos DB requests in flight", fn=lambda: LIMITER.in_flight)
+metrics.gauge("cosmos_waiting", "Cosmos DB requests waiting for a concurrency slot", fn=lambda: LIMITER.waiting)
+
+T = TypeVar("T")
+S = TypeVar("S")
+
+# Provisioning (read/create the database, try create_container) is control-plane
+# work: run it once out of band with `python -m dapr_cosmos_mcp_server.cosmosdb_helper`,
+# or at boot with STARTUP_MODE=eager. Otherwise the app only builds a client for
+# the existing container, on first use or from the background readiness step.
+client = None
+credential = None
+container = None
+_connect_lock = asyncio.Lock()
+
+
+def _settings() -> tuple[str, str, str]:
+    return os.getenv("AZURE_COSMOSDB_ENDPOINT"), os.getenv("AZURE_COSMOSDB_DB_NAME"), os.getenv("AZURE_COSMOSDB_CONTAINER_NAME")
+
+
+def _new_client(endpoint: str, credential) -> CosmosClient:
+    return CosmosClient(endpoint, credential=credential, retry_throttle_total=SDK_THROTTLE_RETRIES or None)
+
+
+def _retry_delay(error: Optional[exceptions.CosmosHttpResponseError], attempt: int) -> float:
+    """The service's retry-after when it sent one, else capped exponential backoff; plus jitter."""
+    headers = getattr(error, "headers", None) or {}
+    hint = None
+    try:
+        if headers.get("x-ms-retry-after-ms"):
+            hint = float(headers["x-ms-retry-after-ms"]) / 1000
+        elif headers.get("Retry-After"):
+            hint = float(headers["Retry-After"])
+    except (TypeError, ValueError):
+        hint = None
+    delay = hint if hint is not None else RETRY_BASE_SECONDS * (2 ** attempt)
+    delay = min(delay, RETRY_MAX_SECONDS)
+    return delay * (1 + random.uniform(0, RETRY_JITTER))
+
+
+class _RequestCharge:
+    """
+    `response_hook` for one call: sums the RU charge from the headers of that
+    call's own responses (every page and attempt). The client's shared
+    `last_response_headers` belongs to whichever request finished last.
+    """
+    def __init__(self) -> None:
+        self.total = 0.0
+
+    def __call__(self, headers: Any, result: Any = None) -> None:
+        try:
+            self.total += float((headers or {}).get("x-ms-request-charge", 0) or 0)
+        except (TypeError, ValueError):
+            pass
+
+
+async def _call(op: str, fn: Callable[[_RequestCharge], Awaitable[T]], conflict_ok: bool = False) -> T:
+    """
+    Run one data-plane request under the adaptive limit, retrying throttled and
+    transient failures. With `conflict_ok`, a 409 on a retry counts as success
+    (an earlier attempt whose response was lost already created the item).
+    `fn` passes the hook it is given as the SDK's `response_hook=`; the charge
+    it collects goes to COSMOS_RU and the current span.
+    """
+    charge = _RequestCharge()
+    try:
+        return await _attempts(op, lambda: fn(charge), conflict_ok)
+    finally:
+        COSMOS_RU.inc(charge.total, op=op)
+        span = tracing.current_span()
+        if span is not None:
+            span.set_attribute("cosmos.request_charge", charge.total)
+
+
+async def _attempts(op: str, fn: Callable[[], Awaitable[T]], conflict_ok: bool) -> T:
+    attempt = 0
+    while True:
+        async with LIMITER.slot():
+            started = time.monotonic()
+            try:
+                result = await fn()
+            except exceptions.CosmosHttpResponseError as e:
+                if e.status_code == 409 and conflict_ok and attempt > 0:
+                    return None
+                if e.status_code == 429:
+                    COSMOS_THROTTLED.inc(op=op)
+                    if LIMITER.on_throttle(started):
+                        log.warning("cosmos throttled; lowering concurrency", op=op, limit=round(LIMITER.limit, 2))
+                if e.status_code not in RETRYABLE_STATUS or attempt >= MAX_RETRIES:
+                    raise
+                reason, delay = str(e.status_code), _retry_delay(e, attempt)
+            except (ServiceRequestError, ServiceResponseError, asyncio.TimeoutError) as e:
+                if attempt >= MAX_RETRIES:
+                    raise
+                reason, delay = type(e).__name__, _retry_delay(None, attempt)
+            else:
+                LIMITER.on_success()
+                return result
+        # back off without holding a slot
+        COSMOS_RETRIES.inc(op=op, reason=reason)
+        log.debug("cosmos retry", op=op, reason=reason, attempt=attempt + 1, delay_s=round(delay, 3))
+        await asyncio.sleep(delay)
+        attempt += 1
+
 
 async def ensure_container_exists():
-    endpoint       = os.getenv("AZURE_COSMOSDB_ENDPOINT")
-    db_name        = os.getenv("AZURE_COSMOSDB_DB_NAME")
-    container_name = os.getenv("AZURE_COSMOSDB_CONTAINER_NAME")
+    endpoint, db_name, container_name = _settings()
 
     global client, container, credential
-    print(f"Ensuring Cosmos DB container exists: {container_name} in {db_name} at {endpoint}")
+    log.info("ensuring container exists", container=container_name, database=db_name, endpoint=endpoint)
     credential = AzureCliCredential()
     
 
     try:
-        client = CosmosClient(endpoint, credential=credential)
+        client = _new_client(endpoint, credential)
         database = client.get_database_client(db_name)
         try:
             await database.read()
@@ -35,15 +180,15 @@ async def ensure_container_exists():
                 partition_key=PartitionKey(path="/user_id"),
                 offer_throughput=400,
             )
-            print(f"Created container {container_name}")
+            log.info("created container", container=container_name)
         
         except Exception as e:
 
             if isinstance(e, exceptions.CosmosResourceExistsError):
                 container = database.get_container_client(container_name)
-                print(f"Container {container_name} already exists")
+                log.info("container already exists", container=container_name)
             else:
-                print("Error creating container:", e)
+                log.error("error creating container", container=container_name, error=str(e))
                 raise
 
         # return both, so caller can use and later close
@@ -51,11 +196,59 @@ async def ensure_container_exists():
     except Exception as e:
         #await client.close()
         #await credential.close()
-        print("Error ensuring container exists:", e)
+        log.error("error ensuring container exists", error=str(e))
         raise
 
 #client, credential, container = asyncio.run(ensure_container_exists())
 
+async def connect_container(verify: bool = True):
+    """
+    Bind to the already-provisioned container without any create calls. With
+    `verify`, one metadata read checks it exists and warms the token and connection.
+    """
+    global client, container, credential
+    async with _connect_lock:
+        if container is not None:
+            return container
+        endpoint, db_name, container_name = _settings()
+        credential = AzureCliCredential()
+        client = _new_client(endpoint, credential)
+        proxy = client.get_database_client(db_name).get_container_client(container_name)
+        if verify:
+            try:
+                await proxy.read()
+            except Exception as e:
+                # don't leak a client per retry of the readiness step
+                await client.close()
+                await credential.close()
+                client = credential = None
+                if isinstance(e, exceptions.CosmosResourceNotFoundError):
+                    raise RuntimeError(f"container {db_name}/{container_name} not found; "
+                                       "provision it with `python -m dapr_cosmos_mcp_server.cosmosdb_helper`") from e
+                raise
+        container = proxy
+        log.info("connected to container", container=container_name, database=db_name, verified=verify)
+        return container
+
+
+async def get_container():
+    # connects on first use when the background readiness step hasn't yet
+    return container if container is not None else await connect_container(verify=False)
+
+
+async def close_client() -> None:
+    """Close the process-wide client and credential (app shutdown)."""
+    global client, container, credential
+    async with _connect_lock:
+        for resource in (client, credential):
+            if resource is not None:
+                try:
+                    await resource.close()
+                except Exception as e:
+                    log.warning("error closing cosmos resource", error=str(e))
+        client = credential = container = None
+
+
 async def cosmosdb_create_item(item: Annotated[dict, "Json object to be inserted"]) -> Annotated[str, "create_item Result"]:
     """
     Create a new item in the Cosmos DB container.
@@ -73,22 +266,126 @@ async def cosmosdb_create_item(item: Annotated[dict, "Json object to be inserted
         if not isinstance(item, dict):
             raise ValueError("Item must be a dict or valid JSON string")
         
-        response = await container.create_item(item)
-        print("Created item:", response)
+        started = time.perf_counter()
+        with tracing.start_span("cosmos create_item", kind="client", db_system="cosmosdb"):
+            target = await get_container()
+            response = await _call("create_item", lambda hook: target.create_item(item, response_hook=hook),
+                                   conflict_ok=True) or item
+        COSMOS_LATENCY.observe(time.perf_counter() - started, op="create_item")
+        log.debug("created item", id=response.get("id"), user_id=response.get("user_id"))
         return "Item created successfully"
     except Exception as e:
-        print("Error creating item:", e)
+        COSMOS_ERRORS.inc(op="create_item")
+        log.error("error creating item", error=str(e))
         raise e
 
 
-async def cosmosdb_query_items(query: str) -> list[dict]:
+async def cosmosdb_create_item_if_absent(item: dict) -> bool:
+    """Create `item` unless one with its id already exists in the partition; True when it was created."""
+    started = time.perf_counter()
+    with tracing.start_span("cosmos create_item", kind="client", db_system="cosmosdb"):
+        target = await get_container()
+        try:
+            created = await _call("create_item", lambda hook: target.create_item(item, response_hook=hook),
+                                  conflict_ok=True) is not None
+        except exceptions.CosmosResourceExistsError:
+            created = False
+        except Exception:
+            COSMOS_ERRORS.inc(op="create_item")
+            raise
+        finally:
+            COSMOS_LATENCY.observe(time.perf_counter() - started, op="create_item")
+    return created
+
+
+async def cosmosdb_delete_item(item_id: str, partition_key: str) -> bool:
+    """Delete one item; False when it was already gone."""
+    started = time.perf_counter()
+    with tracing.start_span("cosmos delete_item", kind="client", db_system="cosmosdb"):
+        target = await get_container()
+        try:
+            await _call("delete_item", lambda hook: target.delete_item(item=item_id, partition_key=partition_key,
+                                                                       response_hook=hook))
+            deleted = True
+        except exceptions.CosmosResourceNotFoundError:
+            deleted = False
+        except Exception:
+            COSMOS_ERRORS.inc(op="delete_item")
+            raise
+        finally:
+            COSMOS_LATENCY.observe(time.perf_counter() - started, op="delete_item")
+    return deleted
+
+
+async def cosmosdb_patch_item(item_id: str, partition_key: str, operations: list[dict],
+                              filter_predicate: Optional[str] = None) -> dict:
+    """
+    Apply partial-update `operations` (set/incr/...) to one item in a single
+    request; raises CosmosResourceNotFoundError when it doesn't exist and a
+    412 CosmosHttpResponseError when `filter_predicate` doesn't match.
+    """
+    started = time.perf_counter()
+    with tracing.start_span("cosmos patch_item", kind="client", db_system="cosmosdb"):
+        target = await get_container()
+        try:
+            response = await _call("patch_item", lambda hook: target.patch_item(
+                item=item_id, partition_key=partition_key, patch_operations=operations,
+                filter_predicate=filter_predicate, response_hook=hook,
+            ))
+        except exceptions.CosmosHttpResponseError as e:
+            if e.status_code not in (404, 412):
+                COSMOS_ERRORS.inc(op="patch_item")
+            raise
+        finally:
+            COSMOS_LATENCY.observe(time.perf_counter() - started, op="patch_item")
+    return response
+
+
+async def cosmosdb_query_items(query: str, parameters: Optional[list[dict]] = None,
+                               partition_key: Optional[str] = None) -> list[dict]:
+    """Run a query to completion; with `partition_key` it stays inside that one partition."""
+    return await cosmosdb_query_fold(query, list, lambda items, page: items.extend(page),
+                                     parameters=parameters, partition_key=partition_key)
+
+
+async def cosmosdb_query_fold(query: str, start: Callable[[], S], add_page: Callable[[S, list[dict]], Any],
+                              parameters: Optional[list[dict]] = None, partition_key: Optional[str] = None) -> S:
+    """
+    Run a query, handing each result page to `add_page(acc, page)` as it
+    arrives, so callers can reduce large results without holding every
+    document; returns the accumulator. A retry restarts from a fresh `start()`.
+    """
+    acc = start()
+    count = 0
+    started = time.perf_counter()
+    with tracing.start_span("cosmos query_items", kind="client", db_system="cosmosdb") as span:
+        target = await get_container()
+
+        async def run_query(hook: _RequestCharge) -> None:
+            nonlocal acc, count
+            # a retry restarts the query from the first page
+            acc, count = start(), 0
+            if partition_key is not None:
+                result_iter = target.query_items(query=query, parameters=parameters, partition_key=partition_key,
+                                                 response_hook=hook)
+            else:
+                result_iter = target.query_items(query=query, parameters=parameters, enable_scan_in_query=True,
+                                                 response_hook=hook)
+            async for page in result_iter.by_page():
+                items = [it async for it in page]
+                add_page(acc, items)
+                count += len(items)
+
+        try:
+            await _call("query_items", run_query)
+        except Exception:
+            COSMOS_ERRORS.inc(op="query_items")
+            raise
+        finally:
+            COSMOS_LATENCY.observe(time.perf_counter() - started, op="query_items")
+            span.set_attribute("cosmos.item_count", count)
+    return acc
 
-    items: list[dict] = []
-    result_iter = container.query_items(query=query, enable_scan_in_query=True)
-    async for page in result_iter.by_page():
-        async for it in page:
-            items.append(it)
-    return items
 
 async def main():
     
@@ -3,38 +3,75 @@ Run:  uvicorn mcp_fastapi_server:app --port 3000 --reload
 dapr: dapr run --app-id cosmos_dapr_actor --dapr-http-port 3500 --app-port 3000 -- uvicorn --port 3000 mcp_fastapi_server:app
 """
 
-import asyncio, json, uuid, socket, os, inspect
+import asyncio, json, uuid, socket, os, inspect, time
 from typing import Annotated, Optional
 from fastapi import FastAPI, Request, BackgroundTasks, Response
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse
 from contextlib import asynccontextmanager
 from dapr.ext.fastapi import DaprActor  
 from dapr.actor import ActorProxy, ActorId
 import json
 from dotenv import load_dotenv
-from datetime import timedelta
+from datetime import datetime, timedelta, timezone
 from .tools import REGISTERED_TOOLS, TOOL_FUNCS, tool
-from .sse_bus import SESSIONS, sse_event, JSONRPC, publish_progress, publish_message
-from .cosmosdb_helper import cosmosdb_create_item, ensure_container_exists, cosmosdb_query_items
+from .sse_bus import SESSIONS, sse_event, JSONRPC, SSE_RETRY_MS, Keepalive, publish_progress, publish_message
+from .cosmosdb_helper import (
+    close_client, cosmosdb_create_item, connect_container, ensure_container_exists, cosmosdb_query_items,
+)
 from .task_manager_actor import TaskManagerActor  
 from .backup_actor import BackupActor  
+from .retention_actor import RetentionActor
+from .backup_scheduling import SCHEDULER
+from .backup_codecs import restore_file
+from .backup_manifest import MANIFEST, restore_target
+from .tool_results import project_query, shape_rows
+from .backup_status_view import as_row, latest_statuses
+from .backup_stats import backup_stats as compute_backup_stats
 from .task_manager_actor_interface import TaskManagerActorInterface
+from shared import metrics, tracing
+from shared.logs import get_logger, truncate
+from shared.readiness import READINESS, STARTUP_MODE
 
 load_dotenv()
+tracing.configure("mcp-server")
 
 POD = socket.gethostname()
 REV = os.getenv("CONTAINER_APP_REVISION", "unknown")
 
+log = get_logger("rpc")
+tool_log = get_logger("tools")
+
+RPC_LATENCY = metrics.histogram("mcp_rpc_duration_seconds", "JSON-RPC handling latency by method")
+TOOL_LATENCY = metrics.histogram("mcp_tool_duration_seconds", "Tool call latency by tool")
+TOOL_ERRORS = metrics.counter("mcp_tool_errors_total", "Failed tool calls by tool")
+RESTORES = metrics.counter("backup_restores_total", "Restore requests by outcome")
+RESTORE_DURATION = metrics.histogram("backup_restore_duration_seconds", "Restore latency, lookup through last byte written")
+_RPC_METHODS = {
+    "initialize", "ping", "$/ping", "workspace/listTools", "$/listTools", "list_tools", "tools/list",
+    "tools/call", "$/call", "notifications/initialized",
+}
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    # local only (no sidecar round trip); must be done before Dapr reads /dapr/config
     await actor.register_actor(TaskManagerActor)
     await actor.register_actor(BackupActor)
-    await ensure_container_exists()
+    await actor.register_actor(RetentionActor)
+    if STARTUP_MODE == "eager":
+        await READINESS.run("cosmos", ensure_container_exists)
+    else:
+        # container provisioned out of band; just bind to it and verify in the background
+        READINESS.start("cosmos", connect_container)
+    # index restores look up; loading it up front keeps the first restore fast
+    await READINESS.setup("manifest", MANIFEST.load)
     try:
         yield
     finally:
-        pass
+        await READINESS.shutdown()
+        await SCHEDULER.shutdown()
+        # after the scheduler: cancelled backups may still be writing their status
+        await close_client()
 
 app = FastAPI(lifespan=lifespan)
 actor = DaprActor(app)
@@ -48,11 +85,11 @@ async def create_backup_task(backup_task_details: Annotated[dict, "backup task p
     backup_task_details is a Json object.
     """
     try:
-        print("[create_backup_task] Creating backup task with details:", backup_task_details)
+        tool_log.info("create_backup_task", details=truncate(backup_task_details))
         try:
             backup_item_details = json.loads(backup_task_details)
         except json.JSONDecodeError:
-            print("[create_backup_task] Invalid JSON format for backup_task_details")
+            tool_log.warning("create_backup_task: invalid JSON for backup_task_details")
             return "Can you provide a valid JSON string?"
         if(len(backup_item_details) > 0):
             item = backup_item_details[0]
@@ -64,14 +101,15 @@ async def create_backup_task(backup_task_details: Annotated[dict, "backup task p
         token = f"create_backup_task/{session_id}"
         await publish_progress(session_id, token, 1 / 5)
         await publish_message(session_id, f"From MCP Server: Creating backup task: step 1 of 5 (session {session_id})")
-        print("[create_backup_task] Created item:", response)
+        tool_log.info("create_backup_task: created item", result=response)
         return "Backup task was created successfully"
     except Exception as e:
-        print("[create_backup_task] Error creating backup task:", e)
+        TOOL_ERRORS.inc(tool="create_backup_task")
+        tool_log.error("create_backup_task failed", error=str(e))
         return "Error creating backup task"
 
 @tool
-async def query_backup_tasks(cosmosDbQuery: Annotated[str, "Cosmos DB SQL query that maps to user query"]) -> Annotated[list[dict], "query_backup_tasks Result"]:
+async def query_backup_tasks(cosmosDbQuery: Annotated[str, "Cosmos DB SQL query that maps to user query"]) -> Annotated[str, "query_backup_tasks Result"]:
     """
     Query backup tasks from the Cosmos DB container.
 
@@ -87,12 +125,55 @@ async def query_backup_tasks(cosmosDbQuery: Annotated[str, "Cosmos DB SQL query
     User the user_id provided to you to query the backup tasks. 
     """
     try:
-        items = await cosmosdb_query_items(cosmosDbQuery)
-        print("[query_backup_tasks] Queried items:", items)
-        return items
+        items = await cosmosdb_query_items(project_query(cosmosDbQuery))
+        # the LLM gets schema fields only, as a capped table (tool_results.py)
+        text, size = shape_rows("query_backup_tasks", items)
+        # result sets can be large: log the size, and the rows only at debug level (truncated)
+        tool_log.info("query_backup_tasks", **size)
+        tool_log.debug("query_backup_tasks rows", rows=truncate(text))
+        return text
+    except Exception as e:
+        TOOL_ERRORS.inc(tool="query_backup_tasks")
+        tool_log.error("query_backup_tasks failed", error=str(e))
+        return "Error querying backup tasks"
+
+@tool
+async def get_backup_status(user_id: Annotated[str, "User ID that owns the backups"],
+                            backup_task_id: Annotated[str, "Only this backup task (empty = all)"] = "",
+                            server_name: Annotated[str, "Only this server (empty = all)"] = "",
+                            status: Annotated[str, "Only this latest status, e.g. failed (empty = all)"] = "") -> Annotated[str, "get_backup_status Result"]:
+    """
+    Latest status of each backed-up file (per task and server) with run, failure and byte counters; use it for status questions.
+    """
+    try:
+        docs = await latest_statuses(user_id, backup_task_id, server_name, status)
+        text, size = shape_rows("get_backup_status", [as_row(d) for d in docs])
+        tool_log.info("get_backup_status", user_id=user_id, **size)
+        return text
+    except Exception as e:
+        TOOL_ERRORS.inc(tool="get_backup_status")
+        tool_log.error("get_backup_status failed", user_id=user_id, error=str(e))
+        return "Error reading backup status"
+
+@tool
+async def backup_stats(user_id: Annotated[str, "User ID that owns the backups"],
+                       backup_task_id: Annotated[str, "Only this backup task (empty = all)"] = "",
+                       server_name: Annotated[str, "Only this server (empty = all)"] = "",
+                       window_hours: Annotated[float, "How far back to look, in hours"] = 168,
+                       bucket_hours: Annotated[float, "Time bucket for failure trends, in hours"] = 24) -> Annotated[str, "backup_stats Result"]:
+    """
+    Backup history statistics computed on the server (success rates, duration percentiles, bytes per server and file, failure hotspots over time); use it for counts, rates and trends instead of querying status records.
+    """
+    try:
+        # Annotated parameters are advertised as strings, so numbers may arrive as text
+        window_hours, bucket_hours = float(window_hours or 168), float(bucket_hours or 24)
+        text = await compute_backup_stats(user_id, backup_task_id, server_name, window_hours, bucket_hours)
+        tool_log.info("backup_stats", user_id=user_id, window_hours=window_hours, shaped_bytes=len(text.encode()))
+        return text
     except Exception as e:
-        print("[query_backup_tasks] Error querying items:", e)
-        return []
+        TOOL_ERRORS.inc(tool="backup_stats")
+        tool_log.error("backup_stats failed", user_id=user_id, error=str(e))
+        return "Error computing backup statistics"
 
 @tool
 async def setup_backup_task_agent(user_id: Annotated[str, "User ID for the backup task"]) -> Annotated[str, "setup_backup_task_agent Result"]:
@@ -103,19 +184,74 @@ async def setup_backup_task_agent(user_id: Annotated[str, "User ID for the backu
         #if session_id:
             # Remember which SSE session to use for this user
         #    associate_user_session(user_id, session_id)
-        print("[setup_backup_task_agent] Setting up backup task agent for user:", user_id)
+        tool_log.info("setup_backup_task_agent", user_id=user_id)
         proxy = ActorProxy.create('TaskManagerActor', ActorId(user_id), TaskManagerActorInterface)
-        await proxy.SetReminder(True)
+        with tracing.start_span("actor TaskManagerActor.SetReminder", kind="client", actor_id=user_id):
+            await proxy.SetReminder(True)
         session_id =  user_id
         token = f"Setup Backup Task Job/{session_id}"
         await publish_progress(session_id, token, 2 / 5)
         await publish_message(session_id, f"From MCP Server: Setting up backup task: step 2 of 5 (session {session_id})")
         return "Backup task agent set up successfully"
     except Exception as e:
-        print("[setup_backup_task_agent] Error setting up backup task agent:", e)
+        TOOL_ERRORS.inc(tool="setup_backup_task_agent")
+        tool_log.error("setup_backup_task_agent failed", user_id=user_id, error=str(e))
         return "Error setting up backup task agent"
 
 
+def _parse_before(before: Optional[str]) -> Optional[float]:
+    """ISO-8601 timestamp (naive = UTC) or epoch seconds -> epoch seconds; empty = no bound."""
+    if not before:
+        return None
+    try:
+        return float(before)
+    except ValueError:
+        pass
+    at = datetime.fromisoformat(before.strip())
+    if at.tzinfo is None:
+        at = at.replace(tzinfo=timezone.utc)
+    return at.timestamp()
+
+
+@tool
+async def restore_backup(user_id: Annotated[str, "User ID that owns the backup"],
+                         server_name: Annotated[str, "Server the file was backed up from"],
+                         file_path: Annotated[str, "File name as given in the backup task"],
+                         before: Annotated[Optional[str], "ISO-8601 time; restore the latest backup taken at or before it"] = None,
+                         target_path: Annotated[Optional[str], "File to restore into, relative to the restore folder"] = None) -> str:
+    """
+    Restores the latest backup of a file, optionally the latest one taken before a given time.
+    Looks the version up in the local backup manifest and streams it (decompressing if needed) to the restore folder.
+    """
+    started = time.perf_counter()
+    outcome = "failed"
+    try:
+        tool_log.info("restore_backup", user_id=user_id, server=server_name, file=file_path, before=before)
+        try:
+            at = _parse_before(before)
+            dest = restore_target(file_path, target_path)
+        except ValueError as e:
+            outcome = "invalid"
+            return f"Cannot restore: {e}"
+        version = await MANIFEST.latest_before(user_id, server_name, file_path, at)
+        if version is None:
+            outcome = "not_found"
+            return f"No backup of {file_path} on {server_name} found" + (f" before {before}" if before else "")
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        restored = await restore_file(version.artifact, dest, version.codec)
+        outcome = "completed"
+        taken = datetime.fromtimestamp(version.taken_at, timezone.utc).isoformat(timespec="seconds")
+        await publish_message(user_id, f"From MCP Server: Restored {file_path} from {server_name} (backup of {taken}) to {dest}")
+        return f"Restored {file_path} from the backup taken {taken} ({restored} bytes) to {dest}"
+    except Exception as e:
+        TOOL_ERRORS.inc(tool="restore_backup")
+        tool_log.error("restore_backup failed", user_id=user_id, file=file_path, error=str(e))
+        return "Error restoring backup"
+    finally:
+        RESTORES.inc(outcome=outcome)
+        RESTORE_DURATION.observe(time.perf_counter() - started)
+
+
 @tool
 async def slow_count(n: Annotated[int, "The number to count to"], 
                     user_id: Annotated[str, "User ID for the slow count"],
@@ -133,7 +269,7 @@ async def slow_count(n: Annotated[int, "The number to count to"],
         for i in range(1, n + 1):
             await publish_progress(sid, token, i / n)
             await publish_message(sid, f"slow_count: step {i} of {n} (session {sid})")
-            print(f"[slow_count] step {i} of {n} (session {sid})", flush=True)
+            tool_log.debug("slow_count step", step=i, total=n, session_id=sid)
             await asyncio.sleep(1)
 
         await publish_progress(sid, token, 1.0)
@@ -147,7 +283,7 @@ async def slow_count(n: Annotated[int, "The number to count to"],
 # ─────────────── call_tool wrapper ensures session_id injection ──────────────
 async def call_tool(name: str, raw_args: dict, tasks: BackgroundTasks, session_id: str):
 
-    print(f"[call_tool] {name} args={raw_args} session={session_id}", flush=True)
+    log.info("call_tool", tool=name, args=truncate(raw_args), session_id=session_id)
 
     if name not in TOOL_FUNCS:
         return "Error: Tool not found"
@@ -157,7 +293,15 @@ async def call_tool(name: str, raw_args: dict, tasks: BackgroundTasks, session_i
     args = dict(raw_args)
     if "session_id" in sig.parameters:
         args["session_id"] = session_id
-    result = await fn(**args) if inspect.iscoroutinefunction(fn) else fn(**args)
+    started = time.perf_counter()
+    try:
+        with tracing.start_span(f"tool {name}", tool=name, session_id=session_id):
+            result = await fn(**args) if inspect.iscoroutinefunction(fn) else fn(**args)
+    except Exception:
+        TOOL_ERRORS.inc(tool=name)
+        raise
+    finally:
+        TOOL_LATENCY.observe(time.perf_counter() - started, tool=name)
     return result
 
 def _ensure_calltool_result(obj):
@@ -172,31 +316,52 @@ def _normalize_session_id(raw: str | None, default: str = "default") -> str:
 
 @app.get("/healthz")
 async def healthz():
-    # super-fast 200 OK for Dapr liveness/readiness
+    # super-fast 200 OK for liveness; never waits on startup work
     return Response(status_code=200)
 
+@app.get("/readyz")
+async def readyz():
+    # 503 until Cosmos is connected and the backup manifest is loaded, with per-step progress
+    snapshot = READINESS.snapshot()
+    return JSONResponse(snapshot, status_code=200 if snapshot["ready"] else 503)
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    return PlainTextResponse(metrics.render_latest(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/debug/traces")
+async def debug_traces(trace_id: Optional[str] = None, limit: int = 200):
+    # recent spans from the in-memory exporter (local troubleshooting)
+    return {"service": tracing.TRACER.service, "spans": tracing.TRACER.memory.recent(trace_id, limit)}
+
+@app.get("/debug/backup_queue")
+async def debug_backup_queue():
+    # per-user queue depth, oldest wait and running counts of the backup scheduler
+    return SCHEDULER.snapshot()
+
 
 # ───────────────── SSE channel ───────────────────────────────────────────────
 
 @app.get("/mcp")
 async def mcp_sse(request: Request):
     session_id = _normalize_session_id(request.headers.get("Mcp-Session-Id"))
-    print(f"[@app.get(/mcp)] session={session_id} pod={POD} rev={REV}", flush=True)
+    log.info("GET /mcp", session_id=session_id, pod=POD, rev=REV)
+    last_event_id = request.headers.get("Last-Event-ID")
     session = await SESSIONS.get_or_create(session_id)
 
+    keepalive = Keepalive.for_stream(request.headers, request.query_params)
+
     async def event_stream():
-        #yield "event: message\ndata: {}\n\n"
-        heartbeat_every = 1.0
-        while True:
-            if await request.is_disconnected():
-                break
-            try:
-                msg = session.q.get_nowait()
-                client_msg = f"{msg}\n\n"
-                yield client_msg
-            except asyncio.QueueEmpty:
-                yield "no message"
-                await asyncio.sleep(heartbeat_every)
+        # resume after Last-Event-ID when the client reconnects
+        subscriber = session.subscribe(last_event_id)
+        if subscriber.missed:
+            log.warning("GET /mcp resumed after evicted events", session_id=session_id, missed=subscriber.missed)
+        yield f"retry: {SSE_RETRY_MS}\n\n"
+        try:
+            async for chunk in subscriber.stream(keepalive):
+                yield chunk
+        finally:
+            subscriber.close()
 
     return StreamingResponse(event_stream(), media_type="text/event-stream")
 
@@ -218,8 +383,16 @@ async def mcp_post(req: Request, tasks: BackgroundTasks):
 
     method = req_json.get("method")
     rpc_id = req_json.get("id")
-    print(f"[@app.post(/mcp) POST] method={method} session={session_id} pod={POD} rev={REV}", flush=True)
+    log.debug("POST /mcp", method=method, session_id=session_id, pod=POD, rev=REV)
+    # unknown methods share one label so clients can't blow up metric cardinality
+    label = method if method in _RPC_METHODS or method in TOOL_FUNCS else "other"
+    parent = req.headers.get(tracing.TRACEPARENT)
+    with RPC_LATENCY.time(method=label), \
+            tracing.start_span(f"mcp {label}", kind="server", parent=parent, session_id=session_id, pod=POD):
+        return await _dispatch_rpc(req_json, method, rpc_id, session_id, tasks)
 
+
+async def _dispatch_rpc(req_json: dict, method: str | None, rpc_id, session_id: str, tasks: BackgroundTasks):
     match method:
         case "initialize":
             result = {
@@ -237,7 +410,13 @@ async def mcp_post(req: Request, tasks: BackgroundTasks):
         case "tools/call" | "$/call":
             tool_name = req_json["params"]["name"]
             raw_args  = req_json["params"].get("arguments", {})
-            raw_out   = await call_tool(tool_name, raw_args, tasks, session_id)
+            token     = (req_json["params"].get("_meta") or {}).get("progressToken")
+            try:
+                raw_out = await call_tool(tool_name, raw_args, tasks, session_id)
+            finally:
+                if token is not None:
+                    # end marker: queued on this session's stream after everything the tool published to it
+                    await publish_progress(session_id, token, 1.0, total=1.0)
             result    = _ensure_calltool_result(raw_out)
 
         case _ if method in TOOL_FUNCS:
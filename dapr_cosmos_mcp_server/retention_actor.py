@@ -0,0 +1,120 @@
+import datetime
+import time
+from typing import Dict
+
+from dapr.actor import Actor, Remindable
+from .retention_actor_interface import RetentionActorInterface
+from .actor_state import CachedState
+from .backup_retention import INTERVAL_SECONDS, policy_dict, run_retention
+from .backup_scheduling import SCHEDULER, MAINTENANCE, BackupJob, first_due
+from shared import metrics, tracing
+from shared.logs import get_logger
+
+log = get_logger("actor")
+
+REMINDER_LAG = metrics.histogram("actor_reminder_lag_seconds", "Delay between a reminder's due time and its delivery")
+
+REMINDER_NAME = 'RetentionReminder'
+
+
+class RetentionActor(Actor, RetentionActorInterface, Remindable):
+    """One per user (actor id = user id): holds the policies of the user's tasks and runs them periodically."""
+
+    def __init__(self, ctx, actor_id):
+        super(RetentionActor, self).__init__(ctx, actor_id)
+        # backup_task_id -> policy (RetentionPolicy fields)
+        self._policies: CachedState[Dict[str, dict]] = CachedState(
+            self._state_manager, 'retention_policies', dict, dict
+        )
+        # epoch seconds the reminder is next due; kept in state, since it must outlive the activation
+        self._reminder_due: CachedState[float] = CachedState(
+            self._state_manager, 'retention_reminder_due', float, float
+        )
+
+    async def _load(self) -> None:
+        await self._policies.load()
+        await self._reminder_due.load()
+
+    async def _on_activate(self) -> None:
+        log.debug("activate", actor=self.__class__.__name__, actor_id=str(self.id))
+        await self._load()
+
+    async def _on_deactivate(self) -> None:
+        log.debug("deactivate", actor=self.__class__.__name__, actor_id=str(self.id))
+
+    async def _on_pre_actor_method(self, method_context) -> None:
+        await self._load()
+
+    async def _on_post_actor_method(self, method_context) -> None:
+        await self._policies.flush()
+        await self._reminder_due.flush()
+
+    async def _on_invoke_failed_internal(self, exception=None):
+        self._policies.reset()
+        self._reminder_due.reset()
+        await super()._on_invoke_failed_internal(exception)
+
+    async def schedule_retention(self, data: dict) -> None:
+        parent = data.pop(tracing.TRACEPARENT, None)
+        task_id = data["backup_task_id"]
+        policy = policy_dict(data.get("policy"))
+        with tracing.start_span("RetentionActor.schedule_retention", kind="server", parent=parent, actor_id=str(self.id)):
+            policies = dict(self._policies.value or {})
+            changed = policies.get(task_id) != policy
+            policies[task_id] = policy
+            if changed:
+                self._policies.set(policies)
+            due = self._reminder_due.value
+            # re-registering moves the due time, so an unchanged re-schedule (every task sync) leaves a live
+            # reminder alone; one a full period overdue is assumed gone and armed again
+            if changed or due is None or due < time.time() - INTERVAL_SECONDS:
+                await self._arm_reminder()
+        log.info("schedule_retention", actor_id=str(self.id), backup_task_id=task_id, policy=policy, changed=changed)
+
+    async def _arm_reminder(self) -> None:
+        due = first_due(f"retention::{self.id}", INTERVAL_SECONDS)
+        await self.register_reminder(
+            REMINDER_NAME,
+            b'reminder_state',
+            datetime.timedelta(seconds=due),
+            datetime.timedelta(seconds=INTERVAL_SECONDS),
+        )
+        self._reminder_due.set(time.time() + due)
+
+    async def run_retention_now(self) -> None:
+        log.info("run_retention_now", actor_id=str(self.id))
+        self._submit()
+
+    async def receive_reminder(
+        self,
+        name: str,
+        state: bytes,
+        due_time: datetime.timedelta,
+        period: datetime.timedelta,
+        *args
+    ) -> None:
+        log.debug("reminder", actor_id=str(self.id), name=name, period=str(period))
+        now = time.time()
+        due = self._reminder_due.value
+        if due is not None:
+            REMINDER_LAG.observe(max(0.0, now - due), actor="RetentionActor")
+        if period:
+            self._reminder_due.set(now + period.total_seconds())
+        with tracing.start_span("RetentionActor.reminder", kind="consumer", actor_id=str(self.id), reminder=name):
+            self._submit()
+
+    def _submit(self) -> None:
+        """Queue a run in the maintenance class; it stops early when backups queue up behind it."""
+        policies = dict(self._policies.value or {})
+        if not policies:
+            return
+        user_id = str(self.id)
+        parent = tracing.current_traceparent()
+
+        async def job() -> None:
+            with tracing.start_span("RetentionActor.run_retention", parent=parent, actor_id=user_id):
+                await run_retention(user_id, policies, lambda: SCHEDULER.waiting_above(MAINTENANCE) > 0)
+
+        # one queued run per user is enough: a rejected one is simply caught up by the next reminder
+        if not SCHEDULER.submit(BackupJob(f"retention::{user_id}", user_id, MAINTENANCE, job)):
+            log.info("retention run skipped; queue full until next reminder", actor_id=user_id)
@@ -0,0 +1,18 @@
+from dapr.actor import ActorInterface, actormethod
+
+
+class RetentionActorInterface(ActorInterface):
+
+    @actormethod(name="ScheduleRetention")
+    async def schedule_retention(self, data: dict) -> None:
+        """
+        Set one task's retention policy ({"backup_task_id", "policy"}) and arm the user's retention reminder.
+        """
+        ...
+
+    @actormethod(name="RunRetentionNow")
+    async def run_retention_now(self) -> None:
+        """
+        Queue a retention run (still in the maintenance class, behind any waiting backup).
+        """
+        ...
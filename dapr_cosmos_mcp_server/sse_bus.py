@@ -2,64 +2,19 @@
 import asyncio, json
 from typing import Annotated, Dict, Optional
 import requests
+from shared.sse import Keepalive, Session, SessionManager, SSE_RETRY_MS
+from shared.logs import get_logger, truncate
 
 JSONRPC = "2.0"
 
 DAPR_HTTP_PORT = 3500
 
+log = get_logger("sse")
+
 
 def sse_event(data: dict, event: str = "message") -> str:
     return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
-class Session:
-    def __init__(self, session_id: str) -> None:
-        self.session_id = session_id
-        self.q: asyncio.Queue[str] = asyncio.Queue()
-        self.closed = False
-
-    async def publish(self, msg: str) -> None:
-        if not self.closed:
-            await self.q.put(msg)
-
-    def close(self) -> None:
-        self.closed = True
-
-class SessionManager:
-    def __init__(self) -> None:
-        self._sessions: Dict[str, Session] = {}
-        self._lock = asyncio.Lock()
-
-    async def get_or_create(self, session_id: str) -> Session:
-        async with self._lock:
-            s = self._sessions.get(session_id)
-            if s is None or s.closed:
-                s = Session(session_id)
-                self._sessions[session_id] = s
-            return s
-
-    async def publish(self, session_id: str, msg: str) -> None:
-        s = await self.get_or_create(session_id)
-        payload = {"session_id": session_id, "message": msg}
-        print("Publishing:", payload)
-        await s.publish(msg)
-
-    async def delete(self, session_id: str) -> bool:
-        async with self._lock:
-            s = self._sessions.pop(session_id, None)
-        if s:
-            s.close()
-            while not s.q.empty():
-                try:
-                    s.q.get_nowait()
-                    s.q.task_done()
-                except Exception:
-                    break
-            return True
-        return False
-
-    async def exists(self, session_id: str) -> bool:
-        async with self._lock:
-            return session_id in self._sessions
 
 SESSIONS = SessionManager()
 
@@ -73,15 +28,23 @@ def associate_user_session(user_id: str, session_id: str) -> None:
 def session_for_user(user_id: str) -> Optional[str]:
     return _USER_SESSION.get(user_id)
 
+@SESSIONS.on_close
+def _forget_session_users(session: Session) -> None:
+    # a deleted session must not keep receiving a user's notifications
+    for user_id in [u for u, sid in _USER_SESSION.items() if sid == session.session_id]:
+        _USER_SESSION.pop(user_id, None)
+
 
 # Convenience publishers
-async def publish_progress(session_id: str, token: str, progress: float) -> None:
+async def publish_progress(session_id: str, token: str, progress: float, total: Optional[float] = None) -> None:
     payload = {
         "jsonrpc": JSONRPC,
         "method": "notifications/progress",
         "params": {"progressToken": token, "progress": float(progress)},
     }
-    print(f"Publishing progress: {progress} (token: {token})")
+    if total is not None:
+        payload["params"]["total"] = float(total)
+    log.debug("publish progress", session_id=session_id, token=token, progress=progress)
     await SESSIONS.publish(session_id, sse_event(payload))
 
 async def publish_message(session_id: str, text: str, level: str = "info", extra: dict | None = None) -> None:
@@ -96,5 +59,5 @@ async def publish_message(session_id: str, text: str, level: str = "info", extra
     }
     if extra:
         payload["params"].update(extra)
-    print(f"Publishing message: {text} (session: {session_id})")
+    log.debug("publish message", session_id=session_id, level=level, text=truncate(text))
     await SESSIONS.publish(session_id, sse_event(payload))
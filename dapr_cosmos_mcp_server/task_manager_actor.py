@@ -4,24 +4,45 @@ from dapr.actor import ActorProxy, ActorId
 from .task_manager_actor_interface import TaskManagerActorInterface
 from .common_types import BackupConfig
 from .backup_actor_interface import BackupActorInterface
+from .retention_actor_interface import RetentionActorInterface
+from .backup_retention import ENABLED as RETENTION_ENABLED
 from .cosmosdb_helper import cosmosdb_query_items, cosmosdb_create_item
 import asyncio
 import isodate
-import uuid
+import os
+import hashlib
+import time
 from dataclasses import asdict
+from shared import metrics, tracing
+from shared.logs import get_logger, truncate
+
+log = get_logger("actor")
+
+# "per_file": one BackupActor per (server, file); "per_server": one per (task, server) covering
+# every file. A task item can choose with its own "backup_mode" field.
+BACKUP_ACTOR_MODE = os.getenv("BACKUP_ACTOR_MODE", "per_file")
+
+def per_file_actor_id(task_id: str, server_name: str, file_path: str) -> str:
+    """Stable BackupActor id for one (task, server, file), so a re-schedule re-arms the same actor."""
+    # file paths can contain '/', which actor ids (URL path segments) can't
+    digest = hashlib.sha1(file_path.encode("utf-8")).hexdigest()
+    return f"backup::{task_id}::{server_name}::{digest}"
+
+REMINDER_LAG = metrics.histogram("actor_reminder_lag_seconds", "Delay between a reminder's due time and its delivery")
 
 class TaskManagerActor(Actor, TaskManagerActorInterface, Remindable):
     def __init__(self, ctx, actor_id):
         super(TaskManagerActor, self).__init__(ctx, actor_id)
+        self._reminder_due: float | None = None
 
     async def _on_activate(self) -> None:
-        print(f'Activate {self.__class__.__name__} actor!', flush=True)
+        log.debug("activate", actor=self.__class__.__name__, actor_id=str(self.id))
 
     async def _on_deactivate(self) -> None:
-        print(f'Deactivate {self.__class__.__name__} actor!', flush=True)
+        log.debug("deactivate", actor=self.__class__.__name__, actor_id=str(self.id))
 
     async def set_reminder(self, enabled: bool) -> None:
-        print(f'set reminder to {enabled}', flush=True)
+        log.info("set_reminder", actor_id=str(self.id), enabled=enabled)
         if enabled:
             # register (persisted) reminder
             await self.register_reminder(
@@ -30,13 +51,13 @@ class TaskManagerActor(Actor, TaskManagerActorInterface, Remindable):
                 datetime.timedelta(seconds=5),  # first fire after 5s
                 datetime.timedelta(seconds=5),  # then every 5s
             )
+            self._reminder_due = time.time() + 5
         else:
             # idempotent unregister
             try:
                 await self.unregister_reminder('RetrieveTasksReminder')
             except Exception as e:
-                print(f'unregister_reminder ignored: {e}', flush=True)
-        print('set_reminder is done', flush=True)
+                log.debug("unregister_reminder ignored", actor_id=str(self.id), error=str(e))
 
 
     async def receive_reminder(
@@ -47,50 +68,80 @@ class TaskManagerActor(Actor, TaskManagerActorInterface, Remindable):
         period: datetime.timedelta,
         *args
     ) -> None:
-        print(f"Received reminder: {name}, state: {state}, due_time: {due_time}, period: {period}", flush=True)
+        log.debug("reminder", actor_id=str(self.id), name=name, period=str(period))
+        if self._reminder_due is not None:
+            REMINDER_LAG.observe(max(0.0, time.time() - self._reminder_due), actor="TaskManagerActor")
+            self._reminder_due = None
         await self.unregister_reminder('RetrieveTasksReminder')
 
-        print(f"TaskManagerActor Id: {self.id}")
+        with tracing.start_span("TaskManagerActor.schedule_backups", kind="consumer", actor_id=str(self.id)):
+            await self._schedule_backups()
+
+    async def _schedule_backups(self) -> None:
         backup_items = await self.get_tasks()
-        print("Retrieved backup items:", backup_items)
         if backup_items:
             for item in backup_items:
-
-                server_list = item.get('servers', [])
-                for s in server_list:
-                    file_list = item.get('files', [])
+                backup_frequency_pth = item.get('backup_frequency_pth', 'daily')
+                duration = isodate.parse_duration(backup_frequency_pth)
+                seconds = duration.total_seconds()
+                file_list = item.get('files', [])
+                mode = item.get('backup_mode') or BACKUP_ACTOR_MODE
+                for s in item.get('servers', []):
+                    if mode == "per_server":
+                        # one actor (reminder, state record, status write) for the server's whole file set;
+                        # the id is stable so re-running setup re-arms the same actor
+                        log.info("scheduling backup", actor_id=str(self.id), server=s, files=len(file_list), every_seconds=seconds)
+                        backup_config = BackupConfig(
+                            user_id=item.get('user_id'),
+                            id=item.get('id'),
+                            server_name=s,
+                            file_path=", ".join(file_list),
+                            backup_frequency=seconds,
+                            files=list(file_list),
+                            compression=item.get('compression', ''),
+                        )
+                        await self._schedule(ActorId(f"backup::{item.get('id')}::{s}"), backup_config)
+                        continue
                     for f in file_list:
-                        backup_id = ActorId(f"backup::{str(uuid.uuid4())}")
-                        backup_proxy = ActorProxy.create('BackupActor', backup_id, BackupActorInterface)
-                        backup_frequency_pth = item.get('backup_frequency_pth', 'daily')
-                        duration = isodate.parse_duration(backup_frequency_pth)
-                        seconds = duration.total_seconds()
-                        print(f"Scheduling backup for file {f} on server {s} every {seconds} seconds", flush=True)
-                        #  "backup_frequency_pth": "PT30S",
-                        # convert p
-                        
+                        log.info("scheduling backup", actor_id=str(self.id), file=f, server=s, every_seconds=seconds)
                         backup_config = BackupConfig(
                             user_id=item.get('user_id'),
                             id=item.get('id'),
                             server_name=s,
                             file_path=f,
-                            backup_frequency=seconds
+                            backup_frequency=seconds,
+                            compression=item.get('compression', ''),
                         )
-                        await backup_proxy.InitBackup(asdict(backup_config))
-                        await backup_proxy.SetReminder(True)
+                        await self._schedule(ActorId(per_file_actor_id(item.get('id'), s, f)), backup_config)
+                if RETENTION_ENABLED:
+                    await self._schedule_retention(item)
 
-    async def get_tasks(self) -> list:
+    async def _schedule(self, backup_id: ActorId, backup_config: BackupConfig) -> None:
+        backup_proxy = ActorProxy.create('BackupActor', backup_id, BackupActorInterface)
+        with tracing.start_span("actor BackupActor.ScheduleBackup", kind="client", actor_id=str(backup_id)):
+            await backup_proxy.ScheduleBackup(tracing.inject(asdict(backup_config)))
+
+    async def _schedule_retention(self, item: dict) -> None:
+        # one RetentionActor per user; the task item may carry its own "retention" policy
+        user_id = item.get('user_id')
+        retention_proxy = ActorProxy.create('RetentionActor', ActorId(str(user_id)), RetentionActorInterface)
+        with tracing.start_span("actor RetentionActor.ScheduleRetention", kind="client", actor_id=str(user_id)):
+            await retention_proxy.ScheduleRetention(tracing.inject({
+                "backup_task_id": item.get('id'),
+                "policy": item.get('retention') or {},
+            }))
 
-        print(f"TaskManagerActor: {self.id} Retrieving tasks...")
+    async def get_tasks(self) -> list:
 
         query = f"SELECT * FROM c where c.user_id = '{self.id}' and c.task = 'Backup files'"
         tasks = await cosmosdb_query_items(query)
-        print(f"TaskManagerActor: {self.id} Retrieved tasks:", tasks)
+        log.info("retrieved tasks", actor_id=str(self.id), count=len(tasks))
+        log.debug("retrieved task rows", actor_id=str(self.id), rows=truncate(tasks))
         return tasks
 
     async def run_tasks(self) -> None:
         tasks = await self.get_tasks()
         for task in tasks:
-            print("Running task:", task)
+            log.debug("running task", actor_id=str(self.id), task_id=task.get("id"))
             # Simulate task processing
             await asyncio.sleep(1)
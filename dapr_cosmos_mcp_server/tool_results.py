@@ -0,0 +1,108 @@
+from __future__ import annotations
+import json
+import os
+import re
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Tuple
+
+from shared import metrics
+
+# Query results shaped for the LLM rather than returned as raw documents.
+#
+# `SELECT * FROM c ...` is rewritten to select only the fields of the backup
+# task and status schemas, so Cosmos doesn't ship the system properties
+# (_rid, _self, _etag, _attachments) at all; anything that still carries them
+# (custom projections, VALUE c) loses them before encoding. `_ts` is the only
+# time a status record has, so it is kept as an ISO-8601 `updated_at`. Lists of
+# documents are encoded as one table: a column header, one line per row, and
+# columns with the same value in every row hoisted above the table. Past
+# TOOL_RESULT_MAX_ROWS rows the rest is summarized as "N more".
+#
+#   TOOL_RESULT_FORMAT=table     "json" keeps one compact JSON document per result (still projected and capped)
+#   TOOL_RESULT_MAX_ROWS=50      rows returned to the LLM per query
+
+RESULT_FORMAT = os.getenv("TOOL_RESULT_FORMAT", "table").lower()
+MAX_ROWS = int(os.getenv("TOOL_RESULT_MAX_ROWS", "50"))
+
+TOOL_RESULT_BYTES = metrics.counter("mcp_tool_result_bytes_total", "Tool result size in bytes by tool and form (raw, shaped)")
+TOOL_RESULT_ROWS = metrics.counter("mcp_tool_result_rows_total", "Query rows by tool and outcome (returned, omitted)")
+
+# fields of the backup task documents (create_backup_task), BackupTaskStatus records and latest-status views
+SCHEMA_FIELDS = (
+    "id", "user_id", "task", "files", "servers", "backup_frequency_pth", "backup_mode", "compression",
+    "backup_task_id", "server_name", "file_path", "backup_path", "status",
+    "codec", "original_bytes", "stored_bytes", "duration_s", "doc_type", "runs", "failures", "_ts",
+)
+
+_SELECT_STAR_RE = re.compile(r"^\s*SELECT\s+(TOP\s+\d+\s+)?\*\s+FROM\s+c\b", re.IGNORECASE)
+_JOIN_RE = re.compile(r"\bJOIN\b", re.IGNORECASE)
+
+
+def project_query(query: str) -> str:
+    """`SELECT [TOP n] * FROM c ...` with the schema fields in place of `*`; other queries unchanged."""
+    if _JOIN_RE.search(query):
+        return query  # `*` over a join yields one object per alias, not documents
+    fields = ", ".join(f"c.{f}" for f in SCHEMA_FIELDS)
+    return _SELECT_STAR_RE.sub(lambda m: f"SELECT {m.group(1) or ''}{fields} FROM c", query, count=1)
+
+
+def strip_system_fields(row: Any) -> Any:
+    if not isinstance(row, dict):
+        return row
+    out = {k: v for k, v in row.items() if not k.startswith("_")}
+    if isinstance(row.get("_ts"), (int, float)):
+        out["updated_at"] = datetime.fromtimestamp(row["_ts"], timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    return out
+
+
+def _cell(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, list) and all(isinstance(v, (str, int, float)) for v in value):
+        text = ", ".join(str(v) for v in value)
+    elif isinstance(value, (dict, list)):
+        text = json.dumps(value, separators=(",", ":"), default=str)
+    else:
+        text = str(value)
+    return text.replace("\n", " ").replace("|", "\\|")
+
+
+def _table(rows: List[Dict[str, Any]], total: int) -> str:
+    columns: List[str] = []
+    for row in rows:
+        columns.extend(k for k in row if k not in columns)
+    lines: List[str] = []
+    if len(rows) > 1:
+        constant = [c for c in columns if all(c in r for r in rows) and len({_cell(r[c]) for r in rows}) == 1]
+        lines.extend(f"{c}: {_cell(rows[0][c])} (all rows)" for c in constant)
+        columns = [c for c in columns if c not in constant]
+    lines.append(f"rows: {len(rows)} of {total}")
+    if columns:
+        lines.append(" | ".join(columns))
+        lines.extend(" | ".join(_cell(row.get(c)) for c in columns) for row in rows)
+    return "\n".join(lines)
+
+
+def shape_rows(tool: str, items: List[Any]) -> Tuple[str, Dict[str, int]]:
+    """The LLM-facing text for query result `items`, and its size report (rows, raw and shaped bytes)."""
+    raw_bytes = len(str(items).encode())
+    rows = [strip_system_fields(it) for it in items]
+    shown, omitted = rows[:MAX_ROWS], max(0, len(rows) - MAX_ROWS)
+    if not rows:
+        text = "rows: 0"
+    elif all(not isinstance(r, dict) for r in shown):
+        # scalar results (SELECT VALUE COUNT(1) ...)
+        text = "\n".join(_cell(r) for r in shown)
+    elif RESULT_FORMAT == "json":
+        text = json.dumps(shown, separators=(",", ":"), default=str)
+    else:
+        text = _table([r if isinstance(r, dict) else {"value": r} for r in shown], len(rows))
+    if omitted:
+        text += f"\n… {omitted} more rows not shown (narrow the query, or use COUNT for totals)"
+    shaped_bytes = len(text.encode())
+    TOOL_RESULT_BYTES.inc(raw_bytes, tool=tool, form="raw")
+    TOOL_RESULT_BYTES.inc(shaped_bytes, tool=tool, form="shaped")
+    TOOL_RESULT_ROWS.inc(len(shown), tool=tool, outcome="returned")
+    if omitted:
+        TOOL_RESULT_ROWS.inc(omitted, tool=tool, outcome="omitted")
+    return text, {"rows": len(rows), "omitted": omitted, "raw_bytes": raw_bytes, "shaped_bytes": shaped_bytes}
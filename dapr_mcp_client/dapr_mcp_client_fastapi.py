@@ -8,7 +8,7 @@ import socket
 from fastapi import FastAPI, Request, BackgroundTasks, Response
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
-from starlette.responses import StreamingResponse
+from starlette.responses import StreamingResponse, PlainTextResponse, JSONResponse
 from pydantic import BaseModel
 import json
 import asyncio
@@ -22,40 +22,76 @@ from openai import AzureOpenAI, AsyncAzureOpenAI
 from azure.cosmos.aio import CosmosClient
 from azure.cosmos import PartitionKey, exceptions
 import uuid
-import httpx, re, sys
+import httpx, re, sys, time
 from .mcp_client import MCPClient
-from .sse_bus import SESSIONS, sse_event, JSONRPC, publish_progress, publish_message, associate_user_session
+from .intent_parser import FAST_PATH, BackupIntent, parse_backup_request
+from .prompting import PromptBuilder, PromptTooLarge, cached_prompt_tokens, count_tokens, message_tokens
+from .response_cache import RESPONSE_CACHE
+from .llm_gateway import GATEWAY, DEADLINE_SECONDS as LLM_DEADLINE_SECONDS, LLMUnavailable
+from .sse_bus import SESSIONS, sse_event, JSONRPC, SSE_RETRY_MS, Keepalive, publish_progress, publish_message, associate_user_session
 from typing import Any, Dict, List
+from shared import metrics, tracing
+from shared.logs import get_logger, truncate
+from shared.readiness import READINESS
 
 load_dotenv()
+
+log = get_logger("client")
+tracing.configure("mcp-client")
+
+LLM_LATENCY = metrics.histogram("llm_request_duration_seconds", "Azure OpenAI chat completion latency")
+LLM_TOKENS = metrics.counter("llm_tokens_total", "Azure OpenAI tokens by kind")
+MCP_TOOL_LATENCY = metrics.histogram("mcp_client_tool_duration_seconds", "MCP tool call latency seen by the client")
+CONVERSATION_LATENCY = metrics.histogram("conversation_duration_seconds", "End-to-end /conversation latency")
+TOOL_RESULT_TOKENS = metrics.counter("llm_tool_result_tokens_total", "Tokens of tool results fed back to the LLM by tool")
+FAST_PATH_TURNS = metrics.counter("conversation_fast_path_total", "Conversation turns by route (fast_path, llm, fast_path_error, cache)")
 aoai_endpoint    = os.getenv("ENDPOINT_URL",    "https://aihub6750316290.cognitiveservices.azure.com/")
 aoai_deployment  = os.getenv("DEPLOYMENT_NAME", "gpt-4o")
 aoai_api_version = os.getenv("AZURE_OPENAI_API_VERSION", "2024-02-15-preview")
-aoai_credential =  AzureCliCredential() # login with azd login # DefaultAzureCredential()
-token_provider = get_bearer_token_provider(aoai_credential, "https://cognitiveservices.azure.com/.default")
-aoai_client = AsyncAzureOpenAI(azure_endpoint=aoai_endpoint, azure_ad_token_provider=token_provider,
-                               api_version=aoai_api_version)
+AOAI_SCOPE = "https://cognitiveservices.azure.com/.default"
+# built on first use (or by the background "llm" readiness step), not at import time
+aoai_credential: AzureCliCredential | None = None
+aoai_client: AsyncAzureOpenAI | None = None
+
+
+def get_aoai_client() -> AsyncAzureOpenAI:
+    global aoai_credential, aoai_client
+    if aoai_client is None:
+        aoai_credential = AzureCliCredential() # login with azd login # DefaultAzureCredential()
+        token_provider = get_bearer_token_provider(aoai_credential, AOAI_SCOPE)
+        # retries belong to the gateway (llm_gateway.py), which queues them with everyone else's calls
+        aoai_client = AsyncAzureOpenAI(azure_endpoint=aoai_endpoint, azure_ad_token_provider=token_provider,
+                                       api_version=aoai_api_version, max_retries=0)
+    return aoai_client
+
+
+async def warm_llm() -> None:
+    """Build the client and fetch the first token (`az` round trip) before the first conversation needs it."""
+    get_aoai_client()
+    if aoai_credential is not None:
+        await aoai_credential.get_token(AOAI_SCOPE)
 POD = socket.gethostname()
 REV = os.getenv("CONTAINER_APP_REVISION", "v0.1")
 
 MCP_ENDPOINT = os.getenv("MCP_ENDPOINT", "http://localhost:3000/mcp") # Dapr endpoint
 #mcp_cli = MCPClient(mcp_endpoint=MCP_ENDPOINT)
 
-print(f"Starting FastAPI server on {POD} with revision {REV}")
-print(f"Azure OpenAI Endpoint: {aoai_endpoint}")
+log.info("starting MCP client", pod=POD, rev=REV, aoai_endpoint=aoai_endpoint)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Do any initialization tasks here
     try:
         #await mcp_cli.connect()
-        pass
+        await READINESS.setup("llm", warm_llm)
     except Exception as e:
-        print(f"Error connecting to MCP: {e}")
+        log.error("error warming up the LLM client", error=str(e))
         raise e
-    finally:
+    try:
         yield
-    
+    finally:
+        await READINESS.shutdown()
+
 app = FastAPI(lifespan=lifespan)
 
 
@@ -79,6 +115,21 @@ app.add_middleware(
 async def status(request: Request):
     return {"status": "ok"}
 
+@app.get("/readyz")
+async def readyz():
+    # 503 until the LLM credential has its first token, with per-step progress
+    snapshot = READINESS.snapshot()
+    return JSONResponse(snapshot, status_code=200 if snapshot["ready"] else 503)
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    return PlainTextResponse(metrics.render_latest(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/debug/traces")
+async def debug_traces(trace_id: str | None = None, limit: int = 200):
+    # recent spans from the in-memory exporter (local troubleshooting)
+    return {"service": tracing.TRACER.service, "spans": tracing.TRACER.memory.recent(trace_id, limit)}
+
 def _normalize_session_id(raw: str | None, default: str = "default") -> str:
     if not raw:
         return default
@@ -88,35 +139,26 @@ def _normalize_session_id(raw: str | None, default: str = "default") -> str:
 async def sse_events(request: Request):
     sid = request.query_params.get("sid")  
     session_id = _normalize_session_id(sid)
-    print(f"[@app.get(/events)] session={session_id} pod={POD} rev={REV}", flush=True)
+    log.info("GET /events", session_id=session_id, pod=POD, rev=REV)
+    # browsers send Last-Event-ID on auto-reconnect; `last_event_id` lets a fresh
+    # EventSource resume explicitly
+    last_event_id = request.headers.get("Last-Event-ID") or request.query_params.get("last_event_id")
     session = await SESSIONS.get_or_create(session_id)
 
+    keepalive = Keepalive.for_stream(request.headers, request.query_params)
+
     async def event_stream():
+        subscriber = session.subscribe(last_event_id)
+        if subscriber.missed:
+            log.warning("GET /events resumed after evicted events", session_id=session_id, missed=subscriber.missed)
         # flush headers immediately (APIM/ACA friendly)
-        yield "event: open\ndata: {}\n\n"
-
-        heartbeat_every = 1.0  # seconds
-        while True:
-            if await request.is_disconnected():
-                break
-            try:
-                # wait up to heartbeat interval for next message
-                #msg = await asyncio.wait_for(session.q.get(), timeout=heartbeat_every)
-                try:
-                    msg = session.q.get_nowait()
-                    print(f"[@app.get(/events)] MCP CLIENT SSE YIELD session={session_id} msg={msg}...", flush=True)
-                except asyncio.QueueEmpty:
-                    yield "event: noevent\ndata: {}\n\n"
-                    await asyncio.sleep(heartbeat_every)
-                    continue
-                #msg = sse_event(payload, event="assistant")
-                print(f"[@app.get(/events)] SSE YIELD {msg}")
-                yield msg
-                #await asyncio.sleep(5)
-                #session.q.task_done()
-            except asyncio.TimeoutError:
-                # heartbeat (SSE comment doesn't disturb clients)
-                yield "server version 1.0: ping\n\n"
+        yield f"retry: {SSE_RETRY_MS}\nevent: open\ndata: {{}}\n\n"
+        try:
+            # frames as they arrive, `: keepalive` comments only when idle
+            async for chunk in subscriber.stream(keepalive):
+                yield chunk
+        finally:
+            subscriber.close()
 
     return StreamingResponse(
         event_stream(),
@@ -137,7 +179,7 @@ For creating backup tasks use the criteria below strictly:
 You must break down user input into granular, actionable tasks in JSON format and (when parseable)
 Call the provided tool based on the user input. 
 
-This is from user id : {user_id}
+The user id is given in the system message after these instructions.
 
 Schema:
 automation_tasks = [
@@ -197,15 +239,28 @@ Use the tool query_backup_tasks to create a Cosmos DB SQL API query. The cosmos
 E.g Cosmos DB SQL API Query:
 SELECT VALUE COUNT(1) FROM c WHERE c.user_id = @user_id
 
+For the status of backups (latest result, last run, failures, bytes), call get_backup_status with the user id
+instead of querying status records. For statistics over time (success rate, durations, bytes per server or file,
+where failures cluster), call backup_stats with the user id.
 
 Use the results to provide the response to the user. 
 
 If the response is simple text, render the response as HTML paragraph.
-If the response is json, render the response as HTML table.
+If the response is json or a table (a header line of columns separated by |, then one line per row), render the response as HTML table.
 
 
 """
 
+# static for every user and turn, so provider prompt caching can reuse it; the
+# user id follows in a separate system message (user_context)
+SYSTEM_PREFIX = system_message.format()
+prompt_builder = PromptBuilder(SYSTEM_PREFIX)
+
+
+def user_context(user_id: str) -> str:
+    return f"This is from user id : {user_id}"
+
+
 class ConversationIn(BaseModel):
     user_query: str
     #client_id: str
@@ -215,10 +270,7 @@ async def call_mcp_tool(mcp_client, message):
         for tc in message.tool_calls:
             tool_name = tc.function.name
             tool_args = json.loads(tc.function.arguments)
-            
-            print(f"Calling tool: {tool_name} with args: {tool_args}")
-
-            result = await mcp_client.session.call_tool(tool_name, tool_args)
+            result = await _call_tool(mcp_client, tool_name, tool_args)
             return result, tool_name, tool_args, tc.id
     return None, None, None, None
 
@@ -239,13 +291,121 @@ class SessionManager:
 # single, long-lived manager you reuse (e.g., module-level or injected)
 session_manager = SessionManager()
 
+
+BUSY_MESSAGE = "<p>I'm handling a lot of requests right now. Please try again in a moment.</p>"
+
+
+async def _chat_completion(call: str, prompt=None, *, user_id: str, deadline: float, **kwargs):
+    """
+    chat.completions.create through the LLM gateway, with latency and token
+    accounting; `prompt` (a prompting.Prompt) supplies the messages. Raises
+    LLMUnavailable when the gateway gives up before `deadline`.
+    """
+    if prompt is not None:
+        kwargs["messages"] = prompt.messages
+    estimated = prompt.tokens if prompt is not None else sum(message_tokens(m) for m in kwargs.get("messages", []))
+    # the service counts max_tokens against the deployment's token-per-minute limit up front
+    cost = estimated + kwargs.get("max_tokens", 0)
+
+    async def create():
+        started = time.perf_counter()
+        try:
+            return await get_aoai_client().chat.completions.create(**kwargs)
+        finally:
+            LLM_LATENCY.observe(time.perf_counter() - started, call=call)
+
+    with tracing.start_span(f"llm {call}", kind="client", model=kwargs.get("model")) as span:
+        span.set_attribute("llm.estimated_prompt_tokens", estimated)
+        response = await GATEWAY.call(create, user=user_id, cost=cost, deadline=deadline)
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+            completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+            LLM_TOKENS.inc(prompt_tokens, kind="prompt")
+            LLM_TOKENS.inc(completion_tokens, kind="completion")
+            span.set_attribute("llm.prompt_tokens", prompt_tokens)
+            span.set_attribute("llm.completion_tokens", completion_tokens)
+            # prompt tokens served from the provider's prefix cache
+            cached = cached_prompt_tokens(usage)
+            if cached is not None:
+                LLM_TOKENS.inc(cached, kind="cached_prompt")
+                span.set_attribute("llm.cached_prompt_tokens", cached)
+    return response
+
+
+def _tool_text(result) -> str:
+    content = getattr(result, "content", None)
+    if isinstance(content, list):
+        return " ".join(getattr(c, "text", "") for c in content if getattr(c, "text", None))
+    return str(content if content is not None else result)
+
+
+async def _call_tool(mcp_cli: MCPClient, tool_name: str, tool_args: Dict[str, Any]):
+    log.info("calling tool", tool=tool_name, args=truncate(tool_args))
+    with MCP_TOOL_LATENCY.time(tool=tool_name), \
+            tracing.start_span(f"mcp call_tool {tool_name}", kind="client", tool=tool_name):
+        return await mcp_cli.call_tool(tool_name, tool_args)
+
+
+async def _fast_path(mcp_cli: MCPClient, intent: BackupIntent, user_id: str, session_id: str,
+                     user_query: str) -> Dict[str, Any]:
+    """The create → setup tool chain the LLM would run for a parsed backup request, without the LLM."""
+    with tracing.start_span("fast_path backup_request", files=len(intent.files), servers=len(intent.servers)):
+        task = intent.task(user_id)
+        created = await _call_tool(mcp_cli, "create_backup_task", {"backup_task_details": json.dumps([task])})
+        RESPONSE_CACHE.invalidate(user_id, "create_backup_task")
+        created_text = _tool_text(created)
+        if getattr(created, "isError", False) or "success" not in created_text.lower():
+            FAST_PATH_TURNS.inc(route="fast_path_error")
+            content = f"<p>{created_text}</p>"
+        else:
+            setup = await _call_tool(mcp_cli, "setup_backup_task_agent", {"user_id": user_id})
+            RESPONSE_CACHE.invalidate(user_id, "setup_backup_task_agent")
+            # no LLM round trip follows, so wait for the tools' end markers before closing
+            await mcp_cli.drain()
+            FAST_PATH_TURNS.inc(route="fast_path")
+            content = (f"<p>Backup task created: {', '.join(intent.files)} on {', '.join(intent.servers)}, "
+                       f"every {intent.backup_frequency_pth}. {_tool_text(setup)}.</p>")
+    session_manager.append(session_id, user_id, "user", user_query)
+    session_manager.append(session_id, user_id, "assistant", content)
+    log.info("final assistant text", user_id=user_id, text=truncate(content), route="fast_path")
+    return {"llm_response": [content]}
+
+
 async def handle_user_query(user_id: str, user_query: str, session_id: str) -> Dict[str, Any]:
+    # root span of the conversation turn; MCPClient.connect forwards it as a traceparent header
+    with tracing.start_span("conversation", kind="server", user_id=user_id, session_id=session_id) as span:
+        result = await _handle_user_query(user_id, user_query, session_id)
+        span.set_attribute("trace_id", span.trace_id)
+        return result
+
+
+async def _handle_user_query(user_id: str, user_query: str, session_id: str) -> Dict[str, Any]:
+    # read-only questions answered recently (and not since invalidated by a write) skip MCP and the LLM
+    generation = RESPONSE_CACHE.generation(user_id)
+    cached = RESPONSE_CACHE.get(user_id, user_query)
+    if cached is not None:
+        FAST_PATH_TURNS.inc(route="cache")
+        session_manager.append(session_id, user_id, "user", user_query)
+        session_manager.append(session_id, user_id, "assistant", " ".join(cached))
+        log.info("final assistant text", user_id=user_id, text=truncate(" ".join(cached)), route="cache")
+        return {"llm_response": cached}
+
+    # every LLM call of this turn, queueing and retries included, shares one deadline
+    deadline = time.monotonic() + LLM_DEADLINE_SECONDS
     # Connect MCP
     mcp_cli = MCPClient(mcp_endpoint=MCP_ENDPOINT)
     mcp_cli.set_broadcast_session(session_id)
     await mcp_cli.connect(session_id=session_id)
 
     try:
+        # well-formed "backup <files> on <servers> every <n units>" requests skip the LLM
+        intent = parse_backup_request(user_query) if FAST_PATH else None
+        tool_names = {t.name for t in mcp_cli.mcp_tools.tools}
+        if intent and {"create_backup_task", "setup_backup_task_agent"} <= tool_names:
+            return await _fast_path(mcp_cli, intent, user_id, session_id, user_query)
+        FAST_PATH_TURNS.inc(route="llm")
+
         # Build available tool schema for the model
         available_tools = [
             {
@@ -258,21 +418,35 @@ async def handle_user_query(user_id: str, user_query: str, session_id: str) -> D
             }
             for t in mcp_cli.mcp_tools.tools
         ]
-        print("Available tools:", available_tools)
-
-        # Build message list from stored history + current user input
-        history = session_manager.get_history(session_id, user_id)
-        system_msg = {"role": "system", "content": system_message.format(user_id=user_id)}
-        msgs: List[Dict[str, Any]] = [system_msg, *history, {"role": "user", "content": user_query}]
+        log.debug("available tools", tools=[t["function"]["name"] for t in available_tools])
+
+        # static prefix + tools, then user context, history and this turn (see prompting.py)
+        # snapshot: this turn's messages are appended to the stored history below
+        history = list(session_manager.get_history(session_id, user_id))
+        context = user_context(user_id)
+        # this turn: the query, then each tool call and its result
+        msgs: List[Dict[str, Any]] = [{"role": "user", "content": user_query}]
+        try:
+            prompt = prompt_builder.build(context, history, msgs, available_tools)
+        except PromptTooLarge as e:
+            log.warning("prompt over budget", user_id=user_id, error=str(e))
+            return {"llm_response": ["<p>That request is too long for me to process. Please shorten it.</p>"]}
 
         # First LLM call
-        response = await aoai_client.chat.completions.create(
-            model=aoai_deployment,
-            messages=msgs,
-            tools=available_tools,
-            # Azure OpenAI Chat Completions uses `max_tokens`
-            max_tokens=4000,
-        )
+        try:
+            response = await _chat_completion(
+                "initial",
+                prompt,
+                user_id=user_id,
+                deadline=deadline,
+                model=aoai_deployment,
+                tools=available_tools,
+                # Azure OpenAI Chat Completions uses `max_tokens`
+                max_tokens=4000,
+            )
+        except LLMUnavailable as e:
+            log.warning("llm unavailable", user_id=user_id, reason=e.reason, error=str(e))
+            return {"llm_response": [BUSY_MESSAGE]}
 
         choice = response.choices[0]
         message = choice.message
@@ -282,6 +456,9 @@ async def handle_user_query(user_id: str, user_query: str, session_id: str) -> D
 
         # Collect assistant text outputs (across potential tool call turns)
         final_text: List[str] = []
+        # tools run this turn, and whether the model got to its final answer (both decide caching)
+        tools_used: List[str] = []
+        complete = False
 
         # Safety: cap iterative tool-call loop
         for _ in range(16):
@@ -297,6 +474,7 @@ async def handle_user_query(user_id: str, user_query: str, session_id: str) -> D
                 if content:
                     final_text.append(content)
                     session_manager.append(session_id, user_id, "assistant", content)
+                complete = True
                 break
 
             # Otherwise, execute the tool(s) one-by-one (or your call_mcp_tool batches them)
@@ -312,6 +490,11 @@ async def handle_user_query(user_id: str, user_query: str, session_id: str) -> D
                     final_text.append(content)
                     session_manager.append(session_id, user_id, "assistant", content)
                 break
+            tools_used.append(tool_name)
+            RESPONSE_CACHE.invalidate(user_id, tool_name)
+            # the text of the result, not the SDK objects' repr
+            tool_text = _tool_text(result)
+            TOOL_RESULT_TOKENS.inc(count_tokens(tool_text), tool=tool_name)
 
             # Feed the tool result back
             # Ensure we keep using the same `msgs` list (not an undefined `messages`)
@@ -333,34 +516,51 @@ async def handle_user_query(user_id: str, user_query: str, session_id: str) -> D
                     {
                         "role": "tool",
                         "tool_call_id": tc_id,
-                        "content": getattr(result, "content", str(result)),
+                        "content": tool_text,
                     },
                 ]
             )
 
-            follow_up = await aoai_client.chat.completions.create(
-                model=aoai_deployment,
-                messages=msgs,
-                tools=available_tools,
-                max_tokens=4000,
-            )
+            try:
+                prompt = prompt_builder.build(context, history, msgs, available_tools)
+            except PromptTooLarge as e:
+                log.warning("prompt over budget", user_id=user_id, error=str(e))
+                break
+            try:
+                follow_up = await _chat_completion(
+                    "follow_up",
+                    prompt,
+                    user_id=user_id,
+                    deadline=deadline,
+                    model=aoai_deployment,
+                    tools=available_tools,
+                    max_tokens=4000,
+                )
+            except LLMUnavailable as e:
+                # the tool calls so far have run; say so rather than failing the turn
+                log.warning("llm unavailable", user_id=user_id, reason=e.reason, error=str(e))
+                final_text.append(f"<p>{tool_name} ran, but I couldn't finish the reply.</p>" + BUSY_MESSAGE)
+                break
             follow_up_choice = follow_up.choices[0]
             message = follow_up_choice.message
 
-        print(f"[handle_user_query] Final assistant text: {final_text}")
+        if complete:
+            RESPONSE_CACHE.put(user_id, user_query, final_text, tools_used, generation)
+        log.info("final assistant text", user_id=user_id, text=truncate(" ".join(final_text)))
         return {"llm_response": final_text}
 
     finally:
         # Optional: close MCP connection if your client needs explicit cleanup
         with contextlib.suppress(Exception):
-            await mcp_cli.close()
+            await mcp_cli.aclose()
 
 @app.post("/conversation/{user_id}")
 async def start_conversation(user_id: str, convo: ConversationIn,  request: Request):
    if not user_id:
        return Response(content="user_id is required", status_code=400)
-   print(f"Starting conversation for user_id={user_id}")
-   return await handle_user_query(user_id, convo.user_query, session_id=user_id)
+   log.info("starting conversation", user_id=user_id)
+   with CONVERSATION_LATENCY.time():
+       return await handle_user_query(user_id, convo.user_query, session_id=user_id)
 
 
 
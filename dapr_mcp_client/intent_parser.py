@@ -0,0 +1,119 @@
+from __future__ import annotations
+import os
+import re
+import uuid
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+# Deterministic parser for the common backup request
+#
+#   "backup x, y on server 1, server 2 every 5 minutes"
+#
+# matching the schema and frequency rules of `system_message`. It only answers
+# when the whole input fits the grammar; anything else (questions, negations,
+# "except", "every other day", ...) returns None and goes to the LLM.
+#
+#   FAST_PATH=on   handle matching requests without the LLM ("off" sends everything to the LLM)
+
+FAST_PATH = os.getenv("FAST_PATH", "on").lower() not in {"off", "0", "false", "no"}
+
+_REQUEST_RE = re.compile(
+    r"""^\s*(?:please\s+)?(?:can\s+you\s+)?
+        (?:back\s*up|backup)\s+
+        (?:the\s+)?(?:files?\s+)?(?P<files>.+?)\s+
+        (?:on|from)\s+(?:the\s+)?(?P<servers>.+?)\s+
+        (?P<freq>every\s+.+?|hourly|daily|weekly)
+        \s*(?:please)?\s*[.!]?\s*$""",
+    re.IGNORECASE | re.VERBOSE,
+)
+# a file or server name: a few words of plain name characters, no punctuation that carries meaning
+_NAME_RE = re.compile(r"^[\w.\-/]+(?: [\w.\-/]+){0,2}$")
+# connecting words inside a "name" mean the sentence says more than the grammar covers ("s1 at 5pm")
+_NAME_STOPWORDS = {"at", "in", "on", "to", "for", "by", "with", "from", "of", "each", "every", "starting", "am", "pm"}
+_LIST_SPLIT_RE = re.compile(r"\s*(?:,|&|\band\b)\s*", re.IGNORECASE)
+# words that change the meaning in ways the grammar does not model
+_HEDGE_RE = re.compile(r"\b(?:not|don'?t|except|unless|but|if|only|between|until|other|then|instead)\b|\?", re.IGNORECASE)
+
+_UNITS = {
+    "s": "S", "sec": "S", "secs": "S", "second": "S", "seconds": "S",
+    "m": "M", "min": "M", "mins": "M", "minute": "M", "minutes": "M",
+    "h": "H", "hr": "H", "hrs": "H", "hour": "H", "hours": "H",
+    "d": "D", "day": "D", "days": "D",
+    "w": "W", "wk": "W", "wks": "W", "week": "W", "weeks": "W",
+}
+_ADVERBS = {"hourly": "PT1H", "daily": "P1D", "weekly": "P1W"}
+_PART_RE = re.compile(r"(\d+)?\s*([a-z]+)", re.IGNORECASE)
+
+
+@dataclass
+class BackupIntent:
+    files: List[str]
+    servers: List[str]
+    backup_frequency_pth: str
+
+    def task(self, user_id: str) -> Dict[str, object]:
+        """One automation_tasks entry, as the LLM would produce it."""
+        return {
+            "user_id": user_id,
+            "id": str(uuid.uuid4()),
+            "task": "Backup files",
+            "files": list(self.files),
+            "servers": list(self.servers),
+            "backup_frequency_pth": self.backup_frequency_pth,
+        }
+
+
+def to_iso_duration(phrase: str) -> Optional[str]:
+    """"every 1 hour 30 minutes" / "every 30s" / "weekly" -> ISO-8601 duration; None if not understood."""
+    phrase = phrase.strip().lower()
+    if phrase in _ADVERBS:
+        return _ADVERBS[phrase]
+    if not phrase.startswith("every "):
+        return None
+    rest = re.sub(r"\band\b|,", " ", phrase[len("every "):])
+    amounts: Dict[str, int] = {}
+    pos = 0
+    for m in _PART_RE.finditer(rest):
+        if rest[pos:m.start()].strip():
+            return None  # something between parts we did not parse
+        pos = m.end()
+        unit = _UNITS.get(m.group(2))
+        if unit is None or unit in amounts:
+            return None
+        amounts[unit] = int(m.group(1)) if m.group(1) else 1
+        if m.group(1) is None and len(amounts) > 1:
+            return None  # "every hour minutes"
+    if rest[pos:].strip() or not amounts or not any(amounts.values()):
+        return None
+    if "W" in amounts and len(amounts) == 1:
+        return f"P{amounts['W']}W"
+    days = amounts.get("D", 0) + 7 * amounts.get("W", 0)  # ISO-8601 has no weeks mixed with other units
+    date = f"{days}D" if days else ""
+    time = "".join(f"{amounts[u]}{u}" for u in ("H", "M", "S") if amounts.get(u))
+    return "P" + date + (f"T{time}" if time else "")
+
+
+def _names(raw: str) -> Optional[List[str]]:
+    names = [n.strip() for n in _LIST_SPLIT_RE.split(raw.strip())]
+    if not names or any(not n or not _NAME_RE.match(n) for n in names):
+        return None
+    if any(w.lower() in _NAME_STOPWORDS for n in names for w in n.split()):
+        return None
+    return names
+
+
+def parse_backup_request(text: str) -> Optional[BackupIntent]:
+    """The request as a BackupIntent when it fully matches the backup grammar, else None."""
+    if _HEDGE_RE.search(text):
+        return None
+    m = _REQUEST_RE.match(text)
+    if not m:
+        return None
+    servers_raw = m.group("servers")
+    if re.match(r"servers\b", servers_raw, re.IGNORECASE):
+        return None  # "servers 1, 2": the LLM decides whether that means "server 1", "server 2"
+    files, servers = _names(m.group("files")), _names(servers_raw)
+    frequency = to_iso_duration(m.group("freq"))
+    if not files or not servers or frequency is None:
+        return None
+    return BackupIntent(files=files, servers=servers, backup_frequency_pth=frequency)
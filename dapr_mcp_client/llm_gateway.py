@@ -0,0 +1,288 @@
+from __future__ import annotations
+import asyncio
+import os
+import random
+import time
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+import openai
+
+from shared import metrics
+from shared.concurrency import AdaptiveLimiter
+from shared.logs import get_logger
+
+# Every chat completion goes through one gateway per process:
+#
+#   - a cap on requests in flight to the deployment, lowered on 429s and raised
+#     again on successes (AIMD, as for Cosmos DB)
+#   - token-per-minute buckets, one global and one per user; a request reserves
+#     its estimated prompt + max_tokens and is settled with the reported usage
+#   - a fair queue: waiting requests are served round-robin across users, so
+#     one user's 17-call tool loop doesn't starve everyone else
+#   - 429s pause dispatch for the service's retry-after (the limit is per
+#     deployment, not per request), then the request retries
+#   - a deadline per conversation turn, covering queue wait and retries
+#
+#   LLM_CONCURRENCY=8             max chat requests in flight
+#   LLM_TPM_LIMIT=0               tokens per minute for the whole client (0 = no limit)
+#   LLM_USER_TPM_LIMIT=0          tokens per minute per user (0 = no limit)
+#   LLM_QUEUE_MAX=256             waiting requests before new ones are turned away
+#   LLM_MAX_RETRIES=4             retries of a throttled or transient failure
+#   LLM_RETRY_BASE_SECONDS=0.5    first backoff when the service gives no retry-after (doubles)
+#   LLM_RETRY_MAX_SECONDS=20      cap on a single backoff
+#   LLM_DEADLINE_SECONDS=60       time budget for all LLM calls of one conversation turn
+
+CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "8"))
+TPM_LIMIT = int(os.getenv("LLM_TPM_LIMIT", "0"))
+USER_TPM_LIMIT = int(os.getenv("LLM_USER_TPM_LIMIT", "0"))
+QUEUE_MAX = int(os.getenv("LLM_QUEUE_MAX", "256"))
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+RETRY_BASE_SECONDS = float(os.getenv("LLM_RETRY_BASE_SECONDS", "0.5"))
+RETRY_MAX_SECONDS = float(os.getenv("LLM_RETRY_MAX_SECONDS", "20"))
+DEADLINE_SECONDS = float(os.getenv("LLM_DEADLINE_SECONDS", "60"))
+
+LLM_QUEUE_WAIT = metrics.histogram("llm_queue_wait_seconds", "Time a chat request waited in the LLM gateway queue")
+LLM_RETRIES = metrics.counter("llm_retries_total", "LLM request retries by reason")
+LLM_REJECTED = metrics.counter("llm_gateway_rejections_total", "LLM requests given up by the gateway by reason")
+
+log = get_logger("client")
+
+T = TypeVar("T")
+
+# per-user buckets kept before full (idle) ones are dropped
+_USER_BUCKETS_MAX = 1024
+
+
+class LLMUnavailable(RuntimeError):
+    """The gateway could not get a completion in time (`reason`: deadline, queue_full, throttled, error)."""
+    def __init__(self, reason: str, message: str = "") -> None:
+        super().__init__(message or reason)
+        self.reason = reason
+
+
+class TokenBucket:
+    """`per_minute` tokens refilled continuously, holding at most one minute's worth."""
+    def __init__(self, per_minute: int) -> None:
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.stamp = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def wait_time(self, cost: float, now: float) -> float:
+        """Seconds until `cost` tokens are available (0 when they are now)."""
+        self._refill(now)
+        cost = min(cost, self.capacity)  # a request bigger than the bucket waits for a full one
+        return 0.0 if self.tokens >= cost else (cost - self.tokens) / self.rate
+
+    def take(self, cost: float) -> None:
+        self.tokens -= min(cost, self.capacity)
+
+    def settle(self, reserved: float, used: float) -> None:
+        # usage over the reservation becomes debt; unused reservation is refunded
+        self.tokens = min(self.capacity, self.tokens + min(reserved, self.capacity) - used)
+
+    @property
+    def full(self) -> bool:
+        self._refill(time.monotonic())
+        return self.tokens >= self.capacity
+
+
+class _Waiter:
+    __slots__ = ("user", "cost", "future", "enqueued")
+
+    def __init__(self, user: str, cost: float, future: asyncio.Future) -> None:
+        self.user = user
+        self.cost = cost
+        self.future = future
+        self.enqueued = time.monotonic()
+
+
+class LLMGateway:
+    def __init__(self, concurrency: int = CONCURRENCY, tpm: int = TPM_LIMIT, user_tpm: int = USER_TPM_LIMIT,
+                 queue_max: int = QUEUE_MAX) -> None:
+        # only the limit arithmetic is used; waiting happens in the fair queue below
+        self.limiter = AdaptiveLimiter(initial=concurrency, minimum=1, maximum=concurrency)
+        self.user_tpm = user_tpm
+        self.queue_max = queue_max
+        self.bucket = TokenBucket(tpm) if tpm > 0 else None
+        self.user_buckets: Dict[str, TokenBucket] = {}
+        self.in_flight = 0
+        self.paused_until = 0.0
+        # user -> FIFO of that user's waiters; the dict order is the round-robin order
+        self._queues: "OrderedDict[str, Deque[_Waiter]]" = OrderedDict()
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def waiting(self) -> int:
+        return sum(len(q) for q in self._queues.values())
+
+    def _user_bucket(self, user: str) -> Optional[TokenBucket]:
+        if self.user_tpm <= 0:
+            return None
+        bucket = self.user_buckets.get(user)
+        if bucket is None:
+            if len(self.user_buckets) >= _USER_BUCKETS_MAX:
+                # a full bucket holds nothing worth remembering
+                for name in [n for n, b in self.user_buckets.items() if b.full and n not in self._queues]:
+                    del self.user_buckets[name]
+            bucket = self.user_buckets[user] = TokenBucket(self.user_tpm)
+        return bucket
+
+    def _dispatch(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        now = time.monotonic()
+        if now < self.paused_until:
+            self._schedule(self.paused_until - now)
+            return
+        retry_in: Optional[float] = None
+        skipped = 0
+        while self._queues and self.in_flight < int(self.limiter.limit) and skipped < len(self._queues):
+            user, queue = next(iter(self._queues.items()))
+            waiter = queue[0]
+            if waiter.future.done():  # cancelled; its task hasn't run its cleanup yet
+                self._remove(waiter)
+                continue
+            user_bucket = self._user_bucket(user)
+            user_wait = user_bucket.wait_time(waiter.cost, now) if user_bucket else 0.0
+            if user_wait > 0:
+                # this user is over their own budget; the next user may go
+                self._queues.move_to_end(user)
+                skipped += 1
+                retry_in = user_wait if retry_in is None else min(retry_in, user_wait)
+                continue
+            global_wait = self.bucket.wait_time(waiter.cost, now) if self.bucket else 0.0
+            if global_wait > 0:
+                # keep the turn: smaller requests behind it don't get to jump ahead
+                retry_in = global_wait if retry_in is None else min(retry_in, global_wait)
+                break
+            queue.popleft()
+            if queue:
+                self._queues.move_to_end(user)
+            else:
+                del self._queues[user]
+            skipped = 0
+            if user_bucket:
+                user_bucket.take(waiter.cost)
+            if self.bucket:
+                self.bucket.take(waiter.cost)
+            self.in_flight += 1
+            waiter.future.set_result(None)
+        if retry_in is not None and self._queues:
+            self._schedule(retry_in)
+
+    def _schedule(self, delay: float) -> None:
+        self._timer = asyncio.get_running_loop().call_later(max(delay, 0.001), self._dispatch)
+
+    def _remove(self, waiter: _Waiter) -> None:
+        queue = self._queues.get(waiter.user)
+        if queue is not None and waiter in queue:
+            queue.remove(waiter)
+            if not queue:
+                del self._queues[waiter.user]
+
+    async def acquire(self, user: str, cost: float, deadline: float) -> None:
+        """Wait for a slot and `cost` tokens of budget; LLMUnavailable when `deadline` (time.monotonic()) passes first."""
+        if self.waiting >= self.queue_max:
+            LLM_REJECTED.inc(reason="queue_full")
+            raise LLMUnavailable("queue_full", f"{self.waiting} LLM requests already waiting")
+        waiter = _Waiter(user, cost, asyncio.get_running_loop().create_future())
+        self._queues.setdefault(user, deque()).append(waiter)
+        self._dispatch()
+        try:
+            async with asyncio.timeout(max(0.0, deadline - time.monotonic())):
+                await waiter.future
+        except (asyncio.CancelledError, TimeoutError) as e:
+            if waiter.future.done() and not waiter.future.cancelled():
+                self.release(user, cost, 0)  # granted and cancelled in the same tick: hand it back
+            else:
+                self._remove(waiter)
+            if isinstance(e, TimeoutError):
+                LLM_REJECTED.inc(reason="deadline")
+                raise LLMUnavailable("deadline", "timed out waiting for LLM capacity") from None
+            raise
+        finally:
+            LLM_QUEUE_WAIT.observe(time.monotonic() - waiter.enqueued)
+
+    def release(self, user: str, reserved: float, used: float) -> None:
+        """Free the slot and settle the reservation against the tokens the call actually used."""
+        self.in_flight -= 1
+        user_bucket = self.user_buckets.get(user) if self.user_tpm > 0 else None
+        for bucket in (user_bucket, self.bucket):
+            if bucket is not None:
+                bucket.settle(reserved, used)
+        self._dispatch()
+
+    def pause(self, seconds: float) -> None:
+        """Hold all dispatch for `seconds` (the deployment said retry-after)."""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def call(self, fn: Callable[[], Awaitable[T]], *, user: str, cost: float, deadline: float) -> T:
+        """Run `fn` (one chat completion) under the gateway, retrying 429s and transient failures until `deadline`."""
+        attempt = 0
+        while True:
+            await self.acquire(user, cost, deadline)
+            started = time.monotonic()
+            used = 0.0
+            try:
+                async with asyncio.timeout(max(0.0, deadline - time.monotonic())):
+                    result = await fn()
+                used = _total_tokens(result, cost)
+                self.limiter.on_success()
+                return result
+            except TimeoutError:
+                used = cost  # the service may have done the work anyway
+                LLM_REJECTED.inc(reason="deadline")
+                raise LLMUnavailable("deadline", "LLM call did not finish before the deadline") from None
+            except openai.RateLimitError as e:
+                reason, delay = "429", _retry_delay(e, attempt)
+                self.pause(delay)
+                if self.limiter.on_throttle(started):
+                    log.warning("llm throttled; lowering concurrency", limit=round(self.limiter.limit, 2))
+            except (openai.APIConnectionError, openai.InternalServerError) as e:
+                used = cost
+                reason, delay = type(e).__name__, _retry_delay(e, attempt)
+            finally:
+                self.release(user, cost, used)
+            if attempt >= MAX_RETRIES or time.monotonic() + delay >= deadline:
+                LLM_REJECTED.inc(reason="throttled" if reason == "429" else "error")
+                raise LLMUnavailable("throttled" if reason == "429" else "error",
+                                     f"LLM request failed after {attempt + 1} attempts ({reason})")
+            LLM_RETRIES.inc(reason=reason)
+            log.warning("llm retry", reason=reason, attempt=attempt + 1, delay_s=round(delay, 3), user_id=user)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+
+def _total_tokens(response: Any, default: float) -> float:
+    usage = getattr(response, "usage", None)
+    total = getattr(usage, "total_tokens", None) if usage is not None else None
+    return float(total) if total is not None else default
+
+
+def _retry_delay(error: Exception, attempt: int) -> float:
+    """The service's retry-after when it sent one, else capped exponential backoff with jitter."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return min(float(headers["retry-after-ms"]) / 1000, RETRY_MAX_SECONDS)
+        if headers.get("retry-after"):
+            return min(float(headers["retry-after"]), RETRY_MAX_SECONDS)
+    except (TypeError, ValueError):
+        pass
+    delay = min(RETRY_BASE_SECONDS * (2 ** attempt), RETRY_MAX_SECONDS)
+    return delay * (1 + random.uniform(0, 0.2))
+
+
+GATEWAY = LLMGateway()
+
+metrics.gauge("llm_queue_depth", "Chat requests waiting in the LLM gateway", fn=lambda: GATEWAY.waiting)
+metrics.gauge("llm_in_flight", "Chat requests in flight to Azure OpenAI", fn=lambda: GATEWAY.in_flight)
+metrics.gauge("llm_concurrency_limit", "Current adaptive limit on chat requests in flight", fn=lambda: GATEWAY.limiter.limit)
@@ -5,7 +5,7 @@ import json
 import sys
 import os
 from contextlib import AsyncExitStack
-from typing import Optional
+from typing import Any, Dict, Optional
 
 from fastapi import params
 import httpx
@@ -14,9 +14,13 @@ from mcp.client.streamable_http import streamablehttp_client
 from collections import defaultdict
 from .sse_bus import SESSIONS, sse_event, JSONRPC, publish_progress, publish_message, associate_user_session, session_for_user
 from shared.models import parse_notification_json, ProgressNotification, MessageNotification
+from shared.logs import get_logger
+from shared import tracing
 import mcp.types as types
 from mcp.shared.session import RequestResponder   
 
+log = get_logger("mcp_client")
+
 class MCPClient:
     def __init__(self, mcp_endpoint: str):
         self.mcp_endpoint = mcp_endpoint
@@ -26,6 +30,8 @@ class MCPClient:
         self.mcp_tools: Optional[ListToolsResult] = None
         self._sse_task: Optional[asyncio.Task] = None
         self._broadcast_session_id: str | None = None
+        # progressToken of each call_tool -> set when the server's end marker for it arrives
+        self._call_done: Dict[str, asyncio.Event] = {}
 
 
     async def _on_incoming(
@@ -36,7 +42,7 @@ class MCPClient:
     ) -> None:
         # Errors from the stream
         if isinstance(msg, Exception):
-            print(f"[mcp] incoming exception: {msg!r}", file=sys.stderr)
+            log.warning("incoming exception", error=repr(msg))
             return
 
         # Server requests (sampling/elicitation/etc). Ignore unless you support them.
@@ -49,6 +55,11 @@ class MCPClient:
             method = getattr(root, "method", None)
             params = getattr(root, "params", None)
 
+            # end marker of one of our tool calls: not progress for the UI
+            if isinstance(root, types.ProgressNotification) and root.params.progressToken in self._call_done:
+                self._call_done[root.params.progressToken].set()
+                return
+
             # Build the JSON shape your existing parser expects
             if hasattr(params, "model_dump"):
                 params_json = params.model_dump(mode="json")
@@ -60,7 +71,7 @@ class MCPClient:
             try:
                 notif = parse_notification_json(json.dumps(payload))
             except Exception as e:
-                print(f"[mcp] notification parse error: {e}", file=sys.stderr)
+                log.warning("notification parse error", error=str(e))
                 return
 
             # PROGRESS
@@ -83,13 +94,13 @@ class MCPClient:
 
     async def _broadcast_progress(self, progress: float, target: Optional[str] = None, token: Optional[str] = None) -> None:
         target = target or self._broadcast_session_id
-        print(f"mcp_client.py _broadcast_progress session_id {target}")
+        log.debug("broadcast progress", session_id=target, progress=progress)
         if target:
             await publish_progress(target, token, progress)
 
     async def _broadcast_assistant(self, text: str, level: Optional[str] = None, target: Optional[str] = None) -> None:
         target = target or self._broadcast_session_id
-        print(f"mcp_client.py _broadcast_assistant session_id {target}")
+        log.debug("broadcast assistant", session_id=target)
         if target:
             await publish_message(target, text, level)
 
@@ -106,6 +117,8 @@ class MCPClient:
         await self.exit_stack.__aenter__()  # enter now; we'll explicitly aclose later
         self.session_id = session_id #str(uuid.uuid4())
         headers = {"Mcp-Session-Id": self.session_id}
+        # every request on this connection carries the caller's trace context
+        tracing.inject(headers)
 
         # JSON-RPC duplex channel over Streamable HTTP
         streamable_http_client = streamablehttp_client(url=self.mcp_endpoint, headers=headers)
@@ -124,6 +137,30 @@ class MCPClient:
         # Discover tools
         self.mcp_tools = await self.session.list_tools()
 
+    async def call_tool(self, name: str, arguments: Dict[str, Any]) -> types.CallToolResult:
+        """
+        tools/call with a progressToken of our own; once the tool has returned, the server
+        publishes a final progress notification for it on this session's stream.
+        """
+        token = f"call_tool/{uuid.uuid4()}"
+        self._call_done[token] = asyncio.Event()
+        return await self.session.call_tool(name, arguments, meta={"progressToken": token})
+
+    async def drain(self, timeout: float = 2.0) -> None:
+        """
+        Wait (at most `timeout`) for the end marker of every call_tool so far. The session
+        stream is ordered, so progress the tools published reaches the UI before aclose().
+        """
+        pending = dict(self._call_done)
+        try:
+            await asyncio.wait_for(asyncio.gather(*(done.wait() for done in pending.values())), timeout)
+        except asyncio.TimeoutError:
+            log.warning("drain timed out", session_id=self.session_id,
+                        pending=[token for token, done in pending.items() if not done.is_set()])
+        finally:
+            for token in pending:
+                self._call_done.pop(token, None)
+
     async def aclose(self) -> None:
         """
         Close SSE (if running) and the AsyncExitStack that owns the stream,
@@ -0,0 +1,145 @@
+from __future__ import annotations
+import json
+import os
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence
+
+from shared import metrics
+from shared.logs import get_logger
+
+# Chat request assembly that keeps the prompt prefix identical across users,
+# so provider-side prompt caching (which matches on the longest common prefix)
+# can serve it:
+#
+#   [static system prompt] [tools]            same bytes for every request
+#   [user context]                            per user, stable across turns
+#   [history] [this turn: query, tool calls]  grows
+#
+# Tokens are counted locally per segment and the request is held to a budget
+# by dropping the oldest history first and then shortening tool results.
+#
+#   LLM_INPUT_TOKEN_BUDGET=16000   max estimated input tokens per chat request
+#   LLM_TOKENIZER=o200k_base       tiktoken encoding (when tiktoken is installed; else ~4 chars/token)
+
+INPUT_TOKEN_BUDGET = int(os.getenv("LLM_INPUT_TOKEN_BUDGET", "16000"))
+TOKENIZER = os.getenv("LLM_TOKENIZER", "o200k_base")
+
+# per-message framing tokens in the chat format
+MESSAGE_OVERHEAD = 4
+TRUNCATED_MARK = " …[truncated]"
+
+PROMPT_SEGMENT_TOKENS = metrics.counter("llm_prompt_segment_tokens_total", "Locally counted input tokens by prompt segment")
+PROMPT_TRIMS = metrics.counter("llm_prompt_trims_total", "Prompt content dropped or shortened to fit the token budget by kind")
+
+log = get_logger("client")
+
+try:
+    import tiktoken
+
+    _ENCODING = tiktoken.get_encoding(TOKENIZER)
+
+    def count_tokens(text: str) -> int:
+        return len(_ENCODING.encode(text, disallowed_special=()))
+except (ImportError, ValueError):
+    def count_tokens(text: str) -> int:
+        # ~4 characters per token for English/JSON; close enough for budgeting
+        return (len(text) + 3) // 4
+
+
+class PromptTooLarge(ValueError):
+    pass
+
+
+def message_tokens(message: Dict[str, Any]) -> int:
+    tokens = MESSAGE_OVERHEAD
+    content = message.get("content")
+    if isinstance(content, str):
+        tokens += count_tokens(content)
+    for tc in message.get("tool_calls") or ():
+        fn = tc.get("function", {})
+        tokens += count_tokens(fn.get("name", "")) + count_tokens(fn.get("arguments", ""))
+    return tokens
+
+
+_TOOLS_TOKENS: Dict[str, int] = {}
+
+
+def tools_tokens(tools: Sequence[Dict[str, Any]]) -> int:
+    # the tool list is the same for every request against a server: count it once
+    key = json.dumps(tools, sort_keys=True)
+    if key not in _TOOLS_TOKENS:
+        _TOOLS_TOKENS[key] = count_tokens(key)
+    return _TOOLS_TOKENS[key]
+
+
+@dataclass
+class Prompt:
+    messages: List[Dict[str, Any]]
+    segments: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def tokens(self) -> int:
+        return sum(self.segments.values())
+
+
+class PromptBuilder:
+    """
+    Assembles one chat request from its segments. `prefix` is the static
+    system prompt, the same string for every user. `context` holds the
+    user-specific system lines, sent right after it.
+    """
+    def __init__(self, prefix: str, budget: int = INPUT_TOKEN_BUDGET) -> None:
+        self.prefix_message = {"role": "system", "content": prefix}
+        self.prefix_tokens = message_tokens(self.prefix_message)
+        self.budget = budget
+
+    def build(self, context: str, history: List[Dict[str, Any]], turn: List[Dict[str, Any]],
+              tools: Sequence[Dict[str, Any]] = ()) -> Prompt:
+        context_message = {"role": "system", "content": context}
+        turn = [dict(m) for m in turn]
+        fixed = {
+            "prefix": self.prefix_tokens,
+            "tools": tools_tokens(tools) if tools else 0,
+            "context": message_tokens(context_message),
+        }
+        history_costs = [message_tokens(m) for m in history]
+        turn_costs = [message_tokens(m) for m in turn]
+        room = self.budget - sum(fixed.values())
+
+        # oldest history goes first
+        start = 0
+        while start < len(history) and sum(history_costs[start:]) + sum(turn_costs) > room:
+            start += 1
+        if start:
+            PROMPT_TRIMS.inc(start, kind="history_message")
+        # then the longest tool results are cut down
+        while sum(turn_costs) > room:
+            i = max((i for i, m in enumerate(turn) if m.get("role") == "tool"),
+                    key=lambda i: turn_costs[i], default=None)
+            if i is None:
+                raise PromptTooLarge(f"request needs {sum(fixed.values()) + sum(turn_costs)} tokens, budget {self.budget}")
+            excess = sum(turn_costs) - room
+            content = turn[i]["content"] or ""
+            keep = max(0, len(content) - (excess + count_tokens(TRUNCATED_MARK) + 1) * 4)
+            if keep == 0 and content == "":
+                raise PromptTooLarge(f"request needs {sum(fixed.values()) + sum(turn_costs)} tokens, budget {self.budget}")
+            turn[i]["content"] = content[:keep] + TRUNCATED_MARK if keep else ""
+            turn_costs[i] = message_tokens(turn[i])
+            PROMPT_TRIMS.inc(kind="tool_result")
+
+        kept = history[start:]
+        segments = {**fixed, "history": sum(history_costs[start:]), "turn": sum(turn_costs)}
+        for name, tokens in segments.items():
+            PROMPT_SEGMENT_TOKENS.inc(tokens, segment=name)
+        return Prompt([self.prefix_message, context_message, *kept, *turn], segments)
+
+
+def cached_prompt_tokens(usage: Any) -> Optional[int]:
+    """`usage.prompt_tokens_details.cached_tokens` from a chat response, if the provider reported it."""
+    details = getattr(usage, "prompt_tokens_details", None)
+    if details is None and isinstance(usage, dict):
+        details = usage.get("prompt_tokens_details")
+    if details is None:
+        return None
+    cached = details.get("cached_tokens") if isinstance(details, dict) else getattr(details, "cached_tokens", None)
+    return int(cached) if cached is not None else None
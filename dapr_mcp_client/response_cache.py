@@ -0,0 +1,112 @@
+from __future__ import annotations
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from shared import metrics
+
+# Answers to read-only turns, keyed by (user, normalized query).
+#
+# A turn is cacheable when it called at least one tool and every tool it
+# called is read-only. Any other tool call for the user drops their entries,
+# and an answer computed while such a call ran is not stored. Backup status
+# also changes on the server side (the scheduler actor), which the client
+# does not see: the TTL bounds how stale such an answer can get.
+#
+# Queries match when they have the same words in the same order after
+# lowercasing, dropping punctuation and politeness fillers ("how many backup
+# tasks do I have?" == "Please, how many backup tasks do I have"). Order is
+# kept because it carries meaning: "file 1 on server 2" is not "file 2 on
+# server 1". Queries that point back into the conversation ("those", "what
+# about ...") are never cached.
+#
+#   RESPONSE_CACHE=on                        "off" disables lookups and stores
+#   RESPONSE_CACHE_TTL_SECONDS=30
+#   RESPONSE_CACHE_MAX_ENTRIES=10000
+#   RESPONSE_CACHE_READ_TOOLS=query_backup_tasks,get_backup_status,backup_stats   comma-separated read-only tools
+
+ENABLED = os.getenv("RESPONSE_CACHE", "on").lower() not in {"off", "0", "false", "no"}
+TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "30"))
+MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "10000"))
+READ_ONLY_TOOLS = frozenset(t.strip() for t in os.getenv("RESPONSE_CACHE_READ_TOOLS", "query_backup_tasks,get_backup_status,backup_stats").split(",") if t.strip())
+
+RESPONSE_CACHE_LOOKUPS = metrics.counter("response_cache_lookups_total", "Response cache lookups by result (hit, miss, bypass)")
+RESPONSE_CACHE_INVALIDATIONS = metrics.counter("response_cache_invalidations_total", "Per-user response cache invalidations by write tool")
+
+_WORD_RE = re.compile(r"[\w.\-/@]+")
+_FILLERS = {"please", "pls", "kindly", "can", "could", "would", "you", "tell", "me", "hey", "hi", "hello",
+            "thanks", "thank", "the", "a", "an", "just"}
+# words whose meaning depends on earlier turns
+_CONTEXT_RE = re.compile(r"\b(?:th(?:ose|ese|em|at|is|ey)|it|its|same|again|also|else|other|previous|last|above|"
+                         r"what\s+about|how\s+about|and\s+now)\b", re.IGNORECASE)
+
+
+def normalize(query: str) -> Optional[str]:
+    """
+    The cache key text for `query`, or None when it must not be cached.
+
+    >>> normalize("Please, how many backup tasks do I have?") == normalize("how many backup tasks do I have")
+    True
+    >>> normalize("show backups of file 1 on server 2") == normalize("show backups of file 2 on server 1")
+    False
+    """
+    if _CONTEXT_RE.search(query):
+        return None
+    words = (w.strip(".-/") for w in _WORD_RE.findall(query.lower()))
+    return " ".join(w for w in words if w and w not in _FILLERS) or None
+
+
+class ResponseCache:
+    def __init__(self, ttl: float = TTL_SECONDS, max_entries: int = MAX_ENTRIES) -> None:
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # (user, key) -> (expires, answer); insertion order is LRU order
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, List[str]]]" = OrderedDict()
+        # bumped by every write for the user; a turn stores only if it is unchanged
+        self._generation: Dict[str, int] = {}
+
+    def generation(self, user_id: str) -> int:
+        return self._generation.get(user_id, 0)
+
+    def get(self, user_id: str, query: str) -> Optional[List[str]]:
+        key = normalize(query)
+        if not ENABLED or key is None:
+            RESPONSE_CACHE_LOOKUPS.inc(result="bypass")
+            return None
+        entry = self._entries.get((user_id, key))
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[(user_id, key)]
+            RESPONSE_CACHE_LOOKUPS.inc(result="miss")
+            return None
+        self._entries.move_to_end((user_id, key))
+        RESPONSE_CACHE_LOOKUPS.inc(result="hit")
+        return list(entry[1])
+
+    def put(self, user_id: str, query: str, answer: List[str], tools: List[str], generation: int) -> bool:
+        """Store the answer of a turn that ran `tools`, started at `generation`; False when it isn't cacheable."""
+        key = normalize(query)
+        if (not ENABLED or key is None or not answer or not tools or not READ_ONLY_TOOLS.issuperset(tools)
+                or generation != self.generation(user_id)):
+            return False
+        self._entries[(user_id, key)] = (time.monotonic() + self.ttl, list(answer))
+        self._entries.move_to_end((user_id, key))
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return True
+
+    def invalidate(self, user_id: str, tool: str) -> None:
+        """A write tool ran for `user_id`: drop their answers and any answer being computed."""
+        if tool in READ_ONLY_TOOLS:
+            return
+        self._generation[user_id] = self.generation(user_id) + 1
+        for k in [k for k in self._entries if k[0] == user_id]:
+            del self._entries[k]
+        RESPONSE_CACHE_INVALIDATIONS.inc(tool=tool)
+
+
+RESPONSE_CACHE = ResponseCache()
+
+metrics.gauge("response_cache_entries", "Answers held in the response cache", fn=lambda: len(RESPONSE_CACHE._entries))
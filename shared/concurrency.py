@@ -0,0 +1,83 @@
+from __future__ import annotations
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque
+
+
+class AdaptiveLimiter:
+    """
+    AIMD concurrency limit for calls to a throttling backend.
+
+    Each success raises the limit by `increase / limit`, which adds about
+    `increase` per window of in-flight calls. A throttle signal multiplies it by
+    `decrease`, but only for calls started after the previous decrease, so one
+    burst of concurrent 429s counts as a single congestion event (as TCP does
+    once per round trip). Callers over the limit wait FIFO on the event loop;
+    they are never rejected.
+    """
+    def __init__(self, initial: int, minimum: int = 1, maximum: int = 64,
+                 increase: float = 1.0, decrease: float = 0.5) -> None:
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self.increase = increase
+        self.decrease = decrease
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._last_decrease = float("-inf")
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self) -> None:
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+            return
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append(fut)
+        try:
+            await fut  # release() hands its slot over (in_flight already counted)
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                self.release()  # woken and cancelled in the same tick: pass the slot on
+            elif fut in self._waiters:
+                self._waiters.remove(fut)
+            raise
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self._wake()
+
+    def _wake(self) -> None:
+        while self._waiters and self.in_flight < int(self.limit):
+            fut = self._waiters.popleft()
+            if not fut.done():
+                self.in_flight += 1
+                fut.set_result(None)
+
+    def on_success(self) -> None:
+        if self.limit < self.maximum:
+            self.limit = min(self.maximum, self.limit + self.increase / self.limit)
+            self._wake()
+
+    def on_throttle(self, started: float) -> bool:
+        """
+        Back off for a throttled call that started at `started` (time.monotonic()),
+        unless it was already in flight at the last decrease. True when the limit was lowered.
+        """
+        if started <= self._last_decrease:
+            return False
+        self._last_decrease = time.monotonic()
+        self.limit = max(self.minimum, self.limit * self.decrease)
+        return True
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
@@ -0,0 +1,153 @@
+from __future__ import annotations
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+from typing import Any, Dict, Optional
+
+# Structured, sampled logging for hot paths.
+#
+# Records go through a QueueHandler, so the event loop only enqueues; a
+# background QueueListener thread formats them as JSON lines and writes stdout.
+#
+#   LOG_LEVEL=INFO                 root level for the "app" loggers
+#   LOG_SAMPLE=sse=0.1,cosmos=0.5  keep this fraction of DEBUG/INFO records per category
+#   LOG_PAYLOAD_LIMIT=512          max characters kept from any logged payload
+#   LOG_QUEUE_SIZE=10000           records buffered before new ones are dropped
+
+ROOT = "app"  # not "mcp": that namespace belongs to the MCP SDK's own loggers
+PAYLOAD_LIMIT = int(os.getenv("LOG_PAYLOAD_LIMIT", "512"))
+
+_configured = False
+_config_lock = threading.Lock()
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def _parse_rates(raw: str) -> Dict[str, float]:
+    rates: Dict[str, float] = {}
+    for part in raw.split(","):
+        name, _, value = part.partition("=")
+        try:
+            rates[name.strip()] = max(0.0, min(1.0, float(value)))
+        except ValueError:
+            continue
+    return rates
+
+
+def truncate(value: Any, limit: int = PAYLOAD_LIMIT) -> str:
+    """Render a payload for logging, cut to `limit` characters."""
+    text = value if isinstance(value, str) else repr(value)
+    if len(text) <= limit:
+        return text
+    return f"{text[:limit]}...(+{len(text) - limit} chars)"
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "category": record.name[len(ROOT) + 1:] if record.name.startswith(ROOT + ".") else record.name,
+            "msg": record.getMessage(),
+        }
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(fields)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Drop a share of DEBUG/INFO records per category; WARNING and above always pass."""
+    def __init__(self, rates: Dict[str, float]) -> None:
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        category = record.name.split(".", 2)[1] if record.name.count(".") else record.name
+        rate = self.rates.get(category)
+        return rate is None or random.random() < rate
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Never block the caller: when the queue is full the record is dropped."""
+    dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # same-process queue: hand the record over as-is and let the listener format it;
+        # only render a traceback here because exc_info can't outlive the except block
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _DroppingQueueHandler.dropped += 1
+
+
+def configure_logging() -> None:
+    """Install the queue handler on the "app" logger tree (idempotent)."""
+    global _configured, _listener
+    with _config_lock:
+        if _configured:
+            return
+        q: queue.Queue = queue.Queue(maxsize=int(os.getenv("LOG_QUEUE_SIZE", "10000")))
+        stream = logging.StreamHandler(sys.stdout)
+        stream.setFormatter(JsonFormatter())
+        _listener = logging.handlers.QueueListener(q, stream, respect_handler_level=False)
+        _listener.start()
+        atexit.register(_listener.stop)
+
+        handler = _DroppingQueueHandler(q)
+        handler.addFilter(SamplingFilter(_parse_rates(os.getenv("LOG_SAMPLE", ""))))
+        root = logging.getLogger(ROOT)
+        root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+        root.addHandler(handler)
+        root.propagate = False
+        _configured = True
+
+
+class StructLogger:
+    """Thin wrapper so hot paths log `msg` plus keyword fields, skipping work when disabled."""
+    def __init__(self, logger: logging.Logger) -> None:
+        self._logger = logger
+
+    def isEnabledFor(self, level: int) -> bool:
+        return self._logger.isEnabledFor(level)
+
+    def _log(self, level: int, msg: str, fields: Dict[str, Any], exc_info: bool = False) -> None:
+        if self._logger.isEnabledFor(level):
+            self._logger.log(level, msg, extra={"fields": fields}, exc_info=exc_info)
+
+    def debug(self, msg: str, **fields: Any) -> None:
+        self._log(logging.DEBUG, msg, fields)
+
+    def info(self, msg: str, **fields: Any) -> None:
+        self._log(logging.INFO, msg, fields)
+
+    def warning(self, msg: str, **fields: Any) -> None:
+        self._log(logging.WARNING, msg, fields)
+
+    def error(self, msg: str, **fields: Any) -> None:
+        self._log(logging.ERROR, msg, fields)
+
+    def exception(self, msg: str, **fields: Any) -> None:
+        self._log(logging.ERROR, msg, fields, exc_info=True)
+
+
+def get_logger(category: str) -> StructLogger:
+    configure_logging()
+    return StructLogger(logging.getLogger(f"{ROOT}.{category}"))
@@ -0,0 +1,133 @@
+from __future__ import annotations
+import asyncio
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+from shared import metrics
+from shared.logs import get_logger
+
+# Startup steps and readiness.
+#
+#   STARTUP_MODE=lazy   serve at once; connect/warm up in the background and report it on /readyz
+#   STARTUP_MODE=eager  run every step inside the lifespan before serving (old behaviour)
+#   STARTUP_RETRY_MAX_SECONDS=30   cap of the backoff between retries of a failed background step
+#
+# /healthz (liveness) never waits on any of this; /readyz answers 503 until
+# every required step has succeeded and then 200, with per-step state either way.
+
+STARTUP_MODE = os.getenv("STARTUP_MODE", "lazy").lower()
+RETRY_MAX_SECONDS = float(os.getenv("STARTUP_RETRY_MAX_SECONDS", "30"))
+
+STARTUP_STEP_DURATION = metrics.histogram("startup_step_duration_seconds", "Time a startup step took to succeed by step")
+STARTUP_STEP_FAILURES = metrics.counter("startup_step_failures_total", "Failed startup step attempts by step")
+
+log = get_logger("startup")
+
+
+class Step:
+    __slots__ = ("name", "required", "state", "attempts", "error", "started", "duration")
+
+    def __init__(self, name: str, required: bool) -> None:
+        self.name = name
+        self.required = required
+        self.state = "pending"
+        self.attempts = 0
+        self.error: Optional[str] = None
+        self.started: Optional[float] = None
+        self.duration: Optional[float] = None
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "required": self.required,
+            "attempts": self.attempts,
+            "error": self.error,
+            "duration_s": round(self.duration, 3) if self.duration is not None else None,
+        }
+
+
+class Readiness:
+    """Named startup steps, run inline (`run`) or in the background with retries (`start`)."""
+    def __init__(self) -> None:
+        self.steps: Dict[str, Step] = {}
+        self.born = time.monotonic()
+        self.ready_after: Optional[float] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    @property
+    def ready(self) -> bool:
+        return all(s.state == "ready" for s in self.steps.values() if s.required)
+
+    async def _attempt(self, step: Step, fn: Callable[[], Awaitable[Any]]) -> None:
+        step.state = "running"
+        step.attempts += 1
+        step.started = time.monotonic()
+        try:
+            await fn()
+        except Exception as e:
+            step.state = "failed"
+            step.error = str(e)
+            STARTUP_STEP_FAILURES.inc(step=step.name)
+            raise
+        step.state = "ready"
+        step.error = None
+        step.duration = time.monotonic() - step.started
+        STARTUP_STEP_DURATION.observe(step.duration, step=step.name)
+        log.info("startup step ready", step=step.name, attempts=step.attempts, duration_s=round(step.duration, 3))
+        if self.ready_after is None and self.ready:
+            self.ready_after = time.monotonic() - self.born
+            log.info("ready", after_s=round(self.ready_after, 3))
+
+    async def run(self, name: str, fn: Callable[[], Awaitable[Any]], required: bool = True) -> None:
+        """Run a step now; failures propagate (eager startup fails the boot)."""
+        step = self.steps.setdefault(name, Step(name, required))
+        await self._attempt(step, fn)
+
+    def start(self, name: str, fn: Callable[[], Awaitable[Any]], required: bool = True) -> asyncio.Task:
+        """Run a step in the background, retrying with capped exponential backoff until it succeeds."""
+        step = self.steps.setdefault(name, Step(name, required))
+
+        async def loop() -> None:
+            delay = 1.0
+            while True:
+                try:
+                    await self._attempt(step, fn)
+                    return
+                except Exception as e:
+                    log.warning("startup step failed; retrying", step=name, attempt=step.attempts,
+                                retry_in_s=delay, error=str(e))
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, RETRY_MAX_SECONDS)
+
+        task = asyncio.create_task(loop())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def setup(self, name: str, fn: Callable[[], Awaitable[Any]], required: bool = True) -> None:
+        """`run` under STARTUP_MODE=eager, `start` otherwise."""
+        if STARTUP_MODE == "eager":
+            await self.run(name, fn, required)
+        else:
+            self.start(name, fn, required)
+
+    async def shutdown(self) -> None:
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "mode": STARTUP_MODE,
+            "uptime_s": round(time.monotonic() - self.born, 3),
+            "ready_after_s": round(self.ready_after, 3) if self.ready_after is not None else None,
+            "steps": {name: s.as_dict() for name, s in self.steps.items()},
+        }
+
+
+READINESS = Readiness()
+
+metrics.gauge("app_ready", "1 once every required startup step has succeeded", fn=lambda: 1.0 if READINESS.ready else 0.0)
@@ -0,0 +1,316 @@
+from __future__ import annotations
+import asyncio
+import inspect
+import itertools
+import os
+import time
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, Deque, Dict, List, Mapping, Optional, Union
+from . import metrics
+from .logs import get_logger
+
+# How many encoded frames each session keeps for late / reconnecting subscribers.
+REPLAY_BUFFER_SIZE = int(os.getenv("SSE_REPLAY_BUFFER_SIZE", "256"))
+# Reconnect delay advertised to EventSource clients (ms).
+SSE_RETRY_MS = int(os.getenv("SSE_RETRY_MS", "3000"))
+# Lock stripes for session creation/deletion; lookups of live sessions take no lock.
+SESSION_SHARDS = int(os.getenv("SSE_SESSION_SHARDS", "16"))
+# Idle timeout of the proxy in front of us (s); Container Apps ingress and APIM use 240.
+# Heartbeats only have to beat it. 0 = no proxy: idle streams are suspended and send nothing.
+SSE_IDLE_TIMEOUT = float(os.getenv("SSE_IDLE_TIMEOUT", "240"))
+# First heartbeat after connect or traffic (s); doubles while idle up to SSE_IDLE_TIMEOUT / 2.
+SSE_HEARTBEAT_MIN = float(os.getenv("SSE_HEARTBEAT_MIN", "5"))
+
+KEEPALIVE_FRAME = b": keepalive\n\n"
+
+log = get_logger("sse")
+
+
+SSE_FRAMES_PUBLISHED = metrics.counter("sse_frames_published_total", "SSE frames published to session buffers")
+SSE_FRAMES_DELIVERED = metrics.counter("sse_frames_delivered_total", "SSE frames handed to subscribers")
+SSE_DELIVERY_LAG = metrics.histogram("sse_delivery_lag_seconds", "Time from publish to a subscriber reading the frame")
+SSE_SUBSCRIBER_BACKLOG = metrics.histogram(
+    "sse_subscriber_backlog_frames", "Frames pending for a subscriber when it drains", metrics.SIZE_BUCKETS
+)
+SSE_SESSIONS = metrics.gauge("sse_sessions", "Open SSE sessions")
+SSE_SUBSCRIBERS = metrics.gauge("sse_subscribers", "Attached SSE subscribers")
+SSE_KEEPALIVES = metrics.counter("sse_keepalives_total", "SSE keepalive comment frames sent")
+SSE_SUSPENDED = metrics.gauge("sse_streams_suspended", "Idle SSE streams waiting without a heartbeat timer")
+
+
+def parse_event_id(raw: Optional[str]) -> Optional[tuple[int, int]]:
+    """Parse an `<epoch>-<seq>` event id (Last-Event-ID header); None if absent or malformed."""
+    if not raw:
+        return None
+    epoch, _, seq = raw.strip().partition("-")
+    try:
+        return int(epoch), int(seq)
+    except ValueError:
+        return None
+
+
+class Frame:
+    """One SSE event, encoded once (including its `id:` line) and shared by every subscriber."""
+    __slots__ = ("seq", "event_id", "data", "created")
+
+    def __init__(self, seq: int, event_id: str, data: bytes) -> None:
+        self.seq = seq
+        self.event_id = event_id
+        self.data = data
+        self.created = time.monotonic()
+
+
+class Session:
+    """
+    Broadcast channel for one session.
+    Frames live in a bounded ring buffer; each subscriber reads them through its
+    own cursor, so publishing never copies per subscriber and nothing is consumed
+    destructively.
+    """
+    def __init__(self, session_id: str, maxlen: int = REPLAY_BUFFER_SIZE) -> None:
+        self.session_id = session_id
+        # ids are "<epoch>-<seq>": seq is monotonic within this session, the epoch
+        # tells a resuming client that the session was recreated (pod restart, DELETE)
+        self.epoch = int(time.time() * 1000)
+        self.frames: Deque[Frame] = deque(maxlen=maxlen)
+        self.last_seq = 0
+        # highest seq any subscriber has read; new subscribers without a cursor start here
+        self.delivered_seq = 0
+        self.subscribers = 0
+        self.closed = False
+        self._wake = asyncio.Event()
+
+    async def publish(self, msg: Union[str, bytes]) -> Optional[Frame]:
+        if self.closed:
+            return None
+        data = msg.encode("utf-8") if isinstance(msg, str) else msg
+        self.last_seq += 1
+        event_id = f"{self.epoch}-{self.last_seq}"
+        frame = Frame(self.last_seq, event_id, f"id: {event_id}\n".encode("ascii") + data)
+        self.frames.append(frame)
+        SSE_FRAMES_PUBLISHED.inc()
+        self._notify()
+        return frame
+
+    def subscribe(self, last_event_id: Optional[str] = None) -> "Subscriber":
+        """
+        Attach a reader. With `last_event_id` (the SSE Last-Event-ID) the cursor
+        resumes right after that frame; an id from an older epoch replays the whole
+        buffer. Otherwise it starts at the first frame nobody has read yet.
+        """
+        parsed = parse_event_id(last_event_id)
+        if parsed is None:
+            cursor = self.delivered_seq
+        elif parsed[0] != self.epoch:
+            cursor = 0
+        else:
+            cursor = max(0, min(parsed[1], self.last_seq))
+        self.subscribers += 1
+        SSE_SUBSCRIBERS.inc()
+        sub = Subscriber(self, cursor)
+        if self.frames and cursor < self.frames[0].seq - 1:
+            # the ring buffer already dropped part of what this client missed
+            sub.missed = self.frames[0].seq - 1 - cursor
+        return sub
+
+    def frames_after(self, seq: int) -> List[Frame]:
+        """Frames with a sequence number greater than `seq` that are still buffered."""
+        if not self.frames or seq >= self.last_seq:
+            return []
+        first = self.frames[0].seq
+        start = max(0, seq - first + 1)
+        return list(itertools.islice(self.frames, start, None))
+
+    def close(self) -> None:
+        self.closed = True
+        self.frames.clear()
+        self._notify()
+
+    def _notify(self) -> None:
+        # swap the event so waiters wake once and later waits block again
+        wake, self._wake = self._wake, asyncio.Event()
+        wake.set()
+
+
+class Subscriber:
+    """Per-subscriber cursor over a Session's ring buffer."""
+    def __init__(self, session: Session, cursor: int) -> None:
+        self.session = session
+        self.cursor = cursor
+        self.missed = 0
+        self.closed = False
+
+    def drain(self) -> List[Frame]:
+        frames = self.session.frames_after(self.cursor)
+        if frames:
+            now = time.monotonic()
+            SSE_SUBSCRIBER_BACKLOG.observe(len(frames))
+            SSE_FRAMES_DELIVERED.inc(len(frames))
+            for f in frames:
+                SSE_DELIVERY_LAG.observe(now - f.created)
+            self.cursor = frames[-1].seq
+            if self.cursor > self.session.delivered_seq:
+                self.session.delivered_seq = self.cursor
+        return frames
+
+    async def next_batch(self, timeout: Optional[float] = None) -> List[Frame]:
+        """Return pending frames, waiting up to `timeout` seconds for new ones."""
+        frames = self.drain()
+        if frames or self.session.closed:
+            return frames
+        wake = self.session._wake
+        try:
+            await asyncio.wait_for(wake.wait(), timeout)
+        except asyncio.TimeoutError:
+            return []
+        return self.drain()
+
+    async def stream(self, keepalive: "Keepalive") -> AsyncIterator[bytes]:
+        """
+        Yield pending frames (one write per batch) until the session closes, with
+        keepalive comments in idle gaps. Client disconnects cancel the response
+        task, so there is no polling here.
+        """
+        while not self.session.closed and not self.closed:
+            timeout = keepalive.timeout()
+            if timeout is None:
+                SSE_SUSPENDED.inc()
+                try:
+                    frames = await self.next_batch()
+                finally:
+                    SSE_SUSPENDED.dec()
+            else:
+                frames = await self.next_batch(timeout)
+            if frames:
+                keepalive.activity()
+                yield frames[0].data if len(frames) == 1 else b"".join(f.data for f in frames)
+            elif not self.session.closed:
+                yield keepalive.idle()
+
+    def close(self) -> None:
+        if not self.closed:
+            self.closed = True
+            self.session.subscribers -= 1
+            SSE_SUBSCRIBERS.dec()
+
+
+class Keepalive:
+    """
+    Heartbeat schedule for one stream. An idle stream sends an SSE comment
+    after SSE_HEARTBEAT_MIN seconds, then backs off exponentially to half the
+    proxy idle timeout; any traffic resets the backoff. With no idle timeout
+    the stream is suspended: it waits for the next frame with no timer.
+    """
+    def __init__(self, idle_timeout: float = SSE_IDLE_TIMEOUT, minimum: float = SSE_HEARTBEAT_MIN) -> None:
+        self.ceiling: Optional[float] = idle_timeout / 2 if idle_timeout > 0 else None
+        self.minimum = minimum if self.ceiling is None else min(minimum, self.ceiling)
+        self.interval = self.minimum
+
+    @classmethod
+    def for_stream(cls, headers: Mapping[str, str], query: Mapping[str, str]) -> "Keepalive":
+        """
+        Per-stream override: `?idle_timeout=<s>` or an `X-Idle-Timeout` header
+        (set by a client or proxy that knows its own timeout), clamped to 0-3600.
+        """
+        raw = query.get("idle_timeout") or headers.get("x-idle-timeout")
+        try:
+            idle_timeout = max(0.0, min(float(raw), 3600.0)) if raw else SSE_IDLE_TIMEOUT
+        except ValueError:
+            idle_timeout = SSE_IDLE_TIMEOUT
+        return cls(idle_timeout)
+
+    def timeout(self) -> Optional[float]:
+        return None if self.ceiling is None else self.interval
+
+    def idle(self) -> bytes:
+        SSE_KEEPALIVES.inc()
+        if self.ceiling is not None:
+            self.interval = min(self.interval * 2, self.ceiling)
+        return KEEPALIVE_FRAME
+
+    def activity(self) -> None:
+        self.interval = self.minimum
+
+
+SessionHook = Callable[[Session], Union[None, Awaitable[None]]]
+
+
+class SessionManager:
+    """
+    Session registry. Lookups of live sessions are plain dict reads with no lock,
+    so publishing to an existing session never waits on anything; creation and
+    deletion take one of SSE_SESSION_SHARDS locks chosen by session id, so only
+    operations on the same shard serialize (and only while hooks run).
+
+    Lifecycle hooks (`on_create`, `on_close`) receive the Session and may be
+    sync or async; a failing hook is logged and does not stop the others.
+    """
+    def __init__(self, shards: int = SESSION_SHARDS) -> None:
+        self._sessions: Dict[str, Session] = {}
+        self._locks = [asyncio.Lock() for _ in range(max(1, shards))]
+        self._on_create: List[SessionHook] = []
+        self._on_close: List[SessionHook] = []
+
+    def on_create(self, hook: SessionHook) -> SessionHook:
+        self._on_create.append(hook)
+        return hook
+
+    def on_close(self, hook: SessionHook) -> SessionHook:
+        self._on_close.append(hook)
+        return hook
+
+    def _lock_for(self, session_id: str) -> asyncio.Lock:
+        return self._locks[hash(session_id) % len(self._locks)]
+
+    async def _run_hooks(self, hooks: List[SessionHook], session: Session, phase: str) -> None:
+        for hook in hooks:
+            try:
+                result = hook(session)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception:
+                log.exception("session hook failed", phase=phase, session_id=session.session_id,
+                              hook=getattr(hook, "__name__", repr(hook)))
+
+    def get(self, session_id: str) -> Optional[Session]:
+        """Lock-free lookup of a live session."""
+        s = self._sessions.get(session_id)
+        return s if s is not None and not s.closed else None
+
+    async def get_or_create(self, session_id: str) -> Session:
+        s = self._sessions.get(session_id)
+        if s is not None and not s.closed:
+            return s
+        async with self._lock_for(session_id):
+            # re-check: another task may have created it while we waited
+            s = self._sessions.get(session_id)
+            if s is not None and not s.closed:
+                return s
+            if s is None:
+                SSE_SESSIONS.inc()
+            s = Session(session_id)
+            self._sessions[session_id] = s
+            await self._run_hooks(self._on_create, s, "create")
+            return s
+
+    async def publish(self, session_id: str, msg: Union[str, bytes]) -> None:
+        s = self._sessions.get(session_id)
+        if s is None or s.closed:
+            s = await self.get_or_create(session_id)
+        await s.publish(msg)
+
+    async def delete(self, session_id: str) -> bool:
+        async with self._lock_for(session_id):
+            s = self._sessions.pop(session_id, None)
+            if s is None:
+                return False
+            SSE_SESSIONS.dec()
+            s.close()
+            await self._run_hooks(self._on_close, s, "close")
+        return True
+
+    async def exists(self, session_id: str) -> bool:
+        return session_id in self._sessions
+
+    def __len__(self) -> int:
+        return len(self._sessions)
@@ -0,0 +1,269 @@
+from __future__ import annotations
+import atexit
+import contextvars
+import json
+import os
+import queue
+import secrets
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Mapping, MutableMapping, Optional
+
+# Lightweight OpenTelemetry-style tracing.
+#
+# Context travels as a W3C `traceparent` ("00-<trace id>-<span id>-<flags>"):
+# in the MCP HTTP headers, and inside actor call payloads (Dapr actor proxies
+# don't carry custom headers). Finished spans go to an exporter:
+#
+#   TRACE_EXPORTER=memory   keep the last TRACE_MEMORY_SPANS spans (GET /debug/traces)
+#   TRACE_EXPORTER=file     also append OTLP/JSON lines to TRACE_FILE (default traces.jsonl)
+#   TRACE_EXPORTER=none     tracing context still propagates, nothing is recorded
+
+TRACEPARENT = "traceparent"
+
+_KINDS = {"internal": 1, "server": 2, "client": 3, "producer": 4, "consumer": 5}
+
+_current: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+
+def _new_trace_id() -> str:
+    return secrets.token_hex(16)
+
+
+def _new_span_id() -> str:
+    return secrets.token_hex(8)
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[tuple[str, str]]:
+    """Return (trace_id, parent_span_id) from a traceparent header, or None if invalid."""
+    if not value:
+        return None
+    parts = value.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    if parts[1] == "0" * 32 or parts[2] == "0" * 16:
+        return None
+    return parts[1], parts[2]
+
+
+class Span:
+    __slots__ = ("name", "kind", "trace_id", "span_id", "parent_id", "attributes",
+                 "start_ns", "end_ns", "status", "service", "_token")
+
+    def __init__(self, name: str, kind: str, trace_id: str, parent_id: Optional[str],
+                 service: str, attributes: Dict[str, Any]) -> None:
+        self.name = name
+        self.kind = kind
+        self.trace_id = trace_id
+        self.span_id = _new_span_id()
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.service = service
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.status = "unset"
+        self._token: Optional[contextvars.Token] = None
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    @property
+    def duration_ms(self) -> Optional[float]:
+        return None if self.end_ns is None else (self.end_ns - self.start_ns) / 1e6
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def record_error(self, exc: BaseException) -> None:
+        self.status = "error"
+        self.attributes["exception.type"] = type(exc).__name__
+        self.attributes["exception.message"] = str(exc)[:512]
+
+    def __enter__(self) -> "Span":
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc is not None:
+            self.record_error(exc)
+        elif self.status == "unset":
+            self.status = "ok"
+        self.end_ns = time.time_ns()
+        if self._token is not None:
+            try:
+                _current.reset(self._token)
+            except ValueError:
+                # exited from another context (e.g. a generator finalised elsewhere)
+                _current.set(None)
+        TRACER.export(self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "kind": self.kind,
+            "service": self.service,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_id,
+            "start_unix_nano": self.start_ns,
+            "duration_ms": self.duration_ms,
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+    def to_otlp(self) -> Dict[str, Any]:
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id or "",
+            "name": self.name,
+            "kind": _KINDS.get(self.kind, 1),
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or self.start_ns),
+            "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in self.attributes.items()],
+            "status": {"code": 2 if self.status == "error" else 1 if self.status == "ok" else 0},
+        }
+
+
+def _otlp_value(v: Any) -> Dict[str, Any]:
+    if isinstance(v, bool):
+        return {"boolValue": v}
+    if isinstance(v, int):
+        return {"intValue": str(v)}
+    if isinstance(v, float):
+        return {"doubleValue": v}
+    return {"stringValue": str(v)}
+
+
+class InMemoryExporter:
+    def __init__(self, maxlen: int) -> None:
+        self.spans: Deque[Span] = deque(maxlen=maxlen)
+
+    def export(self, span: Span) -> None:
+        self.spans.append(span)
+
+    def recent(self, trace_id: Optional[str] = None, limit: int = 200) -> List[Dict[str, Any]]:
+        spans = [s for s in list(self.spans) if trace_id is None or s.trace_id == trace_id]
+        return [s.to_dict() for s in spans[-limit:]]
+
+
+class OtlpFileExporter:
+    """Appends one OTLP/JSON `resourceSpans` document per line from a background thread."""
+    def __init__(self, path: str, service: str) -> None:
+        self.path = path
+        self.service = service
+        self._q: "queue.Queue[Optional[Span]]" = queue.Queue(maxsize=10000)
+        self._thread = threading.Thread(target=self._run, name="otlp-file-exporter", daemon=True)
+        self._thread.start()
+        atexit.register(self.shutdown)
+
+    def export(self, span: Span) -> None:
+        try:
+            self._q.put_nowait(span)
+        except queue.Full:
+            pass
+
+    def _run(self) -> None:
+        while True:
+            span = self._q.get()
+            if span is None:
+                return
+            batch = [span]
+            while len(batch) < 512:
+                try:
+                    nxt = self._q.get(timeout=0.5)
+                except queue.Empty:
+                    break
+                if nxt is None:
+                    self._write(batch)
+                    return
+                batch.append(nxt)
+            self._write(batch)
+
+    def _write(self, batch: List[Span]) -> None:
+        doc = {
+            "resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service}}]},
+                "scopeSpans": [{"scope": {"name": "mcp_server_reference_app"},
+                                "spans": [s.to_otlp() for s in batch]}],
+            }]
+        }
+        try:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(doc) + "\n")
+        except OSError:
+            pass
+
+    def shutdown(self) -> None:
+        try:
+            self._q.put_nowait(None)
+        except queue.Full:
+            return
+        self._thread.join(timeout=2)
+
+
+class Tracer:
+    def __init__(self) -> None:
+        self.service = os.getenv("SERVICE_NAME", "mcp")
+        self.memory = InMemoryExporter(int(os.getenv("TRACE_MEMORY_SPANS", "2000")))
+        self._file: Optional[OtlpFileExporter] = None
+        self._mode = os.getenv("TRACE_EXPORTER", "memory").lower()
+
+    def configure(self, service: str) -> None:
+        """Name this process in exported spans and start the file exporter if requested."""
+        self.service = os.getenv("SERVICE_NAME", service)
+        if self._mode == "file" and self._file is None:
+            self._file = OtlpFileExporter(os.getenv("TRACE_FILE", "traces.jsonl"), self.service)
+
+    def export(self, span: Span) -> None:
+        if self._mode == "none":
+            return
+        self.memory.export(span)
+        if self._file is not None:
+            self._file.export(span)
+
+    def start_span(self, name: str, kind: str = "internal", parent: Optional[str] = None, **attributes: Any) -> Span:
+        """
+        Create a span to use as a context manager. `parent` is a traceparent string
+        (from a header or payload); without it the current span is the parent,
+        and without either a new trace starts.
+        """
+        parsed = parse_traceparent(parent)
+        if parsed is not None:
+            trace_id, parent_id = parsed
+        else:
+            cur = _current.get()
+            trace_id, parent_id = (cur.trace_id, cur.span_id) if cur else (_new_trace_id(), None)
+        return Span(name, kind, trace_id, parent_id, self.service, attributes)
+
+
+TRACER = Tracer()
+
+start_span = TRACER.start_span
+configure = TRACER.configure
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+def current_traceparent() -> Optional[str]:
+    span = _current.get()
+    return span.traceparent if span else None
+
+
+def inject(carrier: MutableMapping[str, Any]) -> MutableMapping[str, Any]:
+    """Add the current traceparent to a header dict or actor payload."""
+    tp = current_traceparent()
+    if tp:
+        carrier[TRACEPARENT] = tp
+    return carrier
+
+
+def extract(carrier: Optional[Mapping[str, Any]]) -> Optional[str]:
+    if not carrier:
+        return None
+    value = carrier.get(TRACEPARENT)
+    return value if isinstance(value, str) else None
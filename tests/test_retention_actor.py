@@ -0,0 +1,31 @@
+import asyncio
+import json
+
+from benchmarks.fakes import FakeActorRuntime
+from dapr_cosmos_mcp_server.retention_actor import RetentionActor
+
+
+def test_unchanged_reschedule_after_deactivation_keeps_the_reminder():
+    async def run():
+        runtime = FakeActorRuntime()
+        runtime.register(RetentionActor)
+        registered = []
+        register_reminder = runtime.client.register_reminder
+
+        async def counting(actor_type, actor_id, name, data):
+            registered.append(json.loads(data)["dueTime"])
+            await register_reminder(actor_type, actor_id, name, data)
+        runtime.client.register_reminder = counting
+
+        async def schedule(policy):
+            data = json.dumps({"backup_task_id": "t1", "policy": policy}).encode()
+            await runtime.invoke("RetentionActor", "u1", "ScheduleRetention", data)
+
+        await schedule({"keep_last": 3})
+        runtime._actors.clear()  # deactivated: only the state store remembers
+        await schedule({"keep_last": 3})
+        assert len(registered) == 1
+        await schedule({"keep_last": 5})
+        assert len(registered) == 2
+
+    asyncio.run(run())
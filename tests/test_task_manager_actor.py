@@ -0,0 +1,36 @@
+import asyncio
+from types import SimpleNamespace
+
+from benchmarks.fakes import FakeActorRuntime, InMemoryContainer
+from dapr_cosmos_mcp_server import cosmosdb_helper, task_manager_actor
+from dapr_cosmos_mcp_server.backup_actor import BackupActor
+from dapr_cosmos_mcp_server.retention_actor import RetentionActor
+from dapr_cosmos_mcp_server.task_manager_actor import TaskManagerActor
+
+
+def test_rescheduling_rearms_the_same_per_file_actors(monkeypatch):
+    async def run():
+        container = InMemoryContainer()
+        monkeypatch.setattr(cosmosdb_helper, "container", container)
+        await container.create_item({
+            "id": "t1", "user_id": "u1", "task": "Backup files", "backup_mode": "per_file",
+            "servers": ["server 1", "server 2"], "files": ["a.txt", "dir/b.txt"], "backup_frequency_pth": "PT1H",
+        })
+        runtime = FakeActorRuntime(fire_reminders=True)
+        for actor_class in (TaskManagerActor, BackupActor, RetentionActor):
+            runtime.register(actor_class)
+        monkeypatch.setattr(task_manager_actor, "ActorProxy", SimpleNamespace(create=runtime.create_proxy))
+        try:
+            manager = await runtime._activate("TaskManagerActor", "u1")
+            await manager._schedule_backups()
+            first = {key for key in runtime.client.reminders if key[0] == "BackupActor"}
+            await manager._schedule_backups()
+            second = {key for key in runtime.client.reminders if key[0] == "BackupActor"}
+        finally:
+            await runtime.shutdown()
+        # one reminder per (task, server, file), and the second run re-armed the same actors
+        assert len(first) == 4
+        assert second == first
+        assert sum(1 for actor_type, _ in runtime._actors if actor_type == "BackupActor") == 4
+
+    asyncio.run(run())